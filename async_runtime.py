@@ -0,0 +1,175 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import signal
+
+
+class AsyncRuntime:
+    """
+    Runs a MainMonitor on an asyncio event loop instead of threads : the
+    periodic work of the monitors (see their tick methods) is done by
+    timers and the log is read, parsed and aggregated by three tasks linked
+    by bounded queues. When the parsing or the aggregation can't keep up,
+    the queues fill up and the reading waits (back-pressure) instead of
+    piling up lines in memory.
+
+    Everything runs in the thread of the event loop, so the locks of the
+    monitors are never contended. The reader is woken up by the inotify
+    file descriptor (loop.add_reader) or polls every timeout seconds if
+    inotify isn't available.
+
+    stop() (or SIGINT / SIGTERM) ends the reading at once : the lines
+    already in the queues are processed, the timers are cancelled and the
+    reader is closed (which saves the checkpoint), without waiting for any
+    sleep to end.
+
+    The reader can be two full queues ahead of the aggregation : the
+    position of every chunk in its file goes through the queues along with
+    it, and only the position of the chunks aggregated is checkpointed.
+    """
+
+    def __init__(self, log_reader, parse_lines, request_monitor,
+                 periodic_monitors, timeout=0.4, queue_size=8,
+                 parse_in_executor=False):
+        """
+        log_reader : a LogReader or a MultiLogReader (see read_chunks)
+        parse_lines : a function turning (lines, source) into requests
+        request_monitor : the RequestMonitor receiving the requests
+        periodic_monitors : the monitors whose tick method has to be called
+        every update_interval seconds
+        queue_size : the number of chunks each queue can hold
+        parse_in_executor : if True, parse_lines is called in a thread of
+        the default executor (useful when it waits for worker processes)
+        """
+        self._log_reader = log_reader
+        self._parse_lines = parse_lines
+        self._request_monitor = request_monitor
+        self._periodic_monitors = periodic_monitors
+        self._timeout = timeout
+        self._queue_size = queue_size
+        self._parse_in_executor = parse_in_executor
+
+        self._loop = None
+        self._wakeup = None
+        self._stopping = False
+
+    async def run(self, handle_signals=True):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+        if handle_signals:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                self._loop.add_signal_handler(signum, self.stop)
+
+        chunk_queue = asyncio.Queue(self._queue_size)
+        request_queue = asyncio.Queue(self._queue_size)
+
+        timers = [asyncio.ensure_future(self._periodic(monitor))
+                  for monitor in self._periodic_monitors
+                  if monitor.update_interval > 0]
+        pipeline = [asyncio.ensure_future(self._read(chunk_queue)),
+                    asyncio.ensure_future(self._parse(chunk_queue,
+                                                      request_queue)),
+                    asyncio.ensure_future(self._aggregate(request_queue))]
+
+        crashed = True
+        try:
+            # The reader stops when asked to, the two other tasks when they
+            # have processed what was queued before
+            await asyncio.gather(*pipeline)
+            crashed = False
+        finally:
+            for task in timers + pipeline:
+                task.cancel()
+            await asyncio.gather(*(timers + pipeline),
+                                 return_exceptions=True)
+            # Everything read has been processed, unless the runtime
+            # crashed : the last checkpoint saved is kept then
+            self._log_reader.close(save_checkpoint=not crashed)
+
+            if handle_signals:
+                for signum in (signal.SIGINT, signal.SIGTERM):
+                    self._loop.remove_signal_handler(signum)
+
+    def stop(self):
+        """
+        Asks the runtime to stop. Can be called from any thread.
+        """
+        def _stop():
+            self._stopping = True
+            self._wakeup.set()
+
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(_stop)
+
+    async def _periodic(self, monitor):
+        while True:
+            await asyncio.sleep(monitor.update_interval)
+            monitor.tick()
+
+    async def _read(self, chunk_queue):
+        reader = self._log_reader
+        reader.open()
+
+        fd = reader.fileno()
+        if fd is not None:
+            self._loop.add_reader(fd, self._wakeup.set)
+
+        try:
+            # None means that every file has to be read
+            to_read = None
+            while not self._stopping:
+                chunks = reader.read_chunks(to_read)
+                for source, lines in chunks:
+                    await chunk_queue.put((lines, source,
+                                           reader.get_position(source)))
+
+                if chunks:
+                    busy = set(source for source, lines in chunks)
+                    changed = reader.pop_changed()
+                    to_read = busy | changed if changed is not None else None
+                    # Lets the other tasks run even if the queue isn't full
+                    await asyncio.sleep(0)
+                    continue
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(),
+                                           self._timeout)
+                except asyncio.TimeoutError:
+                    # Every file is checked (rotation, polling...)
+                    to_read = None
+                else:
+                    self._wakeup.clear()
+                    to_read = reader.pop_changed()
+        finally:
+            if fd is not None:
+                self._loop.remove_reader(fd)
+            await chunk_queue.put(None)
+
+    async def _parse(self, chunk_queue, request_queue):
+        while True:
+            item = await chunk_queue.get()
+            if item is None:
+                await request_queue.put(None)
+                return
+
+            lines, source, position = item
+            if self._parse_in_executor:
+                # The workers parse while the loop goes on reading
+                requests = await self._loop.run_in_executor(
+                    None, self._parse_lines, lines, source)
+            else:
+                requests = self._parse_lines(lines, source)
+            await request_queue.put((requests, source, position))
+
+    async def _aggregate(self, request_queue):
+        while True:
+            item = await request_queue.get()
+            if item is None:
+                return
+
+            requests, source, position = item
+            self._request_monitor.add_requests(requests)
+            self._log_reader.checkpoint_if_due(source, position)
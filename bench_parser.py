@@ -0,0 +1,82 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A small benchmark measuring how many lines per second the log parser can
+process. The former implementation of ApacheLogParser (two re.split calls on
+uncompiled patterns and a strptime per line) is kept here as a reference.
+"""
+
+import re
+import time
+import random
+import argparse
+from datetime import datetime
+
+from log_parser import ApacheLogParser
+from request_monitor import Request
+
+PATH_LIST = ['/blog/article/12',
+             '/user/show/12',
+             '/comments/create',
+             '/comments/showfor/article/12',
+             '/contents/evenements.php'
+             ]
+
+
+class ReferenceLogParser:
+    LOG_REGEX = (r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}) ([a-zA-Z0-9_\-]+) '
+                 r'([a-zA-Z0-9_\-]+) \[(.+)\] "(.+)" ([0-9\-]+) ([0-9\-]+)')
+    DATETIME_FORMAT = '%d/%b/%Y:%H:%M:%S'
+    REQUEST_FORMAT = r'([A-Z]+) (.+) (HTTP/\d\.\d)'
+
+    def parseline(self, line):
+        first_split = re.split(ReferenceLogParser.LOG_REGEX, line)
+
+        date = datetime.strptime(first_split[4].split()[0],
+                                 ReferenceLogParser.DATETIME_FORMAT)
+        request_split = re.split(ReferenceLogParser.REQUEST_FORMAT,
+                                 first_split[5])
+
+        return Request(request_split[2], date, request_split[1],
+                       first_split[1], int(first_split[6]), request_split[3],
+                       first_split[2], first_split[3],
+                       int(first_split[7]) if first_split[7] != '-' else 0)
+
+
+def generate_lines(count, lines_per_second=1000):
+    lines = list()
+    start = int(time.time())
+    for i in range(count):
+        date = datetime.fromtimestamp(start + i // lines_per_second)
+        lines.append('10.0.{0}.{1} - - [{2} +0000] "GET {3} HTTP/1.1" {4} {5}'
+                     .format(i % 256, i % 100,
+                             date.strftime('%d/%b/%Y:%H:%M:%S'),
+                             random.choice(PATH_LIST),
+                             random.choice((200, 200, 304, 404)),
+                             random.randint(0, 50000)))
+    return lines
+
+
+def bench(parser, lines):
+    parseline = parser.parseline
+    start = time.perf_counter()
+    for line in lines:
+        parseline(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-n', '--lines', type=int,
+                        help='Number of lines to parse')
+
+    args = parser.parse_args()
+
+    lines = generate_lines(args.lines if args.lines is not None else 200000)
+
+    before = bench(ReferenceLogParser(), lines)
+    after = bench(ApacheLogParser(), lines)
+
+    print('before : {0:.0f} lines/s'.format(before))
+    print('after  : {0:.0f} lines/s (x{1:.1f})'.format(after, after / before))
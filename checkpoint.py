@@ -0,0 +1,54 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+
+
+class ReadCheckpoint:
+    """
+    Stores the position reached by a LogReader in a small JSON state file
+    so that the reading can be resumed where it stopped after a restart.
+
+    Along with the offset, we keep the identity of the file (device and
+    inode) and a hash of the last line read : if the file has been replaced
+    or rewritten in the meantime, the checkpoint can't be trusted.
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def load(self):
+        """
+        Returns the saved state as a dict or None if there is no (valid)
+        state file.
+        """
+        try:
+            with open(self._path, 'r') as state_file:
+                state = json.load(state_file)
+        except (IOError, ValueError):
+            return None
+
+        if not isinstance(state, dict) or 'offset' not in state:
+            return None
+
+        return state
+
+    def save(self, offset, file_id, last_line):
+        state = {'offset': offset,
+                 'device': file_id[0],
+                 'inode': file_id[1],
+                 'line_length': len(last_line),
+                 'line_hash': ReadCheckpoint.hash_line(last_line)}
+
+        # We write a temporary file and rename it so that a crash while
+        # saving never leaves a corrupted state file behind
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, self._path)
+
+    @staticmethod
+    def hash_line(line):
+        return hashlib.sha1(line).hexdigest()
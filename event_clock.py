@@ -0,0 +1,69 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+
+class WallClock:
+    """
+    The clock of the monitors in the default (live) mode : the current time
+    is the time of the system.
+    """
+
+    event_time = False
+
+    def observe(self, timestamp):
+        pass
+
+    def now(self):
+        return int(time.time())
+
+
+class Watermark:
+    """
+    An event-time clock : the time is driven by the timestamps of the
+    requests instead of the system time, which is what we want when reading
+    a backlog, replaying old logs or when the server clock is not the same
+    as ours.
+
+    The watermark is the highest timestamp observed minus the allowed
+    lateness : requests older than the watermark are considered late, the
+    windows ending before it can be closed. Since requests aren't exactly
+    logged in order, the allowed lateness gives them some time to arrive.
+
+    Every monitor should have its own watermark : it must only move forward
+    with the requests that monitor has seen.
+    """
+
+    event_time = True
+
+    def __init__(self, allowed_lateness=10):
+        self._allowed_lateness = allowed_lateness
+        self._max_timestamp = None
+
+    def observe(self, timestamp):
+        if self._max_timestamp is None or timestamp > self._max_timestamp:
+            self._max_timestamp = timestamp
+
+    def now(self):
+        """
+        Returns the watermark (None until a request has been observed).
+        """
+        if self._max_timestamp is None:
+            return None
+
+        return self._max_timestamp - self._allowed_lateness
+
+    def _get_max_timestamp(self):
+        return self._max_timestamp
+
+    max_timestamp = property(_get_max_timestamp, None)
+
+    def _get_allowed_lateness(self):
+        return self._allowed_lateness
+
+    allowed_lateness = property(_get_allowed_lateness, None)
+
+
+def make_clock(event_time=False, allowed_lateness=10):
+    return Watermark(allowed_lateness) if event_time else WallClock()
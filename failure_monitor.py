@@ -0,0 +1,200 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Thread, RLock
+
+import observer
+from event_clock import make_clock
+from rolling_window import RollingCounter, RollingHeavyHitters, \
+    DEFAULT_WINDOWS
+
+
+class FailureMonitor(observer.Observable, Thread):
+    """
+    Keeps track of the failing requests (4xx and 5xx) : the routes (URL
+    paths, without the query string) which fail the most, per status code
+    or class, over sliding windows (10 s, 1 min, 5 min and 1 h by default).
+
+    The routes are counted in heavy_hitters.SpaceSaving sketches of
+    capacity routes per status code and per bucket (see
+    rolling_window.RollingHeavyHitters) : a 404 scan hitting millions of
+    distinct URLs doesn't use more memory than a few broken links. The
+    number of failures per status code is counted exactly.
+
+    Every update_interval seconds, the routes of the spike window are
+    compared to the baseline window : a route whose failure rate is
+    spike_factor times its rate over the baseline window (and with at least
+    min_spike_failures failures) is reported as a spike (see spikes). The
+    observers are notified when the set of spiking routes changes.
+
+    Like in the OverloadMonitor, the current time is the system time or,
+    in event-time mode, a watermark.
+    """
+
+    def __init__(self, update_interval=10, capacity=100,
+                 windows=DEFAULT_WINDOWS, spike_window=60,
+                 baseline_window=3600, spike_factor=5, min_spike_failures=10,
+                 event_time=False, allowed_lateness=10):
+        observer.Observable.__init__(self)
+        Thread.__init__(self)
+
+        self._update_interval = update_interval
+        self._spike_window = spike_window
+        self._baseline_window = baseline_window
+        self._spike_factor = spike_factor
+        self._min_spike_failures = min_spike_failures
+
+        # duration -> RollingHeavyHitters of the routes, grouped by code
+        self._route_windows = dict(
+            (duration, RollingHeavyHitters(duration, width, capacity))
+            for duration, width in windows)
+        # duration -> RollingCounter of the status codes
+        self._code_windows = dict((duration, RollingCounter(duration, width))
+                                  for duration, width in windows)
+        self._clock = make_clock(event_time, allowed_lateness)
+
+        self._failure_count = 0
+        # List of (route, failures, rate, baseline rate)
+        self._spikes = list()
+
+        self._keeponrunning = True
+        self._lock = RLock()
+
+    def add_request(self, request):
+        if request.status < 400:
+            return
+
+        self._failure_count += 1
+        with self._lock:
+            self._clock.observe(request.timestamp)
+            self._expire_windows()
+            self._add_failure(request.timestamp, request.status,
+                              request.url.split('?', 1)[0], 1)
+
+    def add_batch(self, batch):
+        """
+        Same as add_request for a whole request_batch.RequestBatch : only
+        the failing requests are looked at.
+        """
+        failing = batch.failing_indexes()
+        if not failing:
+            return
+
+        self._failure_count += len(failing)
+        failures = dict()
+        timestamps = batch.timestamps
+        statuses = batch.statuses
+        urls = batch.urls
+        for i in failing:
+            key = (timestamps[i], statuses[i], urls[i].split('?', 1)[0])
+            failures[key] = failures.get(key, 0) + 1
+
+        with self._lock:
+            self._clock.observe(max(timestamps))
+            self._expire_windows()
+            for (timestamp, status, route), count in failures.items():
+                self._add_failure(timestamp, status, route, count)
+
+    def _add_failure(self, timestamp, status, route, count):
+        for window in self._route_windows.values():
+            window.add(timestamp, status, route, count)
+        for window in self._code_windows.values():
+            window.add(timestamp, status, count)
+
+    def _expire_windows(self):
+        now = self._clock.now()
+        for window in self._route_windows.values():
+            window.expire(now)
+        for window in self._code_windows.values():
+            window.expire(now)
+
+    @staticmethod
+    def _get_codes(status):
+        if status is None:
+            return None
+        if status < 10:
+            return range(status * 100, status * 100 + 100)
+        return (status,)
+
+    def get_top_failures(self, duration, n, status=None):
+        """
+        Returns the n routes which failed the most in the last duration
+        seconds (one of the durations of the windows) as a list of (route,
+        failures). status can be a code, a class (4 for 4xx...) or None for
+        all the failures.
+        """
+        with self._lock:
+            self._expire_windows()
+            return self._route_windows[duration].most_common(
+                n, self._get_codes(status))
+
+    def get_failure_counts(self, duration):
+        """
+        Returns the number of failures of the last duration seconds per
+        status code, as a list of (code, failures) sorted by code.
+        """
+        with self._lock:
+            self._expire_windows()
+            return sorted(self._code_windows[duration].most_common())
+
+    def _detect_spikes(self):
+        short = self._route_windows[self._spike_window].get_counts()
+        baseline = self._route_windows[self._baseline_window].get_counts()
+        # The failures of the spike window are not part of the baseline
+        baseline_duration = self._baseline_window - self._spike_window
+
+        spikes = list()
+        for route, failures in short.most_common():
+            if failures < self._min_spike_failures:
+                break
+            rate = failures / self._spike_window
+            baseline_rate = max(0, baseline[route] - failures) / \
+                baseline_duration
+            if rate >= self._spike_factor * baseline_rate:
+                spikes.append((route, failures, rate, baseline_rate))
+
+        return spikes
+
+    def tick(self):
+        """
+        Periodic work, done every update_interval seconds by run (or by the
+        owner of the monitor when it isn't started as a thread).
+        """
+        with self._lock:
+            self._expire_windows()
+            spikes = self._detect_spikes()
+            changed = [s[0] for s in spikes] != [s[0] for s in self._spikes]
+            self._spikes = spikes
+
+        if changed:
+            self.update()
+
+    def stop_monitoring(self):
+        self._keeponrunning = False
+
+    def run(self):
+        if self._update_interval > 0:
+            while self._keeponrunning:
+                time.sleep(self._update_interval)
+                self.tick()
+
+    def _get_update_interval(self):
+        return self._update_interval
+
+    update_interval = property(_get_update_interval, None)
+
+    def _get_failure_count(self):
+        return self._failure_count
+
+    failure_count = property(_get_failure_count, None)
+
+    def _get_spikes(self):
+        return list(self._spikes)
+
+    spikes = property(_get_spikes, None)
+
+    def _get_window_durations(self):
+        return sorted(self._route_windows)
+
+    window_durations = property(_get_window_durations, None)
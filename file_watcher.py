@@ -0,0 +1,211 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import os.path
+import select
+import struct
+import time
+
+# Linux inotify constants (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# We watch the directory rather than the file itself : this way we are also
+# woken up when the file is moved, deleted or recreated (log rotation)
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        # Raises an AttributeError on systems without inotify
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    return libc
+
+
+_libc = _load_libc()
+
+
+class PollingWatcher:
+    """
+    Fallback watcher : it doesn't know anything about the files and simply
+    sleeps for the given timeout. That's what the LogReader used to do.
+    """
+
+    def __init__(self, filenames, timeout=0.4):
+        self._timeout = timeout
+
+    def add_file(self, filename):
+        pass
+
+    def wait(self, timeout=None):
+        timeout = self._timeout if timeout is None else timeout
+        if timeout > 0:
+            time.sleep(timeout)
+        return True
+
+    def pop_changed(self):
+        """
+        Returns the set of files which have changed since the last call, or
+        None if we don't know (every file has to be checked).
+        """
+        return None
+
+    def fileno(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Blocks until the kernel tells us that one of the watched files has
+    changed (or at most timeout seconds, so that the caller can still
+    perform periodic checks). It uses the Linux inotify API through ctypes,
+    no third party module is needed.
+
+    The parent directories are watched and the events are filtered on the
+    file names, which means that a file which is moved away, recreated or
+    truncated still wakes up the reader. Any number of files can be watched
+    with a single inotify instance.
+    """
+
+    def __init__(self, filenames, timeout=0.4):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self._timeout = timeout
+        # directory -> watch descriptor, (watch descriptor, name) -> file
+        self._watch_descriptors = dict()
+        self._watched = dict()
+        self._changed = set()
+
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        try:
+            for filename in filenames:
+                self.add_file(filename)
+        except OSError:
+            self.close()
+            raise
+
+    def add_file(self, filename):
+        directory = os.path.dirname(os.path.abspath(filename))
+        name = os.fsencode(os.path.basename(filename))
+
+        if directory not in self._watch_descriptors:
+            wd = _libc.inotify_add_watch(self._fd, os.fsencode(directory),
+                                         WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+            self._watch_descriptors[directory] = wd
+
+        self._watched[(self._watch_descriptors[directory], name)] = filename
+
+    def wait(self, timeout=None):
+        """
+        Returns True if a file has (probably) changed, False if the timeout
+        (by default the one given to the constructor) expired first. With a
+        timeout of 0, the pending events are collected without waiting.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = max(0, deadline - time.monotonic())
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return False
+            if self._drain_events():
+                return True
+            if remaining == 0:
+                return False
+
+    def pop_changed(self):
+        """
+        Returns the set of files which have changed since the last call (or
+        None if some events have been lost and every file has to be
+        checked).
+        """
+        changed = self._changed
+        self._changed = set()
+        return changed
+
+    def _drain_events(self):
+        relevant = False
+        while True:
+            try:
+                buf = os.read(self._fd, 16384)
+            except BlockingIOError:
+                return relevant
+
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buf,
+                                                                     offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    # The kernel queue is full, we don't know what changed
+                    self._changed = None
+                    relevant = True
+                    continue
+
+                filename = self._watched.get((wd, name))
+                if filename is not None:
+                    if self._changed is not None:
+                        self._changed.add(filename)
+                    relevant = True
+
+    def fileno(self):
+        return self._fd
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def make_watcher(filenames, timeout=0.4, use_inotify=True):
+    """
+    Returns the best watcher available on this system for the given file
+    (or list of files).
+    """
+    if use_inotify and _libc is not None:
+        try:
+            return InotifyWatcher(filenames, timeout)
+        except OSError:
+            # Too many watches, unsupported filesystem... We can still poll
+            pass
+
+    return PollingWatcher(filenames, timeout)
@@ -0,0 +1,103 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+
+
+class SpaceSaving:
+    """
+    Space-Saving sketch (Metwally et al.) : counts the hits of at most
+    capacity keys, whatever the number of distinct keys in the stream. When
+    a new key comes in and the sketch is full, the key with the smallest
+    count is replaced by the new one, which inherits its count (the
+    overestimation is kept as the error of the key).
+
+    Any key with more than total / capacity hits is guaranteed to be in the
+    sketch and the count of a key is never underestimated by more than its
+    error : the top of the ranking is accurate as long as the capacity is
+    well above the number of keys we want to display.
+
+    The smallest count is found with a heap holding (count, key) entries,
+    the outdated ones being skipped (and the heap rebuilt when there are
+    too many of them).
+    """
+
+    def __init__(self, capacity=1000):
+        self._capacity = capacity
+        self._counts = dict()
+        self._errors = dict()
+        self._heap = list()
+        self._total = 0
+
+    def add(self, key, count=1):
+        counts = self._counts
+        self._total += count
+
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self._capacity:
+            counts[key] = count
+            self._errors[key] = 0
+        else:
+            min_count, min_key = self._pop_min()
+            del counts[min_key]
+            del self._errors[min_key]
+            counts[key] = min_count + count
+            self._errors[key] = min_count
+
+        heapq.heappush(self._heap, (counts[key], key))
+        if len(self._heap) > 4 * self._capacity:
+            self._rebuild_heap()
+
+    def _pop_min(self):
+        counts = self._counts
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if counts.get(key) == count:
+                return count, key
+
+    def _rebuild_heap(self):
+        self._heap = [(count, key) for key, count in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    def most_common(self, n=None):
+        """
+        Returns the n (all the keys if None) keys with the most hits, as a
+        list of (key, count) sorted by decreasing count.
+        """
+        if n is None:
+            return sorted(self._counts.items(), key=lambda item: -item[1])
+
+        return heapq.nlargest(n, self._counts.items(),
+                              key=lambda item: item[1])
+
+    def items(self):
+        """
+        Returns the (key, count) of the sketch, in no particular order.
+        """
+        return self._counts.items()
+
+    def get_error(self, key):
+        """
+        Returns the maximum overestimation of the count of key.
+        """
+        return self._errors.get(key, 0)
+
+    def __getitem__(self, key):
+        return self._counts.get(key, 0)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _get_total(self):
+        return self._total
+
+    total = property(_get_total, None)
+
+    def _get_capacity(self):
+        return self._capacity
+
+    capacity = property(_get_capacity, None)
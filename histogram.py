@@ -0,0 +1,176 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Log-linear histograms, in the spirit of HdrHistogram : the positive integers
+are split into powers of two, each of them being split into the same number
+of linear sub-buckets. The relative error of a value (and thus of a
+percentile) is bounded (about 3 % with 6 bits of sub-buckets), whatever the
+range of the values, and a histogram never holds more than a few hundred
+counters.
+
+The histograms are made of counts only : they can be added to and
+subtracted from each other, which is what the rolling windows need.
+"""
+
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SUB_BUCKET_BITS = 6
+_SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+_SUB_BUCKET_HALF = _SUB_BUCKET_COUNT >> 1
+
+
+def bucket_index(value):
+    """
+    Returns the index of the bucket of a (non negative) integer value.
+    """
+    if value < _SUB_BUCKET_COUNT:
+        return value if value > 0 else 0
+
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return shift * _SUB_BUCKET_HALF + (value >> shift)
+
+
+def bucket_indexes(values):
+    """
+    Same as bucket_index for a numpy array of integers.
+    """
+    values = numpy.maximum(values, 0)
+    # The exponent given by frexp is the bit length (exact below 2^53)
+    bit_lengths = numpy.frexp(values.astype(numpy.float64))[1]
+    shifts = numpy.maximum(bit_lengths - SUB_BUCKET_BITS, 0)
+    return shifts * _SUB_BUCKET_HALF + (values >> shifts)
+
+
+def bucket_value(index):
+    """
+    Returns the value representing a bucket (the middle of its range).
+    """
+    if index < _SUB_BUCKET_COUNT:
+        return index
+
+    shift = index // _SUB_BUCKET_HALF - 1
+    mantissa = index - shift * _SUB_BUCKET_HALF
+    return (mantissa << shift) + ((1 << shift) - 1) / 2
+
+
+class LogHistogram:
+    """
+    Histogram of non negative values. A scale can be given to record
+    floats : the response times are recorded in microseconds with
+    scale=1000000 for instance (the values given and returned are still in
+    seconds).
+    """
+
+    def __init__(self, scale=1):
+        self._scale = scale
+        # bucket index -> count
+        self._counts = dict()
+        self._count = 0
+        self._sum = 0
+
+    def record(self, value, count=1):
+        index = bucket_index(int(value * self._scale))
+        self._counts[index] = self._counts.get(index, 0) + count
+        self._count += count
+        self._sum += value * count
+
+    def record_values(self, values):
+        """
+        Same as record for a whole list (or numpy array) of values
+        (faster).
+        """
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            indexes, counts = numpy.unique(
+                bucket_indexes((values * self._scale).astype(numpy.int64)),
+                return_counts=True)
+            self.record_indexes(dict(zip(indexes.tolist(), counts.tolist())),
+                                values.sum().item())
+            return
+
+        scale = self._scale
+        scaled = values if scale == 1 else [int(value * scale)
+                                            for value in values]
+        self.record_indexes(Counter(map(bucket_index, scaled)), sum(values))
+
+    def record_indexes(self, index_counts, value_sum):
+        """
+        Adds counts computed beforehand with bucket_index (a dict index ->
+        count) along with the sum of the values they stand for.
+        """
+        counts = self._counts
+        for index, count in index_counts.items():
+            counts[index] = counts.get(index, 0) + count
+            self._count += count
+        self._sum += value_sum
+
+    def add(self, other):
+        """
+        Merges another histogram (with the same scale) into this one.
+        """
+        self.record_indexes(other._counts, other._sum)
+
+    def subtract(self, other):
+        """
+        Removes the values of another histogram, which must have been added
+        to this one before.
+        """
+        counts = self._counts
+        for index, count in other._counts.items():
+            remaining = counts[index] - count
+            if remaining > 0:
+                counts[index] = remaining
+            else:
+                del counts[index]
+        self._count -= other._count
+        self._sum -= other._sum
+
+    def percentiles(self, percents):
+        """
+        Returns a dict percent -> value for each of the given percents (50,
+        95, 99...), None for every percent if the histogram is empty.
+        """
+        if self._count == 0:
+            return dict((percent, None) for percent in percents)
+
+        result = dict()
+        targets = sorted(percents)
+        seen = 0
+        position = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            while position < len(targets) and \
+                    seen >= targets[position] / 100 * self._count:
+                result[targets[position]] = bucket_value(index) / self._scale
+                position += 1
+            if position == len(targets):
+                break
+
+        return result
+
+    def percentile(self, percent):
+        return self.percentiles([percent])[percent]
+
+    def _get_count(self):
+        return self._count
+
+    count = property(_get_count, None)
+
+    def _get_sum(self):
+        return self._sum
+
+    sum = property(_get_sum, None)
+
+    def _get_mean(self):
+        return self._sum / self._count if self._count else None
+
+    mean = property(_get_mean, None)
+
+    def _get_scale(self):
+        return self._scale
+
+    scale = property(_get_scale, None)
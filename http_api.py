@@ -0,0 +1,326 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Read-only HTTP interface of the monitor : the sections, statistics, alerts,
+failing routes and history as JSON, and the same figures in the Prometheus
+text format on /metrics.
+
+The responses are never computed on request : every update_interval seconds
+the HttpApi asks the monitors for their figures (the only time it takes
+their locks) and encodes all the responses at once in a Snapshot. The
+handlers only pick the current snapshot, so any number of clients can poll
+the API without slowing the ingestion down.
+"""
+
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlsplit
+
+_JSON_TYPE = 'application/json'
+_PROMETHEUS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Number of sections and failing routes of every window in the snapshot
+_TOP_N = 10
+# Duration and resolution of the history served on /history
+_HISTORY_DURATION = 3600
+_HISTORY_RESOLUTION = 60
+
+
+class Snapshot:
+    """
+    The encoded responses of the API at a given time, never modified once
+    built : a dict path -> (content type, body).
+    """
+
+    def __init__(self, responses, timestamp):
+        self._responses = responses
+        self._timestamp = timestamp
+
+    def get_response(self, path):
+        return self._responses.get(path)
+
+    def _get_paths(self):
+        return sorted(self._responses)
+
+    paths = property(_get_paths, None)
+
+    def _get_timestamp(self):
+        return self._timestamp
+
+    timestamp = property(_get_timestamp, None)
+
+
+class HttpApi(Thread):
+    """
+    Serves the figures of a MainMonitor over HTTP (one thread per client,
+    see http.server.ThreadingHTTPServer) and rebuilds the snapshot every
+    update_interval seconds. Port 0 picks a free port (see
+    server_address).
+    """
+
+    def __init__(self, main_monitor, port, host='127.0.0.1',
+                 update_interval=1):
+        Thread.__init__(self)
+
+        self._main_monitor = main_monitor
+        self._update_interval = update_interval
+        self._snapshot = None
+        self.tick()
+
+        self._server = ThreadingHTTPServer((host, port), _RequestHandler)
+        # The handlers get the snapshot through their server
+        self._server.api = self
+        self._server_thread = None
+        self._keeponrunning = True
+
+    def build_snapshot(self):
+        """
+        Returns a Snapshot of the current figures of the monitors.
+        """
+        main_monitor = self._main_monitor
+        now = int(time.time())
+        sections = HttpApi._get_sections(main_monitor.section_monitor)
+        stats = HttpApi._get_stats(main_monitor.stats_monitor)
+        alerts = HttpApi._get_alerts(main_monitor.overload_monitor,
+                                     main_monitor.alert_log)
+        failures = HttpApi._get_failures(main_monitor.failure_monitor)
+
+        documents = {'/sections': sections, '/stats': stats,
+                     '/alerts': alerts, '/failures': failures}
+        rollup_store = main_monitor.rollup_store
+        if rollup_store is not None:
+            documents['/history'] = HttpApi._get_history(
+                rollup_store, main_monitor.stats_monitor.current_time)
+
+        responses = dict((path, (_JSON_TYPE, HttpApi._encode(
+            dict(document, timestamp=now))))
+            for path, document in documents.items())
+        responses['/'] = (_JSON_TYPE, HttpApi._encode(
+            {'endpoints': sorted(responses) + ['/metrics']}))
+        responses['/metrics'] = (_PROMETHEUS_TYPE, format_metrics(
+            sections, stats, alerts, failures).encode('utf-8'))
+
+        return Snapshot(responses, now)
+
+    @staticmethod
+    def _encode(document):
+        return json.dumps(document, sort_keys=True).encode('utf-8')
+
+    @staticmethod
+    def _get_sections(section_monitor):
+        windows = list()
+        for duration in section_monitor.window_durations:
+            windows.append({
+                'duration': duration,
+                'visitors': section_monitor.get_window_visitors(duration),
+                'sections': [{'section': section, 'hits': hits,
+                              'visitors': visitors}
+                             for section, hits, visitors in
+                             section_monitor.get_window_top_n(duration,
+                                                              _TOP_N, True)]
+            })
+
+        return {'windows': windows,
+                'last_ranking': [{'section': section, 'hits': hits}
+                                 for section, hits in
+                                 section_monitor.get_last_top_n(_TOP_N)]}
+
+    @staticmethod
+    def _get_stats(stats_monitor):
+        return {'request_count': stats_monitor.request_count,
+                'successful_request_count':
+                    stats_monitor.successful_req_count,
+                'failed_request_count': stats_monitor.failed_req_count,
+                'success_ratio': stats_monitor.success_ratio,
+                'requests_per_minute': stats_monitor.av_req_per_minute,
+                'bytes_sent': stats_monitor.bytes_sent,
+                'since': stats_monitor.starting_datetime.isoformat(),
+                'windows': [stats_monitor.get_window_stats(duration)
+                            for duration in stats_monitor.window_durations]}
+
+    @staticmethod
+    def _get_alerts(overload_monitor, alert_log):
+        return {'overloaded': overload_monitor.overloaded,
+                'request_count': overload_monitor.request_count,
+                'alerts': [{'timestamp': timestamp, 'overloaded': overloaded,
+                            'request_count': request_count}
+                           for timestamp, overloaded, request_count in
+                           alert_log.alerts]}
+
+    @staticmethod
+    def _get_failures(failure_monitor):
+        windows = list()
+        for duration in failure_monitor.window_durations:
+            windows.append({
+                'duration': duration,
+                'status_counts': dict(
+                    failure_monitor.get_failure_counts(duration)),
+                'routes': [{'route': route, 'failures': failures}
+                           for route, failures in
+                           failure_monitor.get_top_failures(duration,
+                                                            _TOP_N)]
+            })
+
+        return {'failure_count': failure_monitor.failure_count,
+                'windows': windows,
+                'spikes': [{'route': route, 'failures': failures,
+                            'rate': rate, 'baseline_rate': baseline_rate}
+                           for route, failures, rate, baseline_rate in
+                           failure_monitor.spikes]}
+
+    @staticmethod
+    def _get_history(rollup_store, now):
+        # now is the time of the monitors, the time of the log when it is
+        # replayed or read in event-time mode
+        if now is None:
+            now = int(time.time())
+        since = now - _HISTORY_DURATION
+        return {'resolution': _HISTORY_RESOLUTION,
+                'traffic': rollup_store.get_traffic(
+                    since, resolution=_HISTORY_RESOLUTION),
+                'sections': [{'section': section, 'hits': hits}
+                             for section, hits in
+                             rollup_store.get_section_hits(
+                                 since, n=_TOP_N,
+                                 resolution=_HISTORY_RESOLUTION)],
+                'alerts': [{'timestamp': timestamp, 'overloaded': overloaded,
+                            'request_count': request_count}
+                           for timestamp, overloaded, request_count in
+                           rollup_store.get_alerts(since)]}
+
+    def tick(self):
+        """
+        Periodic work, done every update_interval seconds by run : the new
+        snapshot replaces the previous one at once.
+        """
+        self._snapshot = self.build_snapshot()
+
+    def start(self):
+        self._server_thread = Thread(target=self._server.serve_forever)
+        self._server_thread.start()
+        Thread.start(self)
+
+    def stop_monitoring(self):
+        self._keeponrunning = False
+
+    def run(self):
+        while self._keeponrunning:
+            time.sleep(self._update_interval)
+            self.tick()
+
+        self._server.shutdown()
+        self._server_thread.join()
+        self._server.server_close()
+
+    def _get_snapshot(self):
+        return self._snapshot
+
+    snapshot = property(_get_snapshot, None)
+
+    def _get_update_interval(self):
+        return self._update_interval
+
+    update_interval = property(_get_update_interval, None)
+
+    def _get_server_address(self):
+        return self._server.server_address
+
+    server_address = property(_get_server_address, None)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        response = self.server.api.snapshot.get_response(
+            urlsplit(self.path).path.rstrip('/') or '/')
+        if response is None:
+            response = (_JSON_TYPE, HttpApi._encode({'error': 'not found'}))
+            self.send_response(404)
+        else:
+            self.send_response(200)
+
+        content_type, body = response
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # The console belongs to the MonitorGui
+        pass
+
+
+def format_metrics(sections, stats, alerts, failures):
+    """
+    Returns the figures of a snapshot (the documents of /sections, /stats,
+    /alerts and /failures) in the Prometheus text exposition format.
+    """
+    lines = list()
+
+    def add_metric(name, metric_type, description, samples):
+        lines.append('# HELP log_monitor_{0} {1}'.format(name, description))
+        lines.append('# TYPE log_monitor_{0} {1}'.format(name, metric_type))
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ','.join('{0}="{1}"'.format(key, _escape(label))
+                                  for key, label in labels)
+            lines.append('log_monitor_{0}{1} {2}'.format(
+                name, '{' + label_text + '}' if label_text else '', value))
+
+    add_metric('requests_total', 'counter', 'Requests processed.',
+               [((('result', 'success'),), stats['successful_request_count']),
+                ((('result', 'failure'),), stats['failed_request_count'])])
+    add_metric('bytes_sent_total', 'counter', 'Bytes sent.',
+               [((), stats['bytes_sent'])])
+    add_metric('overloaded', 'gauge', '1 if the overload alert is on.',
+               [((), int(alerts['overloaded']))])
+    add_metric('alerts_total', 'counter', 'Overload alerts started.',
+               [((), sum(1 for alert in alerts['alerts']
+                         if alert['overloaded']))])
+
+    windows = stats['windows']
+    add_metric('window_request_rate', 'gauge',
+               'Requests per second over the window.',
+               [((('window', w['duration']),), w['request_rate'])
+                for w in windows])
+    add_metric('window_bandwidth_bytes', 'gauge',
+               'Bytes sent per second over the window.',
+               [((('window', w['duration']),), w['bandwidth'])
+                for w in windows])
+    add_metric('window_response_size_bytes', 'gauge',
+               'Percentiles of the response sizes over the window.',
+               [((('window', w['duration']), ('quantile', percent / 100)),
+                 value) for w in windows
+                for percent, value in sorted(w['size_percentiles'].items())])
+    add_metric('window_response_time_seconds', 'gauge',
+               'Percentiles of the response times over the window.',
+               [((('window', w['duration']), ('quantile', percent / 100)),
+                 value) for w in windows
+                for percent, value in
+                sorted(w['response_time_percentiles'].items())])
+
+    add_metric('window_section_hits', 'gauge',
+               'Hits of the most visited sections over the window.',
+               [((('window', w['duration']), ('section', s['section'])),
+                 s['hits']) for w in sections['windows']
+                for s in w['sections']])
+    add_metric('window_visitors', 'gauge',
+               'Estimated unique visitors over the window.',
+               [((('window', w['duration']),), w['visitors'])
+                for w in sections['windows']])
+
+    add_metric('window_failures', 'gauge',
+               'Failing requests per status code over the window.',
+               [((('window', w['duration']), ('status', status)), count)
+                for w in failures['windows']
+                for status, count in sorted(w['status_counts'].items())])
+
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(label):
+    return str(label).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
@@ -0,0 +1,152 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HyperLogLog cardinality estimation (Flajolet et al.) : the number of
+distinct values (clients) seen in a stream is estimated with 2^precision
+one byte registers, about 1 KB with the default precision (the standard
+error is then 1.04 / sqrt(1024), about 3 %), however many values come in.
+
+The registers of two sketches can be merged (register by register maximum)
+: the sketch of a window is the merge of the sketches of its buckets.
+"""
+
+import hashlib
+import math
+
+DEFAULT_PRECISION = 10
+
+
+def hash_value(value):
+    """
+    Returns a 64 bits hash of a string, stable from one process to another
+    (unlike hash()).
+    """
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8', 'replace'),
+                                          digest_size=8).digest(), 'big')
+
+
+def get_register(value_hash, precision=DEFAULT_PRECISION):
+    """
+    Returns the (index, rank) of the register a hash goes to.
+    """
+    index = value_hash >> (64 - precision)
+    rest = value_hash & ((1 << (64 - precision)) - 1)
+    # Position of the first 1 bit in the remaining bits
+    return index, 64 - precision - rest.bit_length() + 1
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch. The registers are kept in a dict (index -> rank)
+    as long as a few of them are used, which is the case of most sections,
+    and in a bytearray of 2^precision bytes beyond that.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self._precision = precision
+        self._size = 1 << precision
+        self._sparse = dict()
+        self._dense = None
+
+    def add(self, value):
+        self.add_hash(hash_value(value))
+
+    def add_hash(self, value_hash):
+        """
+        Adds a value given by its 64 bits hash (see hash_value).
+        """
+        index, rank = get_register(value_hash, self._precision)
+
+        if self._dense is not None:
+            if rank > self._dense[index]:
+                self._dense[index] = rank
+            return
+
+        if rank > self._sparse.get(index, 0):
+            self._sparse[index] = rank
+            if len(self._sparse) > self._size >> 3:
+                self._to_dense()
+
+    def _to_dense(self):
+        self._dense = bytearray(self._size)
+        for index, rank in self._sparse.items():
+            self._dense[index] = rank
+        self._sparse = None
+
+    def merge(self, other):
+        """
+        Merges the registers of another sketch (with the same precision)
+        into this one.
+        """
+        if other._dense is not None:
+            if self._dense is None:
+                self._to_dense()
+            self._dense = bytearray(map(max, self._dense, other._dense))
+            return
+
+        self.add_registers(other._sparse)
+
+    def add_registers(self, registers):
+        """
+        Adds the values whose registers (see get_register) are given as a
+        dict index -> rank, like the ones of a batch of clients.
+        """
+        dense = self._dense
+        for index, rank in registers.items():
+            if dense is not None:
+                if rank > dense[index]:
+                    dense[index] = rank
+            elif rank > self._sparse.get(index, 0):
+                self._sparse[index] = rank
+
+        if dense is None and len(self._sparse) > self._size >> 3:
+            self._to_dense()
+
+    def copy(self):
+        sketch = HyperLogLog(self._precision)
+        if self._dense is not None:
+            sketch._sparse = None
+            sketch._dense = bytearray(self._dense)
+        else:
+            sketch._sparse = dict(self._sparse)
+        return sketch
+
+    def count(self):
+        """
+        Returns the estimated number of distinct values.
+        """
+        size = self._size
+        if self._dense is not None:
+            registers = self._dense
+            zeros = registers.count(0)
+            inverse_sum = sum(map(_INVERSE_POWERS.__getitem__, registers))
+        else:
+            registers = self._sparse.values()
+            zeros = size - len(self._sparse)
+            inverse_sum = zeros + sum(map(_INVERSE_POWERS.__getitem__,
+                                          registers))
+
+        estimate = _alpha(size) * size * size / inverse_sum
+        if estimate <= 2.5 * size and zeros > 0:
+            # Small cardinalities : linear counting is more accurate
+            estimate = size * math.log(size / zeros)
+
+        return int(round(estimate))
+
+    def _get_precision(self):
+        return self._precision
+
+    precision = property(_get_precision, None)
+
+
+def _alpha(size):
+    if size == 16:
+        return 0.673
+    if size == 32:
+        return 0.697
+    if size == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / size)
+
+
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
@@ -0,0 +1,270 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Parsers compiled from a log format description : an Apache LogFormat
+string, an nginx log_format string or a JSON lines schema. Use make_parser
+to get the right parser for a format.
+"""
+
+import re
+import json
+from datetime import datetime
+from operator import itemgetter
+
+from log_parser import ApacheLogParser, _decode
+
+# The fields of a record, in the order expected by the constructor of Request
+RECORD_FIELDS = ('url', 'date', 'method', 'remote_addr', 'status',
+                 'protocol', 'client_identity', 'remote_username',
+                 'bytes_sent', 'referer', 'user_agent', 'response_time')
+
+# Some well known formats
+LOG_FORMATS = {
+    'common': '%h %l %u %t "%r" %>s %b',
+    'combined': '%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-Agent}i"',
+    'nginx': '$remote_addr - $remote_user [$time_local] "$request" $status '
+             '$body_bytes_sent "$http_referer" "$http_user_agent"',
+}
+
+_REQUEST_PATTERN = r'(?P<method>[A-Z]+) (?P<url>.+?) (?P<protocol>HTTP/\d\.\d)'
+_BYTES_PATTERN = r'(?P<bytes_sent>[0-9\-]+)'
+# The content of a quoted field : the servers escape the quotes (and the
+# backslashes) of the values as \" (and \\)
+_QUOTED_PATTERN = r'(?:[^"\\]|\\.)*'
+
+# Apache directive -> pattern (named groups are the fields we keep)
+APACHE_DIRECTIVES = {
+    '%h': r'(?P<remote_addr>\S+)',
+    '%a': r'(?P<remote_addr>\S+)',
+    '%l': r'(?P<client_identity>\S+)',
+    '%u': r'(?P<remote_username>\S+)',
+    '%t': r'\[(?P<date>[^\]]+)\]',
+    '%r': _REQUEST_PATTERN,
+    '%s': r'(?P<status>\d{3})',
+    '%>s': r'(?P<status>\d{3})',
+    '%b': _BYTES_PATTERN,
+    '%B': _BYTES_PATTERN,
+    '%O': _BYTES_PATTERN,
+    '%D': r'(?P<response_time_us>\d+)',
+    '%T': r'(?P<response_time>\d+)',
+    '%{Referer}i': '(?P<referer>' + _QUOTED_PATTERN + ')',
+    '%{User-Agent}i': '(?P<user_agent>' + _QUOTED_PATTERN + ')',
+}
+
+# nginx variable -> pattern
+NGINX_VARIABLES = {
+    '$remote_addr': r'(?P<remote_addr>\S+)',
+    '$remote_user': r'(?P<remote_username>\S+)',
+    '$time_local': r'(?P<date>[^\]]+)',
+    '$request': _REQUEST_PATTERN,
+    '$status': r'(?P<status>\d{3})',
+    '$body_bytes_sent': _BYTES_PATTERN,
+    '$bytes_sent': _BYTES_PATTERN,
+    '$http_referer': '(?P<referer>' + _QUOTED_PATTERN + ')',
+    '$http_user_agent': '(?P<user_agent>' + _QUOTED_PATTERN + ')',
+    '$request_time': r'(?P<response_time>[0-9.]+)',
+}
+
+_TOKEN_REGEX = re.compile(r'%\{[^}]*\}[a-zA-Z]|%>?[a-zA-Z]|\$[a-zA-Z0-9_]+')
+
+
+def compile_log_format(log_format):
+    """
+    Turns an Apache LogFormat or nginx log_format string into a compiled
+    regex, meant to match whole lines (see LogFormatParser). Directives or
+    variables we don't know are matched but not kept. Raises a ValueError
+    if the format has no date (%t or $time_local) : the monitors can't
+    place a request without it.
+    """
+    directives = NGINX_VARIABLES if '$' in log_format else APACHE_DIRECTIVES
+
+    pattern = ''
+    seen = set()
+    position = 0
+    for token in _TOKEN_REGEX.finditer(log_format):
+        pattern += re.escape(log_format[position:token.start()])
+        position = token.end()
+
+        in_quotes = token.start() > 0 and log_format[token.start() - 1] == '"'
+        field_pattern = directives.get(token.group())
+        if field_pattern is None or field_pattern in seen:
+            # A field we don't need (or already have)
+            field_pattern = _QUOTED_PATTERN if in_quotes else r'\S+'
+        seen.add(field_pattern)
+        pattern += field_pattern
+    # Trailing spaces (or the \r of a CRLF log) are not part of the format
+    pattern += re.escape(log_format[position:]) + r'\s*'
+
+    regex = re.compile(pattern)
+    if 'date' not in regex.groupindex:
+        raise ValueError('The log format has no date (%t or $time_local) : '
+                         + log_format)
+
+    return regex
+
+
+class LogFormatParser(ApacheLogParser):
+    """
+    Parser built from a log format string (see compile_log_format). The
+    regex is compiled once and the position of every field in the match is
+    computed beforehand, so parsing a line is a single match followed by a
+    tuple lookup. The regex must match the whole line : a line with more
+    (or fewer) fields than the format is invalid.
+    """
+
+    def __init__(self, log_format):
+        ApacheLogParser.__init__(self)
+        self._regex = compile_log_format(log_format)
+        self._bytes_regex = re.compile(self._regex.pattern.encode())
+
+        # Position of each field of the record in match.groups(), the
+        # missing fields point to an extra None value
+        group_index = self._regex.groupindex
+        missing = self._regex.groups
+        self._time_divisor = 1
+        if 'response_time_us' in group_index:
+            self._time_divisor = 1000000
+            group_index = dict(group_index,
+                               response_time=group_index['response_time_us'])
+        self._get_fields = itemgetter(*[group_index.get(f, missing + 1) - 1
+                                        for f in RECORD_FIELDS])
+
+    def parse_record(self, line):
+        match = self._regex.fullmatch(line)
+        if match is None:
+            raise ValueError("Invalid log line : " + line)
+
+        return self._make_record(match.groups())
+
+    def parse_buffer(self, buf):
+        match = self._bytes_regex.fullmatch(buf)
+        if match is None:
+            raise ValueError("Invalid log line : " + _decode(buf))
+
+        return self._make_record(match.groups(), _decode)
+
+    def _make_record(self, groups, decode=None):
+        (url, date, method, remote_addr, status, protocol, client_identity,
+         remote_username, bytes_sent, referer, user_agent,
+         response_time) = self._get_fields(groups + (None,))
+
+        if decode is not None:
+            (url, method, remote_addr, protocol, client_identity,
+             remote_username, referer, user_agent) = \
+                [decode(v) for v in (url, method, remote_addr, protocol,
+                                     client_identity, remote_username,
+                                     referer, user_agent)]
+
+        if response_time is not None:
+            response_time = float(response_time) / self._time_divisor
+
+        # Fields missing from the format are logged as '-'
+        return (url or '-', self._get_timestamp(date),
+                method or '-', remote_addr or '-',
+                int(status) if status else 0,
+                protocol or '-', client_identity or '-',
+                remote_username or '-',
+                int(bytes_sent) if bytes_sent and bytes_sent not in ('-', b'-')
+                else 0,
+                referer, user_agent, response_time)
+
+
+class JsonLogParser(ApacheLogParser):
+    """
+    Parser for logs written as one JSON object per line. The schema maps
+    the fields of a Request to the keys of the JSON objects. The request
+    line can be given as a whole ("request") or as method/url/protocol.
+
+    The date can be in the Apache format, in ISO 8601 or an epoch
+    timestamp.
+    """
+
+    DEFAULT_SCHEMA = {'remote_addr': 'remote_addr',
+                      'remote_username': 'remote_user',
+                      'date': 'time_local',
+                      'request': 'request',
+                      'status': 'status',
+                      'bytes_sent': 'body_bytes_sent',
+                      'referer': 'http_referer',
+                      'user_agent': 'http_user_agent',
+                      'response_time': 'request_time'}
+
+    REQUEST_REGEX = re.compile(_REQUEST_PATTERN)
+
+    def __init__(self, schema=None):
+        ApacheLogParser.__init__(self)
+        self._schema = dict(JsonLogParser.DEFAULT_SCHEMA)
+        if schema is not None:
+            self._schema.update(schema)
+
+    def parse_record(self, line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            raise ValueError("Invalid log line : " + _decode(line))
+        # Valid JSON but not a request (a list, a number...)
+        if not isinstance(entry, dict):
+            raise ValueError("Invalid log line : " + _decode(line))
+
+        schema = self._schema
+        get = entry.get
+        date = get(schema['date'])
+        if date is None:
+            raise ValueError("No date in the log line : " + _decode(line))
+
+        method = get(schema.get('method'), '-')
+        url = get(schema.get('url'), '-')
+        protocol = get(schema.get('protocol'), '-')
+        request = get(schema['request'])
+        if request is not None:
+            match = JsonLogParser.REQUEST_REGEX.match(request)
+            if match is not None:
+                method, url, protocol = match.groups()
+
+        bytes_sent = get(schema['bytes_sent'])
+        response_time = get(schema['response_time'])
+
+        return (url, self._get_timestamp(date), method,
+                get(schema['remote_addr'], '-'),
+                int(get(schema['status'], 0)),
+                protocol, get(schema.get('client_identity'), '-'),
+                get(schema['remote_username'], '-'),
+                int(bytes_sent) if bytes_sent not in (None, '-', '') else 0,
+                get(schema['referer']), get(schema['user_agent']),
+                float(response_time) if response_time not in (None, '-', '')
+                else None)
+
+    def parse_buffer(self, buf):
+        # json.loads decodes the bytes itself
+        return self.parse_record(bytes(buf))
+
+    def _get_timestamp(self, value):
+        if isinstance(value, (int, float)):
+            return int(value)
+
+        return ApacheLogParser._get_timestamp(self, value)
+
+    @staticmethod
+    def parse_date(date_string):
+        if date_string[2:3] == '/':
+            return ApacheLogParser.parse_date(date_string)
+
+        date = datetime.fromisoformat(date_string.replace('Z', '+00:00'))
+        if date.tzinfo is not None:
+            date = date.astimezone().replace(tzinfo=None)
+        return date
+
+
+def make_parser(log_format):
+    """
+    Returns a parser for the given format : the name of a known format
+    (common, combined, nginx or json), "json:" followed by a JSON schema,
+    or an Apache/nginx format string.
+    """
+    if log_format == 'json':
+        return JsonLogParser()
+
+    if log_format.startswith('json:'):
+        return JsonLogParser(json.loads(log_format[5:]))
+
+    return LogFormatParser(LOG_FORMATS.get(log_format, log_format))
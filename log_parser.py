@@ -2,8 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import re
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
+from request_batch import RequestBatch
 from request_monitor import Request
 
 
@@ -11,35 +12,148 @@ class ApacheLogParser:
     """
     Transforms a line of a standard Apache HTTP access log into a
     request_monitor.Request object (an object describing an HTTP Request).
+
+    The whole line (request line included) is matched in a single pass by a
+    precompiled regex. Since thousands of lines share the same second on a
+    busy server, the decoded timestamps are cached.
     """
 
-    LOG_REGEX = '(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}) ([a-zA-Z0-9_\-]+) \
-([a-zA-Z0-9_\-]+) \[(.+)\] "(.+)" ([0-9\-]+) ([0-9\-]+)'
+    LOG_REGEX = re.compile(r'(\S+) (\S+) (\S+) \[([^\]]+)\] '
+                           r'"([A-Z]+) (.+?) (HTTP/\d\.\d)" '
+                           r'([0-9\-]+) ([0-9\-]+)')
+    LOG_REGEX_BYTES = re.compile(LOG_REGEX.pattern.encode())
     DATETIME_FORMAT = '%d/%b/%Y:%H:%M:%S'
-    REQUEST_FORMAT = '([A-Z]+) (.+) (HTTP/\d\.\d)'
+    MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+              'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+    DATE_CACHE_SIZE = 4096
+
+    def __init__(self):
+        self._date_cache = dict()
 
     def parseline(self, line):
-        first_split = re.split(ApacheLogParser.LOG_REGEX, line)
-
-        remote_addr = first_split[1]
-        client_identity = first_split[2]
-        remote_username = first_split[3]
-        date_string = first_split[4].split()[0]
-        request_string = first_split[5]
-        status = int(first_split[6])
-        bytes_sent = int(first_split[7]) if first_split[7] != '-' else 0
-
-        # Date parsing
-        date = datetime.strptime(date_string,
-                                 ApacheLogParser.DATETIME_FORMAT)
-
-        # HTTP message parsing
-        request_split = re.split(ApacheLogParser.REQUEST_FORMAT,
-                                 request_string)
-
-        method = request_split[1]
-        url = request_split[2]
-        protocol = request_split[3]
-
-        return Request(url, date, method, remote_addr, status, protocol,
-                       client_identity, remote_username, bytes_sent)
+        return Request(*self.parse_record(line))
+
+    def parse_batch(self, lines, source=None):
+        """
+        Parses a list of lines and returns a request_batch.RequestBatch,
+        whose columns are filled straight from the records. The requests
+        are tagged with the source if it is given. The lines which can't be
+        parsed are skipped (see parse_records).
+        """
+        records, invalid_count = parse_records(self.parse_record, lines)
+        return make_batch(records, source, invalid_count)
+
+    def parse_record(self, line):
+        """
+        Returns the fields of the request as a tuple (in the order expected
+        by the constructor of Request). It's cheaper to send than a Request
+        object when the parsing is done in another process.
+        """
+        match = ApacheLogParser.LOG_REGEX.match(line)
+        if match is None:
+            raise ValueError("Invalid log line : " + line)
+
+        (remote_addr, client_identity, remote_username, date_string,
+         method, url, protocol, status, bytes_sent) = match.groups()
+
+        return (url, self._get_timestamp(date_string), method, remote_addr,
+                int(status), protocol, client_identity, remote_username,
+                int(bytes_sent) if bytes_sent != '-' else 0)
+
+    def parse_buffer(self, buf):
+        """
+        Same as parse_record for a line given as a bytes-like object (like a
+        memoryview of a memory mapped file) : the regex is matched on the
+        raw bytes and only the fields are decoded.
+        """
+        match = ApacheLogParser.LOG_REGEX_BYTES.match(buf)
+        if match is None:
+            raise ValueError("Invalid log line : " + _decode(buf))
+
+        (remote_addr, client_identity, remote_username, date_string,
+         method, url, protocol, status, bytes_sent) = match.groups()
+
+        return (_decode(url), self._get_timestamp(date_string),
+                _decode(method), _decode(remote_addr), int(status),
+                _decode(protocol), _decode(client_identity),
+                _decode(remote_username),
+                int(bytes_sent) if bytes_sent != b'-' else 0)
+
+    def _get_timestamp(self, date_string):
+        """
+        Returns the epoch timestamp of the date (decoded only once per
+        distinct date string).
+        """
+        timestamp = self._date_cache.get(date_string)
+        if timestamp is None:
+            timestamp = int(self.parse_date(_decode(date_string)).timestamp())
+            if len(self._date_cache) >= ApacheLogParser.DATE_CACHE_SIZE:
+                self._date_cache.clear()
+            self._date_cache[date_string] = timestamp
+
+        return timestamp
+
+    @staticmethod
+    def parse_date(date_string):
+        """
+        Decodes a date like 10/Oct/2000:13:55:36 -0700 (a fixed width
+        format, so no need for strptime) and returns it as a naive datetime
+        in the local timezone, like datetime.now().
+        """
+        try:
+            date = datetime(int(date_string[7:11]),
+                            ApacheLogParser.MONTHS[date_string[3:6]],
+                            int(date_string[0:2]), int(date_string[12:14]),
+                            int(date_string[15:17]), int(date_string[18:20]))
+        except (KeyError, ValueError):
+            # Not the format we expected, let's be less strict
+            date = datetime.strptime(date_string.split()[0],
+                                     ApacheLogParser.DATETIME_FORMAT)
+
+        offset = date_string[21:26]
+        if len(offset) == 5 and offset[0] in '+-':
+            delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+            tz = timezone(delta if offset[0] == '+' else -delta)
+            date = date.replace(tzinfo=tz).astimezone().replace(tzinfo=None)
+
+        return date
+
+
+def parse_records(parse, lines):
+    """
+    Parses the lines with parse (the parse_record or parse_buffer method of
+    a parser) and returns (records, number of invalid lines). A line which
+    can't be parsed (a truncated line, the "-" request line of a 408...)
+    is skipped instead of stopping the whole batch. Empty lines are ignored.
+    """
+    records = list()
+    append = records.append
+    invalid_count = 0
+    for line in lines:
+        if not line:
+            continue
+        try:
+            append(parse(line))
+        except ValueError:
+            invalid_count += 1
+
+    return records, invalid_count
+
+
+def make_batch(records, source=None, invalid_count=0):
+    """
+    Returns the request_batch.RequestBatch of a list of records (see
+    ApacheLogParser.parse_record).
+    """
+    if source is None:
+        requests = [Request(*record) for record in records]
+    else:
+        requests = [Request(*record, source=source) for record in records]
+    return RequestBatch(requests, records, invalid_count)
+
+
+def _decode(value):
+    if value is None or isinstance(value, str):
+        return value
+
+    return str(value, 'utf-8', 'replace')
@@ -2,10 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import glob
 import os.path
 import os
 import time
 
+from checkpoint import ReadCheckpoint
+from file_watcher import make_watcher
+
 
 class LogReader:
     """
@@ -22,29 +26,534 @@ class LogReader:
     on apache's logs but not if the file is edited by hand with Vim and
     then saved. But anyway, we want to deal with log files...
 
+    Instead of sleeping blindly between two reads, the reader waits for the
+    kernel to notify it that the file has changed (inotify). If inotify
+    isn't available (or use_inotify is False), it falls back to polling the
+    file every timeout seconds. With inotify, the timeout is only an upper
+    bound for a wait.
+
+    Log rotation is handled too : whenever the reader reaches EOF, it checks
+    whether the path now points to a new file (different inode, the log has
+    been moved away by logrotate) or whether the file has shrunk (it has been
+    truncated in place, logrotate's copytruncate). In the first case, the end
+    of the old file is read before the new file is opened from its
+    beginning, in the second case the reader starts again from the beginning
+    of the file.
+
+    If a checkpoint file is given, the position of the reader is saved in it
+    every checkpoint_interval seconds (and when the reader is closed). When
+    the reader is started again, it resumes from the saved position instead
+    of jumping to EOF and catches up with the lines written in the meantime
+    at full speed before tailing the file again.
+
+    The position saved is the one of the last lines processed, which may be
+    behind the position of the file when the lines are queued before being
+    processed (see async_runtime.AsyncRuntime) : get_position is called when
+    the lines are read and the position is given back to checkpoint_if_due
+    once they have been processed.
+
     """
 
-    def __init__(self, filename, line_processor, timeout=0.4):
+    def __init__(self, filename, line_processor, timeout=0.4,
+                 use_inotify=True, batched=False, chunk_size=262144,
+                 checkpoint_file=None, checkpoint_interval=5, source=None):
+        """
+        batched : if True, all the complete lines read in a chunk are passed
+        at once to the add_requests method of the line_processor instead of
+        calling add_request line by line. If a source is given, it is passed
+        along with the lines : add_requests(lines, source).
+        chunk_size : the maximum number of bytes read from the file at once.
+        checkpoint_file : path to the state file storing the position of
+        the reader (None to always start at EOF)
+        """
         self._filename = filename
         self._line_processor = line_processor
         self._timeout = timeout
+        self._use_inotify = use_inotify
+        self._batched = batched
+        self._chunk_size = chunk_size
+        self._source = source
 
-    def watch_log(self):
+        self._log_file = None
+        self._file_id = None
+        self._watcher = None
+        self._owns_watcher = False
+        self._splitter = LineSplitter()
+
+        self._checkpoint = ReadCheckpoint(checkpoint_file) if \
+            checkpoint_file is not None else None
+        self._checkpoint_interval = checkpoint_interval
+        self._last_checkpoint = time.monotonic()
+        # Position (see get_position) of the last lines processed
+        self._processed = None
+
+    def open(self, watcher=None, from_start=False):
+        """
+        Opens the file. A watcher shared with other readers can be given (it
+        must already watch our file), otherwise the reader creates its own.
+        Without a checkpoint, the reading starts at EOF, or at the beginning
+        of the file if from_start is True.
+        """
+        # The watcher is created before we seek to EOF so that no write
+        # can happen unnoticed in between
+        self._owns_watcher = watcher is None
+        self._watcher = watcher if watcher is not None else \
+            make_watcher(self._filename, self._timeout, self._use_inotify)
+
+        self._open_file()
+        self._log_file.seek(self._get_start_offset(from_start))
+        self._processed = self.get_position()
+
+    def _open_file(self):
+        # The file is read in binary mode, without any buffering : we do our
+        # own buffering with big chunks.
+        self._log_file = open(self._filename, 'rb', buffering=0)
+        stat = os.fstat(self._log_file.fileno())
+        self._file_id = (stat.st_dev, stat.st_ino)
+        self._splitter = LineSplitter()
+
+    def _get_start_offset(self, from_start=False):
+        """
+        Returns the offset of the saved checkpoint if it can be trusted, EOF
+        otherwise.
+        """
+        size = os.fstat(self._log_file.fileno()).st_size
+
+        state = self._checkpoint.load() if self._checkpoint else None
+        if state is None:
+            return 0 if from_start else size
+
+        if (state.get('device'), state.get('inode')) != self._file_id:
+            # The file has been rotated while we were not running : all that
+            # is in the new file has been written after our checkpoint
+            return 0
+
+        offset = state['offset']
+        length = state.get('line_length', 0)
+        if offset > size or length > offset:
+            # The file has been truncated
+            return size
+
+        if length > 0:
+            self._log_file.seek(offset - length)
+            last_line = self._log_file.read(length)
+            if ReadCheckpoint.hash_line(last_line) != state.get('line_hash'):
+                # Not the same content anymore
+                return size
+
+        return offset
+
+    def get_position(self, source=None):
+        """
+        Returns the position reached by the reader : (offset, file id, last
+        line). Same interface as MultiLogReader.get_position (the source is
+        ignored).
+        """
+        # The partial line we are keeping hasn't been processed yet
+        return (self._log_file.tell() - self._splitter.pending_data,
+                self._file_id, self._splitter.last_line)
+
+    def save_checkpoint(self):
+        """
+        Saves the position of the last lines processed.
+        """
+        if self._checkpoint is None or self._processed is None:
+            return
+
+        self._checkpoint.save(*self._processed)
+        self._last_checkpoint = time.monotonic()
+
+    def read_chunks(self, filenames=None):
+        """
+        Reads a chunk of the file and returns [(source, lines)], or an empty
+        list if there was nothing new. Same interface as
+        MultiLogReader.read_chunks (the filenames are ignored).
+        """
+        lines = self.read_lines()
+        return [(self._source, lines)] if lines else list()
+
+    def pop_changed(self):
+        """
+        Collects the pending events of the watcher without waiting. Returns
+        None : there is a single file, which has to be read anyway.
+        """
+        self._watcher.wait(0)
+        self._watcher.pop_changed()
+        return None
+
+    def fileno(self):
+        """
+        Returns the file descriptor of the watcher, readable when the file
+        has changed, or None if the file is polled.
+        """
+        return self._watcher.fileno()
+
+    def checkpoint_if_due(self, source=None, position=None):
+        """
+        Tells the reader that the lines read up to position (see
+        get_position, the current position if None) have been processed
+        and saves it if the last checkpoint is old enough. Same interface as
+        MultiLogReader.checkpoint_if_due (the source is ignored).
+        """
+        if self._checkpoint is None:
+            return
 
+        self._processed = position if position is not None else \
+            self.get_position()
+        if time.monotonic() - self._last_checkpoint >= \
+                self._checkpoint_interval:
+            self.save_checkpoint()
+
+    def close(self, save_checkpoint=True):
+        """
+        Closes the file, after saving the position of the last lines
+        processed unless save_checkpoint is False (the processing crashed,
+        the checkpoint saved before is kept).
+        """
+        if self._log_file is not None:
+            if save_checkpoint:
+                self.save_checkpoint()
+            self._log_file.close()
+            self._log_file = None
+        if self._watcher is not None:
+            if self._owns_watcher:
+                self._watcher.close()
+            self._watcher = None
+
+    def read_lines(self):
+        """
+        Reads at most chunk_size bytes from the file and returns the
+        complete lines found in it (the end of a line which is still being
+        written is kept for the next call).
+        """
+        data = self._log_file.read(self._chunk_size)
+        if not data:
+            return self._check_rotation()
+
+        return self._splitter.feed(data)
+
+    def _check_rotation(self):
+        """
+        Called when we have reached EOF. Returns the lines read from the end
+        of the old file if the log has been rotated.
+        """
+        try:
+            stat = os.stat(self._filename)
+        except FileNotFoundError:
+            # The log has been moved away and the new one doesn't exist yet,
+            # we keep on reading the old one in the meantime
+            return []
+
+        if (stat.st_dev, stat.st_ino) != self._file_id:
+            # The file has been rotated : we read what has been written in
+            # the old file since our last read and we switch to the new one
+            lines = list()
+            data = self._log_file.read(self._chunk_size)
+            while data:
+                lines.extend(self._splitter.feed(data))
+                data = self._log_file.read(self._chunk_size)
+            # Nobody will ever finish the last line of the old file
+            lines.extend(self._splitter.flush())
+
+            self._log_file.close()
+            self._open_file()
+        elif stat.st_size < self._log_file.tell():
+            # The file has been truncated (copytruncate)
+            lines = list()
+            self._log_file.seek(0)
+            self._splitter = LineSplitter()
+        else:
+            return []
+
+        # The notifications about what has been written in the new file may
+        # already have been consumed, so we don't wait for the next one.
+        data = self._log_file.read(self._chunk_size)
+        if data:
+            lines.extend(self._splitter.feed(data))
+
+        return lines
+
+    def dispatch(self, lines):
+        if self._batched:
+            if self._source is not None:
+                self._line_processor.add_requests(lines, self._source)
+            else:
+                self._line_processor.add_requests(lines)
+        else:
+            add_request = self._line_processor.add_request
+            for line in lines:
+                add_request(line)
+
+    def watch_log(self):
         # Let's open the file and start reading it when a
         # new line is saved in it.
-        with open(self._filename, 'r') as log_file:
-            # Go to EOF
-            log_file.seek(os.stat(self._filename)[6])
+        self.open()
+        try:
             while True:
-                cursor_pos = log_file.tell()
-                newline = log_file.readline()
+                lines = self.read_lines()
 
-                if not newline:
-                    time.sleep(self._timeout)
-                    log_file.seek(cursor_pos)
+                if lines:
+                    self.dispatch(lines)
+                    self.checkpoint_if_due()
                 else:
-                    self._line_processor.add_request(newline)
+                    self._watcher.wait()
+        finally:
+            self.close()
+
+    def _get_filename(self):
+        return self._filename
+
+    filename = property(_get_filename, None)
+
+
+class MultiLogReader:
+    """
+    Tails several log files (one per vhost for instance) in a single loop,
+    with a single inotify instance. The files can be given as paths or glob
+    patterns (the patterns are expanded again every rescan_interval seconds
+    to pick up new files, which are then read from their beginning).
+
+    Every file is read by a LogReader (so rotation and checkpoints work the
+    same way) and the lines are passed with their source, the path of the
+    file : line_processor.add_requests(lines, source). When a checkpoint
+    file is given, each log gets its own state file, named after it.
+    """
+
+    def __init__(self, patterns, line_processor, timeout=0.4,
+                 use_inotify=True, chunk_size=262144, checkpoint_file=None,
+                 checkpoint_interval=5, rescan_interval=10):
+        self._patterns = patterns
+        self._line_processor = line_processor
+        self._timeout = timeout
+        self._use_inotify = use_inotify
+        self._chunk_size = chunk_size
+        self._checkpoint_file = checkpoint_file
+        self._checkpoint_interval = checkpoint_interval
+        self._rescan_interval = rescan_interval
+
+        self._readers = dict()
+        self._watcher = None
+        self._last_rescan = time.monotonic()
+
+    def _expand(self):
+        filenames = set()
+        for pattern in self._patterns:
+            if glob.has_magic(pattern):
+                filenames.update(glob.glob(pattern))
+            else:
+                filenames.add(pattern)
+        return sorted(filenames)
+
+    def _add_reader(self, filename, from_start=False):
+        checkpoint_file = None
+        if self._checkpoint_file is not None:
+            checkpoint_file = '{0}.{1}'.format(
+                self._checkpoint_file,
+                os.path.abspath(filename).strip('/').replace('/', '_'))
+
+        self._watcher.add_file(filename)
+        reader = LogReader(filename, self._line_processor, self._timeout,
+                           batched=True, chunk_size=self._chunk_size,
+                           checkpoint_file=checkpoint_file,
+                           checkpoint_interval=self._checkpoint_interval,
+                           source=filename)
+        reader.open(self._watcher, from_start)
+        self._readers[filename] = reader
+
+    def _rescan(self):
+        self._last_rescan = time.monotonic()
+        for filename in self._expand():
+            if filename not in self._readers and os.path.isfile(filename):
+                # A file created after the start (a new vhost) is read from
+                # its first line
+                self._add_reader(filename, from_start=True)
+
+    def open(self):
+        filenames = self._expand()
+        self._watcher = make_watcher(filenames, self._timeout,
+                                     self._use_inotify)
+        for filename in filenames:
+            self._add_reader(filename)
+
+    def close(self, save_checkpoint=True):
+        for reader in self._readers.values():
+            reader.close(save_checkpoint)
+        self._readers = dict()
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+
+    def read_chunks(self, filenames=None):
+        """
+        Reads a chunk of each of the given files (all the files if None) and
+        returns a list of (filename, lines), one for each file which had
+        data. The glob patterns are expanded again if it is time to.
+        """
+        if time.monotonic() - self._last_rescan >= self._rescan_interval:
+            self._rescan()
+
+        if filenames is None:
+            readers = list(self._readers.values())
+        else:
+            readers = [self._readers[f] for f in filenames
+                       if f in self._readers]
+
+        chunks = list()
+        for reader in readers:
+            lines = reader.read_lines()
+            if lines:
+                chunks.append((reader.filename, lines))
+
+        return chunks
+
+    def read_files(self, filenames=None):
+        """
+        Same as read_chunks, but the lines are dispatched to the
+        line_processor. Returns the set of files which had data.
+        """
+        busy = set()
+        for filename, lines in self.read_chunks(filenames):
+            reader = self._readers[filename]
+            reader.dispatch(lines)
+            reader.checkpoint_if_due()
+            busy.add(filename)
+
+        return busy
+
+    def get_position(self, source):
+        """
+        Returns the position reached in the file source (see
+        LogReader.get_position).
+        """
+        return self._readers[source].get_position()
+
+    def checkpoint_if_due(self, source=None, position=None):
+        """
+        Tells the reader of the file source that the lines read up to
+        position have been processed (see LogReader.checkpoint_if_due), or
+        every reader that all the lines read so far have been if source is
+        None.
+        """
+        if source is None:
+            for reader in self._readers.values():
+                reader.checkpoint_if_due()
+        else:
+            self._readers[source].checkpoint_if_due(position=position)
+
+    def pop_changed(self):
+        """
+        Collects the pending events of the watcher without waiting and
+        returns the set of files which have changed (None if every file has
+        to be read).
+        """
+        self._watcher.wait(0)
+        return self._watcher.pop_changed()
+
+    def fileno(self):
+        """
+        Returns the file descriptor of the watcher, readable when a file
+        has changed, or None if the files are polled.
+        """
+        return self._watcher.fileno()
+
+    def watch_log(self):
+        self.open()
+        try:
+            # None means that every file has to be read
+            to_read = None
+            while True:
+                busy = self.read_files(to_read)
+
+                if busy:
+                    # We keep on reading the busy files, without forgetting
+                    # the ones which have been written in the meantime
+                    changed = self.pop_changed()
+                    to_read = busy | changed if changed is not None else None
+                elif self._watcher.wait():
+                    to_read = self._watcher.pop_changed()
+                else:
+                    # Timeout : we check every file (rotation...)
+                    to_read = None
+        finally:
+            self.close()
+
+    def _get_filenames(self):
+        return sorted(self._readers)
+
+    filenames = property(_get_filenames, None)
+
+
+class LineSplitter:
+    """
+    Cuts raw chunks of bytes into complete lines. The trailing part of a
+    chunk (a line that is still being written) is kept and prepended to the
+    next chunk.
+
+    Every chunk is decoded at once, straight from the buffer, instead of
+    decoding (and copying) the lines one by one.
+    """
+
+    def __init__(self, encoding='utf-8'):
+        self._encoding = encoding
+        self._carry = b''
+        self._last_line = b''
+
+    def feed(self, data):
+        end = data.rfind(b'\n')
+        if end < 0:
+            self._carry += data
+            return []
+
+        if self._carry:
+            end += len(self._carry)
+            data = self._carry + data
+
+        buf = memoryview(data)
+        lines = str(buf[:end], self._encoding, 'replace').split('\n')
+        self._carry = bytes(buf[end + 1:])
+        self._last_line = bytes(buf[data.rfind(b'\n', 0, end) + 1:end + 1])
+
+        return lines
+
+    def flush(self):
+        """
+        Returns the pending partial line (if any) as a complete line.
+        """
+        if not self._carry:
+            return []
+
+        line = self._carry.decode(self._encoding, 'replace')
+        self._last_line = self._carry
+        self._carry = b''
+        return [line]
+
+    def _get_pending_data(self):
+        return len(self._carry)
+
+    pending_data = property(_get_pending_data, None)
+
+    def _get_last_line(self):
+        return self._last_line
+
+    last_line = property(_get_last_line, None)
+
+
+def iter_line_batches(stream, chunk_size=262144):
+    """
+    Reads a whole binary stream (a file which isn't being written anymore)
+    by chunks and yields the lists of lines found in each chunk.
+    """
+    splitter = LineSplitter()
+    data = stream.read(chunk_size)
+    while data:
+        lines = splitter.feed(data)
+        if lines:
+            yield lines
+        data = stream.read(chunk_size)
+
+    lines = splitter.flush()
+    if lines:
+        yield lines
 
 #### TEST CODE ####
 
@@ -0,0 +1,99 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Opens (possibly compressed) log files as binary streams. The files are
+decompressed on the fly, by big chunks : nothing is written on the disk and
+the file is never loaded as a whole in memory.
+
+The compression is detected with the first bytes of the file, not with its
+extension.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    # Only needed to read zstd compressed logs
+    zstandard = None
+
+# (magic number, compression)
+MAGIC_NUMBERS = [(b'\x1f\x8b', 'gzip'),
+                 (b'BZh', 'bz2'),
+                 (b'\xfd7zXZ\x00', 'xz'),
+                 (b'\x28\xb5\x2f\xfd', 'zstd')]
+
+# The usual extensions of the compressed files (the compression itself is
+# detected with the magic numbers, see replay.order_log_files for their use)
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz', '.zst')
+
+DEFAULT_BUFFER_SIZE = 1048576
+
+
+def detect_compression(filename):
+    """
+    Returns the compression of the file (gzip, bz2, xz or zstd) or None if
+    it is a plain file.
+    """
+    with open(filename, 'rb') as log_file:
+        head = log_file.read(6)
+
+    for magic, compression in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return compression
+
+    return None
+
+
+def open_log_stream(filename, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Returns a binary stream of the decompressed content of the file. The
+    compressed data is read buffer_size bytes at a time.
+    """
+    compression = detect_compression(filename)
+
+    if compression is None:
+        return open(filename, 'rb', buffering=0)
+
+    raw_file = open(filename, 'rb', buffering=buffer_size)
+    try:
+        if compression == 'gzip':
+            # Several gzip members (concatenated files) are read in a row
+            stream = gzip.GzipFile(fileobj=raw_file, mode='rb')
+        elif compression == 'bz2':
+            stream = bz2.BZ2File(raw_file, mode='rb')
+        elif compression == 'xz':
+            stream = lzma.LZMAFile(raw_file, mode='rb')
+        else:
+            if zstandard is None:
+                raise IOError("The zstandard module is needed to read " +
+                              filename)
+            # Files made of several frames (like logs compressed in
+            # several passes) are read as a whole
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                raw_file, read_size=buffer_size, read_across_frames=True)
+    except Exception:
+        raw_file.close()
+        raise
+
+    return _ClosingStream(stream, raw_file, buffer_size)
+
+
+class _ClosingStream(io.BufferedReader):
+    """
+    Buffered decompressed stream closing the underlying file with itself
+    (the decompressors don't close a file object they haven't opened).
+    """
+
+    def __init__(self, stream, raw_file, buffer_size):
+        io.BufferedReader.__init__(self, stream, buffer_size)
+        self._raw_file = raw_file
+
+    def close(self):
+        try:
+            io.BufferedReader.close(self)
+        finally:
+            self._raw_file.close()
@@ -2,17 +2,29 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import asyncio
+import glob
 import os
 import sys
+import time
 import signal
 
-from log_reader import LogReader
-from log_parser import ApacheLogParser
+from async_runtime import AsyncRuntime
+from log_reader import LogReader, MultiLogReader
+from log_parser import ApacheLogParser, make_batch, parse_records
+from log_formats import make_parser
+from parallel_parser import ParallelParser
 from request_monitor import RequestMonitor
-from overload_monitor import OverloadMonitor
+from overload_monitor import OverloadMonitor, AlertLog
 from stats_monitor import StatsMonitor
 from section_monitor import SectionMonitor
+from failure_monitor import FailureMonitor
+from source_monitor import SourceMonitor
 from monitor_gui import MonitorGui
+from observer import NotificationDispatcher
+from replay import replay_files, ReplayReport
+from rollup_store import RollupStore, DEFAULT_MAX_SECTIONS
+from http_api import HttpApi
 
 
 class MainMonitor:
@@ -40,58 +52,301 @@ class MainMonitor:
     It takes the path to the log file to monitor as only parameter
     argument. For information about optionnal paramaters, launch the
     program with the -h flag.
+
+    Several log files (a list of paths or glob patterns, one file per vhost
+    for instance) can be monitored at once, with a single reader. The
+    requests are then tagged with their source file : the monitors above
+    see all the traffic and the source_monitor keeps the same statistics,
+    sections and alerts for each file.
+
+    Existing log files can also be analysed offline with the replay method
+    (--replay flag) : they are read as fast as possible, in event-time mode,
+    and a report is printed at the end. The filename can be None in this
+    case and the console interface can be disabled (gui=False).
+
+    The console is redrawn at most every refresh_interval seconds, whatever
+    the traffic (see observer.NotificationDispatcher), or on every change
+    if refresh_interval is 0.
+
+    With a db_file, the traffic, the section hits and the alerts are also
+    persisted in a SQLite database (see rollup_store.RollupStore), which
+    keeps the history beyond what the monitors hold in memory.
+
+    With an http_port, the figures are also served as JSON and Prometheus
+    metrics (see http_api.HttpApi).
     """
 
     def __init__(self, filename, LogParser=ApacheLogParser, alert_threshold=50,
                  log_check_interval=0.4, overload_timeframe=120,
                  overload_responsetime=2, section_dropinterval=10,
-                 stats_update_interval=1):
-        self._log_reader = LogReader(filename, self,
-                                     timeout=log_check_interval)
-        self._log_parser = LogParser()
+                 stats_update_interval=1, use_inotify=True,
+                 checkpoint_file=None, workers=1, log_format=None,
+                 retention_count=None, retention_window=None,
+                 event_time=False, allowed_lateness=10, gui=True,
+                 refresh_interval=0.5, max_sections=None, db_file=None,
+                 http_port=None):
+        # With several workers, bigger chunks are read so that every worker
+        # gets its share of a batch
+        self._chunk_size = 262144 * max(1, workers)
+        self._log_check_interval = log_check_interval
+        filenames = [filename] if isinstance(filename, str) else filename
+        self._log_reader = None
+        self._source_monitor = None
+        if filenames is not None and (len(filenames) > 1 or
+                                      glob.has_magic(filenames[0])):
+            self._log_reader = MultiLogReader(filenames, self,
+                                              timeout=log_check_interval,
+                                              use_inotify=use_inotify,
+                                              chunk_size=self._chunk_size,
+                                              checkpoint_file=checkpoint_file)
+        elif filenames is not None:
+            self._log_reader = LogReader(filenames[0], self,
+                                         timeout=log_check_interval,
+                                         use_inotify=use_inotify,
+                                         batched=True,
+                                         chunk_size=self._chunk_size,
+                                         checkpoint_file=checkpoint_file)
+        # A log format (see log_formats.make_parser) overrides LogParser
+        self._log_parser = make_parser(log_format) if log_format is not None \
+            else LogParser()
+        self._parallel_parser = ParallelParser(self._log_parser, workers) \
+            if workers > 1 else None
         self._overload_monitor = OverloadMonitor(alert_threshold,
                                                  overload_responsetime,
-                                                 overload_timeframe)
-        self._stats_monitor = StatsMonitor(stats_update_interval)
-        self._section_monitor = SectionMonitor(section_dropinterval)
-        self._request_monitor = RequestMonitor(submonitors=
-                                               [self._overload_monitor,
-                                                self._stats_monitor,
-                                                self._section_monitor])
-        self._monitor_gui = MonitorGui(self)
-        self._overload_monitor.add_observer(self._monitor_gui, 'alert')
-        self._stats_monitor.add_observer(self._monitor_gui, 'stat_change')
-        self._section_monitor.add_observer(self._monitor_gui, 'section_change')
+                                                 overload_timeframe,
+                                                 event_time,
+                                                 allowed_lateness)
+        self._stats_monitor = StatsMonitor(stats_update_interval, event_time,
+                                           allowed_lateness)
+        self._section_monitor = SectionMonitor(section_dropinterval,
+                                               max_sections,
+                                               event_time=event_time,
+                                               allowed_lateness=
+                                               allowed_lateness)
+        self._failure_monitor = FailureMonitor(event_time=event_time,
+                                               allowed_lateness=
+                                               allowed_lateness)
+        submonitors = [self._overload_monitor, self._stats_monitor,
+                       self._section_monitor, self._failure_monitor]
+
+        if isinstance(self._log_reader, MultiLogReader):
+            def make_source_monitors():
+                return {'overload': OverloadMonitor(alert_threshold,
+                                                    overload_responsetime,
+                                                    overload_timeframe,
+                                                    event_time,
+                                                    allowed_lateness),
+                        'stats': StatsMonitor(stats_update_interval,
+                                              event_time, allowed_lateness),
+                        'section': SectionMonitor(
+                            section_dropinterval, max_sections,
+                            event_time=event_time,
+                            allowed_lateness=allowed_lateness),
+                        'failure': FailureMonitor(
+                            event_time=event_time,
+                            allowed_lateness=allowed_lateness)}
+
+            self._source_monitor = SourceMonitor(make_source_monitors)
+            submonitors.append(self._source_monitor)
+
+        self._rollup_store = RollupStore(
+            db_file, overload_monitor=self._overload_monitor,
+            max_sections=max_sections or DEFAULT_MAX_SECTIONS) \
+            if db_file is not None else None
+        if self._rollup_store is not None:
+            submonitors.append(self._rollup_store)
+
+        self._request_monitor = RequestMonitor(submonitors=submonitors,
+                                               retention_count=retention_count,
+                                               retention_window=
+                                               retention_window)
+        self._alert_log = AlertLog(self._overload_monitor)
+        self._monitor_gui = MonitorGui(self) if gui else None
+        self._dispatcher = NotificationDispatcher(refresh_interval) \
+            if gui and refresh_interval > 0 else None
+        if gui:
+            self._overload_monitor.add_observer(self._monitor_gui, 'alert',
+                                                self._dispatcher)
+            self._stats_monitor.add_observer(self._monitor_gui, 'stat_change',
+                                             self._dispatcher)
+            self._section_monitor.add_observer(self._monitor_gui,
+                                               'section_change',
+                                               self._dispatcher)
+            self._failure_monitor.add_observer(self._monitor_gui,
+                                               'failure_change',
+                                               self._dispatcher)
+        self._http_api = HttpApi(self, http_port) \
+            if http_port is not None else None
 
     def add_request(self, newline):
-        new_request = self._log_parser.parseline(newline)
+        try:
+            new_request = self._log_parser.parseline(newline)
+        except ValueError:
+            # Not a request we can monitor, the line is only counted
+            self._request_monitor.add_invalid_lines(1)
+            return
 
         # Here the request is passed to the RequestMonitor
         self._request_monitor.add_request(new_request)
 
+    def add_requests(self, lines, source=None):
+        """
+        Parses a whole batch of lines and passes the requests to the
+        RequestMonitor at once.
+        """
+        self._request_monitor.add_requests(self.parse_lines(lines, source))
+
+    def add_batch(self, requests, invalid_count=0):
+        """
+        Passes a list of already parsed requests to the RequestMonitor,
+        along with the number of lines which couldn't be parsed.
+        """
+        self._request_monitor.add_invalid_lines(invalid_count)
+        self._request_monitor.add_requests(requests)
+
+    def parse_lines(self, lines, source=None):
+        """
+        Returns the request_batch.RequestBatch of a batch of lines, the
+        requests being tagged with the source (the log file) if it is given.
+        """
+        if self._parallel_parser is not None:
+            return self._parallel_parser.parse_batch(lines, source)
+
+        return self._log_parser.parse_batch(lines, source)
+
+    def add_mapped_file(self, reader):
+        """
+        Processes a whole file opened with a mmap_reader.MmapLogReader : the
+        lines are parsed straight from the mapped buffer (by the workers,
+        range by range, if there are several of them).
+        """
+        if self._parallel_parser is not None:
+            for new_requests in self._parallel_parser.parse_ranges(
+                    reader.filename, reader.split_ranges()):
+                self._request_monitor.add_requests(new_requests)
+            return
+
+        parse_buffer = self._log_parser.parse_buffer
+        for lines in reader.iter_line_batches():
+            records, invalid_count = parse_records(parse_buffer, lines)
+            self._request_monitor.add_requests(make_batch(
+                records, invalid_count=invalid_count))
+
     def run(self):
         # We start the statistic monitoring (refreshed in a separate
         # thread)
         self._overload_monitor.start()
         self._stats_monitor.start()
         self._section_monitor.start()
+        self._failure_monitor.start()
+        if self._source_monitor is not None:
+            self._source_monitor.start()
+        if self._dispatcher is not None:
+            self._dispatcher.start()
+        if self._rollup_store is not None:
+            self._rollup_store.start()
+        if self._http_api is not None:
+            self._http_api.start()
 
         # And we launch the watch_log in the main thread
         self._log_reader.watch_log()
 
+    def run_async(self):
+        """
+        Same as run, but on an asyncio event loop (see
+        async_runtime.AsyncRuntime) : no monitor thread is started (only
+        the writer of the rollup store and the HTTP server, which must not
+        block the loop) and the method returns as soon as SIGINT or SIGTERM
+        is received.
+        """
+        periodic_monitors = [self._overload_monitor, self._stats_monitor,
+                             self._section_monitor, self._failure_monitor]
+        if self._source_monitor is not None:
+            periodic_monitors.append(self._source_monitor)
+        if self._dispatcher is not None:
+            periodic_monitors.append(self._dispatcher)
+
+        runtime = AsyncRuntime(self._log_reader, self.parse_lines,
+                               self._request_monitor, periodic_monitors,
+                               timeout=self._log_check_interval,
+                               parse_in_executor=
+                               self._parallel_parser is not None)
+        if self._rollup_store is not None:
+            self._rollup_store.start()
+        if self._http_api is not None:
+            self._http_api.start()
+        try:
+            asyncio.run(runtime.run())
+        finally:
+            if self._monitor_gui is not None:
+                self._monitor_gui.stop()
+            if self._parallel_parser is not None:
+                self._parallel_parser.close()
+            self._stop_http_api()
+            self._stop_rollup_store()
+
+    def replay(self, filenames):
+        """
+        Processes the given (complete) log files as fast as possible and
+        returns a replay.ReplayReport. The monitor should have been created
+        in event-time mode, no thread is started but the writer of the
+        rollup store.
+        """
+        start = time.monotonic()
+        if self._rollup_store is not None:
+            self._rollup_store.start()
+        try:
+            replay_files(filenames, self, max(self._chunk_size, 1048576))
+        finally:
+            if self._parallel_parser is not None:
+                self._parallel_parser.close()
+            self._stop_rollup_store()
+
+        return ReplayReport(self._stats_monitor, self._section_monitor,
+                            self._alert_log, time.monotonic() - start,
+                            invalid_count=self._request_monitor.invalid_count)
+
     def shutdown(self):
         # We ask all the threads to stop
         self._overload_monitor.stop_monitoring()
         self._stats_monitor.stop_monitoring()
         self._section_monitor.stop_monitoring()
+        self._failure_monitor.stop_monitoring()
+        if self._source_monitor is not None:
+            self._source_monitor.stop_monitoring()
+        if self._dispatcher is not None:
+            self._dispatcher.stop_monitoring()
 
         # We tell the user we are going to shut down
-        self._monitor_gui.stop()
+        if self._monitor_gui is not None:
+            self._monitor_gui.stop()
 
         # And we wait for them to do so
         self._overload_monitor.join()
         self._stats_monitor.join()
         self._section_monitor.join()
+        self._failure_monitor.join()
+        if self._source_monitor is not None:
+            self._source_monitor.join()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+
+        if self._parallel_parser is not None:
+            self._parallel_parser.close()
+        self._stop_http_api()
+        self._stop_rollup_store()
+
+    def _stop_http_api(self):
+        if self._http_api is not None:
+            self._http_api.stop_monitoring()
+            self._http_api.join()
+
+    def _stop_rollup_store(self):
+        # The writer flushes what is left before stopping
+        if self._rollup_store is not None:
+            self._rollup_store.stop_monitoring()
+            self._rollup_store.join()
+            self._rollup_store.close()
 
     def _get_stats_monitor(self):
         return self._stats_monitor
@@ -108,23 +363,95 @@ class MainMonitor:
 
     section_monitor = property(_get_section_monitor, None)
 
+    def _get_failure_monitor(self):
+        return self._failure_monitor
+
+    failure_monitor = property(_get_failure_monitor, None)
+
     def _get_request_monitor(self):
-        return self._stats_monitor
+        return self._request_monitor
 
     request_monitor = property(_get_request_monitor, None)
 
+    def _get_source_monitor(self):
+        return self._source_monitor
+
+    source_monitor = property(_get_source_monitor, None)
+
+    def _get_alert_log(self):
+        return self._alert_log
+
+    alert_log = property(_get_alert_log, None)
+
+    def _get_rollup_store(self):
+        return self._rollup_store
+
+    rollup_store = property(_get_rollup_store, None)
+
+    def _get_http_api(self):
+        return self._http_api
+
+    http_api = property(_get_http_api, None)
+
 
 if __name__ == '__main__':
     # Let's get the path to the log file as a console argument
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('logfile', type=str,
-                        help='Path to the log file to monitor')
+    parser.add_argument('logfile', type=str, nargs='+',
+                        help='Path to the log file to monitor (several files \
+or glob patterns can be given, one per vhost for instance), or the log files \
+to analyse with --replay')
+    parser.add_argument('--replay', action='store_true',
+                        help='Analyse existing log files (rotated and \
+compressed files included) as fast as possible and print a report')
     parser.add_argument('-t', '--threshold', type=int,
                         help='The minimum number of requests per 2 minutes \
 (or -t minutes if specified) displaying an overload alert.')
     parser.add_argument('-c', '--log-check-interval', type=int,
                         help='Check the log file every -c seconds')
+    parser.add_argument('-p', '--poll', action='store_true',
+                        help='Poll the log file every -c seconds instead of \
+waiting for inotify events')
+    parser.add_argument('-k', '--checkpoint-file', type=str,
+                        help='Save the position in the log file in this file \
+and resume from it at the next start')
+    parser.add_argument('-f', '--log-format', type=str,
+                        help='Format of the log file : common (default), \
+combined, nginx, json, json:{JSON schema} or an Apache LogFormat / nginx \
+log_format string')
+    parser.add_argument('-r', '--retain-count', type=int,
+                        help='Keep the last -r requests in memory (by default \
+the requests are not kept)')
+    parser.add_argument('-R', '--retain-window', type=int,
+                        help='Keep the requests of the last -R seconds in \
+memory')
+    parser.add_argument('-e', '--event-time', action='store_true',
+                        help='Use the dates of the log instead of the system \
+clock to compute the alerts and the statistics')
+    parser.add_argument('-l', '--allowed-lateness', type=int,
+                        help='In event-time mode, number of seconds a request \
+can be logged late without being ignored (default : 10)')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of processes parsing the log lines \
+(default : 1, the lines are parsed in the main process)')
+    parser.add_argument('-a', '--async', dest='use_async',
+                        action='store_true',
+                        help='Run the monitors on an asyncio event loop \
+instead of one thread per monitor')
+    parser.add_argument('-g', '--refresh-interval', type=float,
+                        help='Redraw the console at most every -g seconds \
+(default : 0.5, 0 to redraw it on every change)')
+    parser.add_argument('-m', '--max-sections', type=int,
+                        help='Count the hits of at most -m sections (the \
+most visited ones, approximately) to bound the memory used by the ranking \
+(and the sections persisted per flush with -d)')
+    parser.add_argument('-d', '--db', type=str,
+                        help='Store the traffic history (per second, minute \
+and hour rollups) and the alerts in this SQLite database')
+    parser.add_argument('-P', '--http-port', type=int,
+                        help='Serve the sections, statistics, alerts and \
+history as JSON (and Prometheus metrics on /metrics) on this port')
     parser.add_argument('-i', '--overload-timeframe', type=int,
                         help='The overload timeframe (an alert is thrown if \
 there are more than -t requests per -i seconds')
@@ -140,7 +467,6 @@ seconds. Put 0 here if you don\'t want the ranking to be cleared.')
 
     args = parser.parse_args()
 
-    logfilename = args.logfile
     threshold = args.threshold if args.threshold is not None else 50
     log_check_interval = args.log_check_interval if args.log_check_interval \
         is not None else 0.4
@@ -152,19 +478,57 @@ seconds. Put 0 here if you don\'t want the ranking to be cleared.')
         args.section_drop_interval is not None else 10
     stats_update_interval = args.stats_update_interval if \
         args.stats_update_interval is not None else 1
+    workers = args.workers if args.workers is not None else 1
+    refresh_interval = args.refresh_interval if args.refresh_interval is \
+        not None else 0.5
+    allowed_lateness = args.allowed_lateness if args.allowed_lateness is \
+        not None else 10
 
     # Possible improvement : we could check the validity of all the parameters
-    if not os.path.isfile(logfilename):
-        raise IOError("File " + logfilename + " doesn't seem to exist")
+    for filename in args.logfile:
+        # A glob pattern may not match anything yet
+        if not glob.has_magic(filename) and not os.path.isfile(filename):
+            raise IOError("File " + filename + " doesn't seem to exist")
+
+    if args.replay:
+        main_monitor = MainMonitor(None, alert_threshold=threshold,
+                                   overload_timeframe=overload_timeframe,
+                                   workers=workers,
+                                   log_format=args.log_format,
+                                   retention_count=args.retain_count,
+                                   retention_window=args.retain_window,
+                                   event_time=True,
+                                   allowed_lateness=allowed_lateness,
+                                   gui=False,
+                                   max_sections=args.max_sections,
+                                   db_file=args.db)
+        print(main_monitor.replay(args.logfile).format())
+        sys.exit(0)
 
     # We have parsed all the arguments
 
-    main_monitor = MainMonitor(logfilename, alert_threshold=threshold,
+    main_monitor = MainMonitor(args.logfile, alert_threshold=threshold,
                                log_check_interval=log_check_interval,
                                overload_timeframe=overload_timeframe,
                                overload_responsetime=overload_response_time,
                                section_dropinterval=section_drop_interval,
-                               stats_update_interval=stats_update_interval)
+                               stats_update_interval=stats_update_interval,
+                               use_inotify=not args.poll,
+                               checkpoint_file=args.checkpoint_file,
+                               workers=workers,
+                               log_format=args.log_format,
+                               retention_count=args.retain_count,
+                               retention_window=args.retain_window,
+                               event_time=args.event_time,
+                               allowed_lateness=allowed_lateness,
+                               refresh_interval=refresh_interval,
+                               max_sections=args.max_sections,
+                               db_file=args.db,
+                               http_port=args.http_port)
+
+    if args.use_async:
+        main_monitor.run_async()
+        sys.exit(0)
 
     def _on_close_request(*args):
         main_monitor.shutdown()
@@ -0,0 +1,107 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+
+
+class MmapLogReader:
+    """
+    Reads a (complete, plain text) log file through a memory map. The lines
+    are found directly in the mapped buffer and handed out as memoryview
+    slices : nothing is copied nor decoded, the parser (see
+    ApacheLogParser.parse_buffer) only decodes the fields it needs.
+
+    The file can also be cut into byte ranges aligned on line boundaries so
+    that several processes can work on the same file (see
+    ParallelParser.parse_ranges).
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._file = open(filename, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+
+        # An empty file can't be mapped
+        self._map = None
+        if self._size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            if hasattr(self._map, 'madvise'):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def split_ranges(self, range_size=8388608):
+        """
+        Returns a list of (start, end) byte offsets covering the file, each
+        range being about range_size bytes long and ending right after a
+        newline (or at the end of the file).
+        """
+        ranges = list()
+        start = 0
+        while start < self._size:
+            end = start + range_size
+            if end >= self._size:
+                end = self._size
+            else:
+                newline = self._map.find(b'\n', end - 1)
+                end = newline + 1 if newline >= 0 else self._size
+            ranges.append((start, end))
+            start = end
+
+        return ranges
+
+    def iter_line_batches(self, start=0, end=None, batch_size=10000):
+        """
+        Yields lists of (at most batch_size) memoryviews, one per non empty
+        line between the offsets start and end.
+        """
+        if self._map is None:
+            return
+
+        end = self._size if end is None else end
+        find = self._map.find
+        view = memoryview(self._map)
+
+        batch = list()
+        position = start
+        while position < end:
+            newline = find(b'\n', position, end)
+            if newline < 0:
+                # Last line, without a newline
+                newline = end
+            if newline > position:
+                batch.append(view[position:newline])
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = list()
+            position = newline + 1
+
+        if batch:
+            yield batch
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Some lines are still referenced somewhere, the map will be
+                # closed when they are garbage collected
+                pass
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get_filename(self):
+        return self._filename
+
+    filename = property(_get_filename, None)
+
+    def _get_size(self):
+        return self._size
+
+    size = property(_get_size, None)
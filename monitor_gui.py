@@ -35,6 +35,9 @@ class MonitorGui:
     def on_section_change(self):
         self.reprint()
 
+    def on_failure_change(self):
+        self.reprint()
+
     def stop(self):
         self._shutdown_pending = True
 
@@ -49,6 +52,125 @@ class MonitorGui:
         else:
             print('   No data available yet')
 
+    def print_windows(self, section_monitor, n=10):
+        """
+        Prints the rolling rankings (last 10 s, 1 min...) side by side, with
+        the hits and the unique visitors of each section.
+        """
+        durations = section_monitor.window_durations
+        rankings = [section_monitor.get_window_top_n(d, n, True)
+                    for d in durations]
+        if not any(rankings):
+            print('   No data available yet')
+            return
+
+        print(' | '.join('{0:<17}'.format('last ' +
+                                          MonitorGui.format_duration(d))
+                         for d in durations))
+        print('-' * (20 * len(durations) - 3))
+        for i in range(max(len(ranking) for ranking in rankings)):
+            cells = list()
+            for ranking in rankings:
+                if i < len(ranking):
+                    section, hits, visitors = ranking[i]
+                    cells.append(MonitorGui.format_cell(section, hits,
+                                                        visitors))
+                else:
+                    cells.append(' ' * 17)
+            print(' | '.join(cells))
+
+        print('-' * (20 * len(durations) - 3))
+        print(' | '.join(MonitorGui.format_cell(
+            'visitors', '', section_monitor.get_window_visitors(d))
+            for d in durations))
+        print('(hits/unique visitors)')
+
+    @staticmethod
+    def format_cell(section, hits, visitors):
+        if visitors is not None:
+            hits = '{0}/{1}'.format(hits, visitors).lstrip('/')
+        return '{0:<8.8} {1:>8}'.format(section, hits)
+
+    def print_traffic(self, stats_monitor):
+        """
+        Prints the rates and percentiles of the sliding windows.
+        """
+        print("  window  |  req/s |    KB/s | size p50/p95/p99 (B) | "
+              "time p50/p95/p99 (ms)")
+        print("-" * 79)
+        for duration in stats_monitor.window_durations:
+            stats = stats_monitor.get_window_stats(duration)
+            sizes = stats['size_percentiles']
+            times = stats['response_time_percentiles']
+            print("{0:>9} | {1:>6.1f} | {2:>7.1f} | {3:>20} | {4:>21}".format(
+                MonitorGui.format_duration(duration), stats['request_rate'],
+                stats['bandwidth'] / 1024,
+                '/'.join(MonitorGui.format_value(sizes[p]) for p in
+                         sorted(sizes)),
+                '/'.join(MonitorGui.format_value(times[p], 1000) for p in
+                         sorted(times))))
+        print("")
+
+    def print_failures(self, failure_monitor, duration=60, n=5):
+        """
+        Prints the routes failing the most over the last minute, 4xx and 5xx
+        side by side, and the routes whose failure rate is spiking.
+        """
+        client_errors = failure_monitor.get_top_failures(duration, n, 4)
+        server_errors = failure_monitor.get_top_failures(duration, n, 5)
+        if not client_errors and not server_errors:
+            print("   No failure in the last {0}\n".format(
+                MonitorGui.format_duration(duration)))
+            return
+
+        print("{0:<37} | {1}".format('4xx', '5xx'))
+        print("-" * 79)
+        for i in range(max(len(client_errors), len(server_errors))):
+            print(' | '.join(MonitorGui.format_failure(errors[i])
+                             if i < len(errors) else ' ' * 37
+                             for errors in (client_errors, server_errors)))
+
+        for route, failures, rate, baseline_rate in failure_monitor.spikes:
+            print("SPIKE : {0} failing {1:.1f}/s (usually {2:.2f}/s)".format(
+                route if len(route) <= 40 else route[:37] + '...', rate,
+                baseline_rate))
+        print("")
+
+    @staticmethod
+    def format_failure(failure):
+        route, failures = failure
+        if len(route) > 28:
+            route = route[:25] + '...'
+        return '{0:<28} {1:>8}'.format(route, failures)
+
+    @staticmethod
+    def format_value(value, scale=1):
+        if value is None:
+            return '-'
+        return '{0:.0f}'.format(value * scale)
+
+    @staticmethod
+    def format_duration(seconds):
+        if seconds % 3600 == 0:
+            return '{0} h'.format(seconds // 3600)
+        if seconds % 60 == 0:
+            return '{0} min'.format(seconds // 60)
+        return '{0} s'.format(seconds)
+
+    def print_sources(self, source_monitor):
+        print("--- SOURCES --- \n")
+        print("{0:<30}| requests | req/min | success | alert".format('file'))
+        print("-" * 68)
+        for source in source_monitor.sources:
+            stats = source_monitor.get_monitor(source, 'stats')
+            overload = source_monitor.get_monitor(source, 'overload')
+            name = source if len(source) <= 29 else '...' + source[-26:]
+            print("{0:<30}| {1:>8} | {2:>7.1f} | {3:>6.0f}% | {4}".format(
+                name, stats.request_count, stats.av_req_per_minute,
+                stats.success_ratio * 100,
+                'OVERLOAD' if overload.overloaded else ''))
+        print("")
+
     def reprint(self):
         MonitorGui.clear()
 
@@ -61,10 +183,7 @@ overloaded \n".format(self._last_alert))
                       .format(self._last_alert))
 
         print("--- MOST VISITED SECTIONS ---\n")
-        ranking = self._main_monitor.section_monitor.get_last_top_n(10)
-        if len(ranking) == 0:
-            ranking = self._main_monitor.section_monitor.get_current_top_n(10)
-        self.print_sections(ranking)
+        self.print_windows(self._main_monitor.section_monitor)
 
         print("\n\n--- STATISTICS --- \nTotal number of request : {0} \
 \nAverage number of \
@@ -78,6 +197,16 @@ requests per minute : {1:.1f} \nsince {2} \n".
                      self._main_monitor.stats_monitor.failed_req_count,
                      self._main_monitor.stats_monitor.success_ratio * 100))
 
+        self.print_traffic(self._main_monitor.stats_monitor)
+
+        print("--- FAILING ROUTES (last {0}) --- \n".format(
+            MonitorGui.format_duration(60)))
+        self.print_failures(self._main_monitor.failure_monitor)
+
+        source_monitor = self._main_monitor.source_monitor
+        if source_monitor is not None:
+            self.print_sources(source_monitor)
+
         print("Type CTRL-C to close (under Linux at least...)")
 
         if self._shutdown_pending:
@@ -1,30 +1,96 @@
 #!/user/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
+from threading import Thread, Lock
+
 
 class Observable:
     """
     An abstract implementation of an Observable class. I.E. a class with a list
     of Observers that can be notfied when something is modified in the current
     instance of the class (for this, a call the the update method is needed).
+
+    An observer can be registered with a NotificationDispatcher : it is then
+    only marked as dirty by update() and called later by the dispatcher.
     """
     def __init__(self):
         self._observers = list()
 
     def update(self):
-        for (observer, callback) in self._observers:
-            method = getattr(observer, 'on_'+callback)
-            method()
+        for (observer, callback, dispatcher) in self._observers:
+            if dispatcher is not None:
+                dispatcher.notify(observer, callback)
+            else:
+                method = getattr(observer, 'on_'+callback)
+                method()
 
-    def add_observer(self, observer, callback = 'update'):
-        self._observers.append((observer, callback))
+    def add_observer(self, observer, callback = 'update', dispatcher = None):
+        self._observers.append((observer, callback, dispatcher))
 
     def remove_observer(self, observer):
         index = None
-        for i, (obs, callback) in enumerate(self._observers):
+        for i, (obs, callback, dispatcher) in enumerate(self._observers):
             if observer == obs:
                 index = i
                 break
 
         if index is not None:
             self._observers.pop(index)
+
+
+class NotificationDispatcher(Thread):
+    """
+    Coalesces the notifications of the observables : the observers which
+    have been notified are marked as dirty and their on_* method is called
+    once per flush, however many updates happened in the meantime. The
+    flush is done every interval seconds by the thread, or by the owner of
+    the dispatcher through tick() when the thread isn't started.
+
+    This way the cost of the observers (redrawing the screen...) doesn't
+    depend on the number of requests.
+    """
+
+    def __init__(self, interval=0.5):
+        Thread.__init__(self)
+
+        self._interval = interval
+        # (observer, callback) -> None, a dict keeps the order of the first
+        # notifications
+        self._pending = dict()
+
+        self._keeponrunning = True
+        self._lock = Lock()
+
+    def notify(self, observer, callback):
+        with self._lock:
+            self._pending[(observer, callback)] = None
+
+    def flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = dict()
+
+        # The lock is released : the observers can trigger new notifications
+        for (observer, callback) in pending:
+            method = getattr(observer, 'on_'+callback)
+            method()
+
+    def tick(self):
+        self.flush()
+
+    def stop_monitoring(self):
+        self._keeponrunning = False
+
+    def run(self):
+        while self._keeponrunning:
+            time.sleep(self._interval)
+            self.flush()
+
+        # The last notifications are not lost
+        self.flush()
+
+    def _get_update_interval(self):
+        return self._interval
+
+    update_interval = property(_get_update_interval, None)
@@ -1,31 +1,50 @@
 #!/user/bin/env python
 # -*- coding: utf-8 -*-
 
-import datetime
 import time
 from threading import Thread, RLock
 
 import observer
-from request_monitor import Request
+from event_clock import make_clock
 
 
 class OverloadMonitor(observer.Observable, Thread):
     """
-    Keeps a list of all the requests who occured in the past two minutes
-    (just the datetimes of these actually) and calls its observers in case
-    an overload threshold (in requests / 2 minutes) is reached.
-
-    The list is updated in a background thread.
+    Counts the requests who occured in the past two minutes and calls its
+    observers in case an overload threshold (in requests / 2 minutes) is
+    reached.
+
+    The requests are counted in a ring of one bucket per second : adding a
+    request only increments a bucket and expiring a second only resets one,
+    so the cost doesn't depend on the traffic.
+
+    By default the current time is the system time and the expiry is made in
+    a background thread. In event-time mode, the time is given by a
+    watermark advanced by the timestamps of the requests (see
+    event_clock.Watermark) and the window moves forward as requests are
+    added : the background thread has nothing to do.
     """
 
-    def __init__(self, alert_threshold=50, update_interval=2, timeframe=120):
+    def __init__(self, alert_threshold=50, update_interval=2, timeframe=120,
+                 event_time=False, allowed_lateness=10):
         observer.Observable.__init__(self)
         Thread.__init__(self)
         self._alert_threshold = alert_threshold
         self._update_interval = update_interval
         self._timeframe = timeframe
 
-        self._requests = list()
+        self._clock = make_clock(event_time, allowed_lateness)
+        self._allowed_lateness = allowed_lateness if event_time else 0
+
+        # _seconds[i] is the second (epoch timestamp) counted in _counts[i]
+        # (i = second % ring size). The ring also holds the seconds after
+        # the watermark (requests which arrived early in event-time mode).
+        self._ring_size = timeframe + self._allowed_lateness + 1
+        self._counts = [0] * self._ring_size
+        self._seconds = [None] * self._ring_size
+        # Number of requests in ]watermark - timeframe, watermark]
+        self._request_count = 0
+        self._watermark = self._clock.now()
 
         self._keeponrunning = True
 
@@ -35,69 +54,115 @@ class OverloadMonitor(observer.Observable, Thread):
 
     def add_request(self, request):
         """
-        Inserts a date in the right position in our _last_requests lists.
-        No sorting is ever made so every insertion should be made through
-        this method. Only it guarantees that the order in the list will be
-        maintained. It also checks if the overload alert has to be triggered.
+        Counts the request if it is recent enough and checks if the overload
+        alert has to be triggered.
         """
-        assert isinstance(request, Request)
+        self._add_hits(request.timestamp, 1)
 
-        date = request.date
+        self._check_overload()
+
+    def add_batch(self, batch):
+        """
+        Counts the requests of a whole request_batch.RequestBatch at once.
+        """
+        event_time = self._clock.event_time
+        for timestamp, count in batch.timestamp_counts():
+            self._add_hits(timestamp, count)
+            if event_time:
+                # The alerts start and end at the right second of the log
+                self._check_overload()
 
-        if (datetime.datetime.now() - date) < datetime.\
-                timedelta(seconds=self._timeframe):
-            self._add_new_hit(date)
+        if not event_time:
+            self._check_overload_start()
 
-    def _add_new_hit(self, date):
+    def _add_hits(self, timestamp, count):
         with self._lock:
-            # Let's insert the request (it is porbably the one to insert at
-            # the last position
-            self._requests.append(date)
-
-            # This is a kind of very fast bubble sort on update
-            i = len(self._requests) - 1
-            while i > 0:
-                prev_date = self._requests[i - 1]
-                if prev_date > date:
-                    # Classic swap
-                    self._requests[i - 1] = date
-                    self._requests[i] = prev_date
-                    i -= 1
-                else:
-                    break
-
-        self._check_overload_start()
+            self._clock.observe(timestamp)
+            self._advance(self._clock.now())
+
+            watermark = self._watermark
+            if timestamp <= watermark - self._timeframe:
+                # Too old to be counted
+                return
+            if timestamp > watermark + self._allowed_lateness:
+                # A request from the future (clock skew) is counted as a
+                # request of the current second
+                timestamp = watermark
+
+            i = timestamp % self._ring_size
+            if self._seconds[i] != timestamp:
+                # This bucket contains an expired second, we recycle it
+                self._counts[i] = 0
+                self._seconds[i] = timestamp
+            self._counts[i] += count
+            if timestamp <= watermark:
+                self._request_count += count
+
+    def _advance(self, now):
+        """
+        Moves the window to ]now - timeframe, now] : the seconds getting in
+        the window are added to the count, the ones leaving it are removed
+        and their buckets reset.
+        """
+        previous = self._watermark
+        if previous is None or now <= previous:
+            if previous is None:
+                self._watermark = now
+            return
+
+        timeframe = self._timeframe
+        ring_size = self._ring_size
+        counts = self._counts
+        seconds = self._seconds
+
+        if now - previous >= ring_size:
+            # Every bucket we have is now too old
+            self._counts = [0] * ring_size
+            self._seconds = [None] * ring_size
+            self._request_count = 0
+        else:
+            for second in range(previous + 1, now + 1):
+                i = second % ring_size
+                if seconds[i] == second:
+                    self._request_count += counts[i]
+            for second in range(previous - timeframe + 1,
+                                now - timeframe + 1):
+                i = second % ring_size
+                if seconds[i] == second:
+                    self._request_count -= counts[i]
+                    counts[i] = 0
+                    seconds[i] = None
+
+        self._watermark = now
 
     def _delete_old(self):
         """
-        Private function updating the last request list by removing the
-        entries older than 2 minutes. (It implies that the server time and
-        the system time are the same)
+        Private function moving the window to the current time, which resets
+        the buckets of the seconds older than the timeframe. (It implies
+        that the server time and the system time are the same)
         """
-        delete_to = 0
-        for i, d in enumerate(self._requests):
-            if (datetime.datetime.now() - d) > \
-                    datetime.timedelta(seconds=self._timeframe):
-                with self._lock:
-                    delete_to = i + 1
-            else:
-                break
+        if self._clock.event_time:
+            # The window is moved by the requests themselves
+            return
+
         with self._lock:
-            # Working at a lower level could enable us to optimize the
-            # complexity of this operation using a custom linked list-like data
-            # structure.
-            self._requests = self._requests[delete_to::]
+            self._advance(self._clock.now())
 
-        if delete_to > 0:
+        self._check_overload_end()
+
+    def _check_overload(self):
+        self._check_overload_start()
+        if self._clock.event_time:
+            # The watermark may have moved the window
             self._check_overload_end()
 
     def _check_overload_start(self):
-        if len(self._requests) >= self._alert_threshold:
+        if self._request_count >= self._alert_threshold:
             self._overloaded = True
             self.update()
 
     def _check_overload_end(self):
-        if len(self._requests) < self._alert_threshold and self._overloaded:
+        if self._request_count < self._alert_threshold and self._overloaded:
             self._overloaded = False
             self.update()
 
@@ -108,12 +173,62 @@ class OverloadMonitor(observer.Observable, Thread):
         """
         self._keeponrunning = False
 
+    def tick(self):
+        """
+        Periodic work, done every update_interval seconds by run (or by the
+        owner of the monitor when it isn't started as a thread).
+        """
+        self._delete_old()
+
     def run(self):
         while self._keeponrunning:
             time.sleep(self._update_interval)
-            self._delete_old()
+            self.tick()
+
+    def _get_update_interval(self):
+        return self._update_interval
+
+    update_interval = property(_get_update_interval, None)
 
     def _is_overloaded(self):
         return self._overloaded
 
     overloaded = property(_is_overloaded, None)
+
+    def _get_request_count(self):
+        return self._request_count
+
+    request_count = property(_get_request_count, None)
+
+    def _get_watermark(self):
+        return self._watermark
+
+    watermark = property(_get_watermark, None)
+
+
+class AlertLog:
+    """
+    Observer of an OverloadMonitor keeping the history of the alerts : a
+    list of (timestamp, overloaded, request count) tuples, one for each
+    start or end of an alert. The timestamp is the time of the monitor
+    (i.e. the watermark in event-time mode).
+    """
+
+    def __init__(self, overload_monitor):
+        self._overload_monitor = overload_monitor
+        self._overloaded = False
+        self._alerts = list()
+
+        overload_monitor.add_observer(self, 'alert')
+
+    def on_alert(self):
+        overloaded = self._overload_monitor.overloaded
+        if overloaded != self._overloaded:
+            self._overloaded = overloaded
+            self._alerts.append((self._overload_monitor.watermark, overloaded,
+                                 self._overload_monitor.request_count))
+
+    def _get_alerts(self):
+        return self._alerts
+
+    alerts = property(_get_alerts, None)
@@ -0,0 +1,80 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+
+from log_parser import make_batch, parse_records
+from mmap_reader import MmapLogReader
+
+# The parser used by each worker process (set once by _init_worker)
+_worker_parser = None
+
+
+def _init_worker(log_parser):
+    global _worker_parser
+    _worker_parser = log_parser
+
+
+def _parse_shard(lines):
+    return parse_records(_worker_parser.parse_record, lines)
+
+
+def _parse_range(task):
+    filename, start, end = task
+    with MmapLogReader(filename) as reader:
+        return parse_records(_worker_parser.parse_buffer,
+                             [line for lines in
+                              reader.iter_line_batches(start, end)
+                              for line in lines])
+
+
+class ParallelParser:
+    """
+    Parses batches of raw lines in a pool of worker processes, so that the
+    parsing isn't limited to the single core running the reader.
+
+    Each batch is cut into shards which are parsed by the workers. The
+    workers only send back the fields of the requests (tuples are much
+    cheaper to pickle than objects) and the results are merged back in the
+    order of the lines before the Request objects are built.
+
+    log_parser : an instance of the parser to use (it must be picklable and
+    implement parse_record)
+    """
+
+    def __init__(self, log_parser, workers=2, shard_size=2000):
+        self._shard_size = shard_size
+        self._pool = multiprocessing.Pool(workers, _init_worker,
+                                          (log_parser,))
+
+    def parse_batch(self, lines, source=None):
+        """
+        Same as ApacheLogParser.parse_batch.
+        """
+        shard_size = self._shard_size
+        shards = [lines[i:i + shard_size]
+                  for i in range(0, len(lines), shard_size)]
+
+        # map returns the results in the order of the shards
+        results = self._pool.map(_parse_shard, shards)
+
+        return make_batch([record for records, invalid_count in results
+                           for record in records], source,
+                          sum(invalid_count for records, invalid_count
+                              in results))
+
+    def parse_ranges(self, filename, ranges):
+        """
+        Parses the given byte ranges of a file (see
+        MmapLogReader.split_ranges) : every worker maps the file and parses
+        its own ranges, so the lines are never sent to the workers. Yields
+        the request_batch.RequestBatch of each range, in the order of the
+        ranges.
+        """
+        tasks = [(filename, start, end) for start, end in ranges]
+        for records, invalid_count in self._pool.imap(_parse_range, tasks):
+            yield make_batch(records, invalid_count=invalid_count)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
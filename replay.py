@@ -0,0 +1,170 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Offline processing of existing log files : the files are read as fast as
+possible and the monitors are driven by the dates of the log (event-time
+mode) instead of the system clock. See MainMonitor.replay.
+"""
+
+import heapq
+import os.path
+import re
+from datetime import datetime
+from itertools import groupby
+from operator import attrgetter
+
+from log_reader import iter_line_batches
+from log_streams import open_log_stream, detect_compression, \
+    COMPRESSED_EXTENSIONS
+from mmap_reader import MmapLogReader
+
+_ROTATION_REGEX = re.compile(r'^(.*?)(?:\.(\d+))?(?:{0})?$'.format(
+    '|'.join(re.escape(extension) for extension in COMPRESSED_EXTENSIONS)))
+
+# Number of requests of the batches of a merged replay
+MERGE_BATCH_SIZE = 10000
+
+_TIMESTAMP = attrgetter('timestamp')
+
+
+def _rotation_key(filename):
+    match = _ROTATION_REGEX.match(os.path.basename(filename))
+    index = int(match.group(2)) if match.group(2) is not None else 0
+    return (os.path.join(os.path.dirname(filename), match.group(1)), -index)
+
+
+def order_log_files(filenames):
+    """
+    Sorts the files in chronological order : the rotated files (access_log.2,
+    access_log.1.gz, access_log.1.xz...) come before the current one
+    (access_log).
+    """
+    return sorted(filenames, key=_rotation_key)
+
+
+def group_log_files(filenames):
+    """
+    Splits the files by log (the base name, without the rotation index and
+    compression suffix) : returns a list of lists of files, each one in
+    chronological order.
+    """
+    return [list(files) for base_name, files in
+            groupby(order_log_files(filenames),
+                    key=lambda filename: _rotation_key(filename)[0])]
+
+
+def replay_files(filenames, line_processor, chunk_size=1048576):
+    """
+    Passes all the lines of the files (in chronological order) to the
+    add_requests method of the line_processor. Compressed files are
+    decompressed on the fly (see log_streams). The plain files are memory
+    mapped and given to the add_mapped_file method of the line_processor if
+    it has one.
+
+    The files of several logs (the access logs of several vhosts...) cover
+    the same period : if the line_processor can parse lines on their own
+    (parse_lines and add_batch methods), their requests are merged by
+    timestamp (see replay_merged), otherwise the logs are replayed one
+    after the other.
+    """
+    logs = group_log_files(filenames)
+    if len(logs) > 1 and hasattr(line_processor, 'parse_lines') and \
+            hasattr(line_processor, 'add_batch'):
+        replay_merged(logs, line_processor, chunk_size)
+        return
+
+    for filename in [filename for files in logs for filename in files]:
+        if detect_compression(filename) is None and \
+                hasattr(line_processor, 'add_mapped_file'):
+            with MmapLogReader(filename) as reader:
+                line_processor.add_mapped_file(reader)
+            continue
+
+        with open_log_stream(filename, chunk_size) as log_file:
+            for lines in iter_line_batches(log_file, chunk_size):
+                line_processor.add_requests(lines)
+
+
+def replay_merged(logs, line_processor, chunk_size=1048576):
+    """
+    Replays several logs at once (logs : a list of lists of files, see
+    group_log_files) : every log is parsed batch by batch, and the requests
+    of all the logs are merged by timestamp and passed to the add_batch
+    method of the line_processor by batches of MERGE_BATCH_SIZE requests.
+    The watermark of the event-time monitors thus never runs ahead of a log
+    (which would make all its requests late).
+    """
+    # Number of invalid lines of the parsed batches, added to the batches
+    # of the merge
+    invalid_count = [0]
+
+    def iter_requests(filenames):
+        for filename in filenames:
+            with open_log_stream(filename, chunk_size) as log_file:
+                for lines in iter_line_batches(log_file, chunk_size):
+                    batch = line_processor.parse_lines(lines)
+                    invalid_count[0] += batch.invalid_count
+                    yield from batch.requests
+
+    batch = list()
+    for request in heapq.merge(*[iter_requests(filenames)
+                                 for filenames in logs], key=_TIMESTAMP):
+        batch.append(request)
+        if len(batch) >= MERGE_BATCH_SIZE:
+            line_processor.add_batch(batch, invalid_count[0])
+            batch = list()
+            invalid_count[0] = 0
+
+    line_processor.add_batch(batch, invalid_count[0])
+
+
+class ReplayReport:
+    """
+    Summary of a replay : statistics, most visited sections and the
+    timeline of the alerts.
+    """
+
+    def __init__(self, stats_monitor, section_monitor, alert_log,
+                 duration, top_n=10, invalid_count=0):
+        self.request_count = stats_monitor.request_count
+        self.successful_req_count = stats_monitor.successful_req_count
+        self.failed_req_count = stats_monitor.failed_req_count
+        self.success_ratio = stats_monitor.success_ratio
+        self.av_req_per_minute = stats_monitor.av_req_per_minute
+        self.starting_datetime = stats_monitor.starting_datetime
+        self.ranking = section_monitor.get_current_top_n(top_n)
+        self.alerts = list(alert_log.alerts)
+        self.duration = duration
+        self.invalid_count = invalid_count
+
+    def format(self):
+        lines = ['--- REPLAY REPORT ---', '',
+                 'Total number of request : {0} (processed in {1:.1f} s, '
+                 '{2:.0f} requests/s)'.format(
+                     self.request_count, self.duration,
+                     self.request_count / self.duration if self.duration
+                     else 0),
+                 'Average number of requests per minute : {0:.1f} since {1}'
+                 .format(self.av_req_per_minute, self.starting_datetime),
+                 'Successful : {0} \t Failed {1} \t Success Ratio : {2:.0f}'
+                 .format(self.successful_req_count, self.failed_req_count,
+                         self.success_ratio * 100),
+                 'Invalid lines skipped : {0}'.format(self.invalid_count),
+                 '', '--- MOST VISITED SECTIONS ---', '']
+
+        for section, hits in self.ranking:
+            lines.append('{0:<15}|    {1}'.format(section, hits))
+
+        lines += ['', '--- ALERTS ---', '']
+        if not self.alerts:
+            lines.append('No alert')
+        for timestamp, overloaded, count in self.alerts:
+            date = datetime.fromtimestamp(timestamp)
+            if overloaded:
+                lines.append('ALERT ({0}) : traffic threshold reached, {1} '
+                             'requests in the timeframe'.format(date, count))
+            else:
+                lines.append('ALERT FINISHED ({0}) : traffic load back to '
+                             'normal'.format(date))
+
+        return '\n'.join(lines)
@@ -0,0 +1,205 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+from array import array
+from collections import Counter
+from operator import attrgetter
+
+try:
+    import numpy
+except ImportError:
+    # Everything works without numpy, only slower
+    numpy = None
+
+# The fields of a record (see ApacheLogParser.parse_record), read from a
+# Request when the batch isn't built from records
+_RECORD_FIELDS = attrgetter('url', 'timestamp', 'method', 'remote_addr',
+                            'status', 'protocol', 'client_identity',
+                            'remote_username', 'bytes_sent', 'referer',
+                            'user_agent', 'response_time')
+_SECTION = attrgetter('section')
+
+# Index of the columns in a record
+_URL = 0
+_TIMESTAMP = 1
+_REMOTE_ADDR = 3
+_STATUS = 4
+_BYTES_SENT = 8
+_RESPONSE_TIME = 11
+
+
+class StringTable:
+    """
+    Gives a small integer id to every distinct string (section, client
+    address...) of a batch so that they can be stored in typed arrays. A
+    table only lives as long as its batch : the ids are never kept from one
+    batch to the next one.
+    """
+
+    def __init__(self, values=()):
+        # dict.fromkeys keeps the order of the first occurrences
+        self._values = list(dict.fromkeys(values))
+        self._ids = dict(zip(self._values, range(len(self._values))))
+
+    def get_ids(self, values):
+        """
+        Returns the ids of the given values (which must be in the table) as
+        an array.
+        """
+        return array('I', map(self._ids.__getitem__, values))
+
+    def get_value(self, value_id):
+        return self._values[value_id]
+
+    def _get_values(self):
+        return self._values
+
+    values = property(_get_values, None)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class RequestBatch:
+    """
+    A batch of requests stored column by column in typed arrays, so that
+    the submonitors can compute their aggregates over the whole batch at
+    once (with numpy when it is available) instead of looping over Request
+    objects.
+
+    The parsers build the batches from their records (see
+    ApacheLogParser.parse_batch) : the columns are the transposed records
+    (zip(*records)), so no Request attribute is read but the section.
+    Sections and client addresses are stored as ids of StringTables of the
+    batch.
+    """
+
+    def __init__(self, requests, records=None, invalid_count=0):
+        """
+        requests : the list of Request objects
+        records : the records the requests have been built from, in the
+        same order (the attributes of the requests are read if None)
+        invalid_count : the number of lines the parser had to skip
+        """
+        self.requests = requests
+        self.count = len(requests)
+        self.invalid_count = invalid_count
+        if records is None:
+            records = map(_RECORD_FIELDS, requests)
+
+        columns = list(zip(*records))
+        if not columns:
+            columns = [()] * (_RESPONSE_TIME + 1)
+
+        self.urls = columns[_URL]
+        self.timestamps = array('q', columns[_TIMESTAMP])
+        self.statuses = array('H', columns[_STATUS])
+        self.bytes_sent = array('q', columns[_BYTES_SENT])
+
+        # Response times in seconds (NaN when unknown), None if the log
+        # format doesn't have them
+        self.response_times = None
+        if len(columns) > _RESPONSE_TIME:
+            times = columns[_RESPONSE_TIME]
+            if times.count(None) < len(times):
+                nan = float('nan')
+                self.response_times = array('d', [nan if t is None else t
+                                                  for t in times])
+
+        sections = list(map(_SECTION, requests))
+        self.sections = StringTable(sections)
+        self.section_ids = self.sections.get_ids(sections)
+        self.clients = StringTable(columns[_REMOTE_ADDR])
+        self.client_ids = self.clients.get_ids(columns[_REMOTE_ADDR])
+
+    def successful_count(self):
+        if numpy is not None:
+            statuses = numpy.frombuffer(self.statuses, dtype=numpy.uint16)
+            return int(numpy.count_nonzero(statuses <= 399))
+
+        return sum(1 for status in self.statuses if status <= 399)
+
+    def failing_indexes(self):
+        """
+        Returns the list of the indexes of the failing requests (4xx and
+        5xx).
+        """
+        if numpy is not None:
+            statuses = numpy.frombuffer(self.statuses, dtype=numpy.uint16)
+            return numpy.flatnonzero(statuses >= 400).tolist()
+
+        return [i for i, status in enumerate(self.statuses) if status >= 400]
+
+    def total_bytes(self):
+        if numpy is not None:
+            return int(numpy.frombuffer(self.bytes_sent,
+                                        dtype=numpy.int64).sum())
+
+        return sum(self.bytes_sent)
+
+    def section_counts(self):
+        """
+        Returns a dict section -> number of hits in the batch.
+        """
+        return dict((self.sections.get_value(section_id), count)
+                    for section_id, count in _count(self.section_ids,
+                                                    numpy and numpy.uint32))
+
+    def timestamp_section_counts(self):
+        """
+        Returns a list of (timestamp, section, number of hits).
+        """
+        get_value = self.sections.get_value
+        if numpy is not None and self.count > 0:
+            # One int64 key per (timestamp, section id) pair
+            keys = numpy.frombuffer(self.timestamps, dtype=numpy.int64) << 32
+            keys |= numpy.frombuffer(self.section_ids, dtype=numpy.uint32)
+            keys, counts = numpy.unique(keys, return_counts=True)
+            return [(key >> 32, get_value(key & 0xffffffff), count)
+                    for key, count in zip(keys.tolist(), counts.tolist())]
+
+        return [(timestamp, get_value(section_id), count)
+                for (timestamp, section_id), count in
+                Counter(zip(self.timestamps, self.section_ids)).items()]
+
+    def timestamp_counts(self):
+        """
+        Returns a list of (timestamp, number of requests) sorted by
+        timestamp.
+        """
+        return sorted(_count(self.timestamps, numpy and numpy.int64))
+
+    def timestamp_groups(self, *columns):
+        """
+        Splits the given columns of the batch (bytes_sent, statuses...) by
+        timestamp. Returns a list of (timestamp, values of each column)
+        sorted by timestamp, the values being numpy arrays when numpy is
+        available and lists otherwise.
+        """
+        if numpy is not None and self.count > 0:
+            timestamps = numpy.frombuffer(self.timestamps, dtype=numpy.int64)
+            order = numpy.argsort(timestamps, kind='stable')
+            seconds, starts = numpy.unique(timestamps[order],
+                                           return_index=True)
+            splits = [numpy.split(numpy.asarray(column)[order], starts[1:])
+                      for column in columns]
+            return [(second, [split[i] for split in splits])
+                    for i, second in enumerate(seconds.tolist())]
+
+        groups = dict()
+        for row in zip(self.timestamps, *columns):
+            values = groups.get(row[0])
+            if values is None:
+                values = groups[row[0]] = [list() for column in columns]
+            for i, value in enumerate(row[1:]):
+                values[i].append(value)
+        return sorted(groups.items())
+
+
+def _count(values, dtype):
+    if numpy is not None and len(values) > 0:
+        keys, counts = numpy.unique(numpy.frombuffer(values, dtype=dtype),
+                                    return_counts=True)
+        return zip(keys.tolist(), counts.tolist())
+
+    return Counter(values).items()
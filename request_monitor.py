@@ -2,79 +2,216 @@
 # -*- coding: utf-8 -*-
 
 from urllib.parse import urlparse
+from sys import intern
+from collections import deque
+from threading import RLock
 import datetime
 
+from request_batch import RequestBatch
+
 
 class RequestMonitor:
     """
     Constructs (from log) and dispatches new HTTP Requests to submonitors
+
+    The requests themselves are only kept if a retention policy is given :
+    either the last retention_count requests (a ring buffer) or the
+    requests of the last retention_window seconds (of log time). They can
+    then be queried with get_requests().
+
+    Batches of requests are turned into a columnar RequestBatch for the
+    submonitors implementing add_batch().
     """
 
-    def __init__(self, submonitors=list()):
+    def __init__(self, submonitors=list(), retention_count=None,
+                 retention_window=None):
         """
-        alert threshold : the number of requests per 2 minutes that
-        should trigger an alert
-        stats_refresh_interval : the interval between two updates of the
-        list containing all queries for the last two minutes
         submonitors : a list of instance of monitors (classes implementing
         the add_request() method)
+        retention_count : the number of requests to keep
+        retention_window : the number of seconds of requests to keep
+        (ignored if retention_count is given)
         """
         self._submonitors = submonitors
-        self._requests = list()
+        self._retention_window = None
 
-    def add_request(self, request):
-        assert isinstance(request, Request)
+        if retention_count:
+            self._requests = deque(maxlen=retention_count)
+        elif retention_window:
+            self._requests = deque()
+            self._retention_window = retention_window
+        else:
+            self._requests = None
 
-        self._requests.append(request)
+        self._lock = RLock()
+        self._invalid_count = 0
+
+        self._batch_monitors = any(hasattr(m, 'add_batch')
+                                   for m in submonitors)
+
+    def add_request(self, request):
+        if self._requests is not None:
+            with self._lock:
+                self._requests.append(request)
+                if self._retention_window is not None:
+                    self._drop_old(request.timestamp)
 
         # We pass the new request to submonitors
         for monitor in self._submonitors:
             monitor.add_request(request)
 
+    def add_requests(self, batch):
+        """
+        Dispatches a list of requests or a RequestBatch (as built by the
+        parsers). The submonitors implementing an add_batch() method get a
+        RequestBatch, the ones implementing add_requests() get the list at
+        once and the other ones get the requests one by one.
+        """
+        request_batch = None
+        if isinstance(batch, RequestBatch):
+            request_batch = batch
+            batch = batch.requests
+            self._invalid_count += request_batch.invalid_count
+        if not batch:
+            return
+
+        if self._requests is not None:
+            with self._lock:
+                self._requests.extend(batch)
+                if self._retention_window is not None:
+                    # The batches are only roughly in time order
+                    if request_batch is not None:
+                        self._drop_old(max(request_batch.timestamps))
+                    else:
+                        self._drop_old(max(r.timestamp for r in batch))
+
+        if request_batch is None and self._batch_monitors:
+            request_batch = RequestBatch(batch)
+
+        for monitor in self._submonitors:
+            add_batch = getattr(monitor, 'add_batch', None)
+            if add_batch is not None:
+                add_batch(request_batch)
+                continue
+
+            add_requests = getattr(monitor, 'add_requests', None)
+            if add_requests is not None:
+                add_requests(batch)
+            else:
+                for request in batch:
+                    monitor.add_request(request)
+
+    def add_invalid_lines(self, count):
+        """
+        Counts lines which couldn't be parsed (see invalid_count).
+        """
+        self._invalid_count += count
+
+    def _drop_old(self, now):
+        limit = now - self._retention_window
+        requests = self._requests
+        while requests and requests[0].timestamp <= limit:
+            requests.popleft()
+
+    def get_requests(self, since=None, until=None, section=None,
+                     status=None, limit=None):
+        """
+        Returns the retained requests (oldest first) matching all the given
+        criteria. since and until are epoch timestamps (until excluded),
+        status can be a code or a class (4 for 4xx...). If limit is given,
+        only the limit most recent requests are returned.
+        """
+        if self._requests is None:
+            return list()
+
+        with self._lock:
+            requests = list(self._requests)
+
+        if since is not None:
+            requests = [r for r in requests if r.timestamp >= since]
+        if until is not None:
+            requests = [r for r in requests if r.timestamp < until]
+        if section is not None:
+            requests = [r for r in requests if r.section == section]
+        if status is not None:
+            if status < 10:
+                requests = [r for r in requests if r.status // 100 == status]
+            else:
+                requests = [r for r in requests if r.status == status]
+        if limit is not None:
+            requests = requests[max(0, len(requests) - limit):]
+
+        return requests
+
+    def _get_retained_count(self):
+        return len(self._requests) if self._requests is not None else 0
+
+    retained_count = property(_get_retained_count, None)
+
+    def _get_invalid_count(self):
+        return self._invalid_count
+
+    invalid_count = property(_get_invalid_count, None)
+
 
 class Request:
     """
     A very standard "Entity" class describing an HTTP Request
+
+    Since millions of them can be alive at the same time, the class is
+    kept as compact as possible : no __dict__ (__slots__), the date is
+    stored as an epoch timestamp (in seconds) and the strings which are
+    repeated over and over (method, protocol, section...) are interned.
     """
 
+    __slots__ = ('url', 'timestamp', 'method', 'remote_addr', 'status',
+                 'protocol', 'client_identity', 'remote_username',
+                 'bytes_sent', 'referer', 'user_agent', 'response_time',
+                 'source', '_section')
+
     def __init__(self, url, date, method, remote_addr, status,
-                 protocol, client_identity, remote_username, bytes_sent):
+                 protocol, client_identity, remote_username, bytes_sent,
+                 referer=None, user_agent=None, response_time=None,
+                 source=None):
         """
-        Constructs a requests object and automatically computes the
-        section of the path and whether the request is successful or
-        not. Once instantiated, this object shouldn't be modified.
+        Constructs a requests object. The section of the path is computed
+        on demand. Once instantiated, this object shouldn't be modified.
         It should instead be destroyed and a new request should be
         created.
+
+        date is either an epoch timestamp or a (naive, local) datetime.
+        referer, user_agent and response_time (in seconds) are only
+        available with some log formats, they are None otherwise.
+        source is the log file the request comes from, when several files
+        are monitored (it is the only attribute set after the parsing).
         """
         self.url = url
 
-        assert isinstance(date, datetime.datetime)
-        self.date = date
+        if isinstance(date, datetime.datetime):
+            date = date.timestamp()
+        self.timestamp = int(date)
 
-        self.method = method
+        self.method = intern(method)
         self.remote_addr = remote_addr
-
-        assert isinstance(status, int)
-        self.status = status
-
-        self.protocol = protocol
-        self.client_identity = client_identity
-        self.remote_username = remote_username
+        self.status = int(status)
+        self.protocol = intern(protocol)
+        self.client_identity = intern(client_identity)
+        self.remote_username = intern(remote_username)
         self.bytes_sent = bytes_sent
+        self.referer = referer
+        self.user_agent = user_agent
+        self.response_time = response_time
+        self.source = source
 
-        self._successful = None
         self._section = None
 
-    def _is_successful(self):
-        if self._successful is not None:
-            return self._sucessful
+    def _get_date(self):
+        return datetime.datetime.fromtimestamp(self.timestamp)
 
-        if(self.status <= 399):
-            self._successful = True
-        else:
-            self._successful = False
+    date = property(_get_date, None)
 
-        return self._successful
+    def _is_successful(self):
+        return self.status <= 399
 
     is_successful = property(_is_successful, None)
 
@@ -82,10 +219,16 @@ class Request:
         if self._section is not None:
             return self._section
 
-        parsed_url = urlparse(self.url)
-        splitted_path = parsed_url.path.split('/', 2)
+        url = self.url
+        if url.startswith('/'):
+            # Most common case, no need for a full URL parsing
+            path = url.split('?', 1)[0].split('#', 1)[0]
+        else:
+            path = urlparse(url).path
 
-        self._section = splitted_path[1]
+        splitted_path = path.split('/', 2)
+        section = splitted_path[1] if len(splitted_path) > 1 else path
+        self._section = intern(section)
 
         return self._section
 
@@ -0,0 +1,294 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import Counter
+
+from heavy_hitters import SpaceSaving
+from hyperloglog import HyperLogLog, DEFAULT_PRECISION
+
+# (duration, bucket width) in seconds of the windows of the monitors : last
+# 10 s, 1 min, 5 min and 1 h
+DEFAULT_WINDOWS = ((10, 1), (60, 5), (300, 30), (3600, 60))
+
+
+class RollingWindow:
+    """
+    Sliding window over the last duration seconds, made of buckets of
+    bucket_width seconds : each bucket aggregates what happened during its
+    interval (a Counter, a histogram...) and is thrown away as a whole when
+    it gets out of the window. No individual request is kept, the memory
+    only depends on the number of buckets and on the size of an aggregate.
+
+    Like in the OverloadMonitor, the window at time now holds the seconds
+    ]now - duration, now] (and the ones after now, in event-time mode).
+    Since the buckets are expired as a whole, the window actually covers
+    between duration and duration + bucket_width - 1 seconds.
+
+    new_bucket is the function creating an empty aggregate. Subclasses can
+    override _expire_bucket to update their own totals.
+    """
+
+    def __init__(self, duration, bucket_width=1, new_bucket=Counter):
+        self._duration = duration
+        self._bucket_width = bucket_width
+        self._new_bucket = new_bucket
+
+        # bucket index (timestamp // bucket_width) -> aggregate
+        self._buckets = dict()
+        # The time given to the last expire call
+        self._now = None
+
+    def get_bucket(self, timestamp):
+        """
+        Returns the aggregate of the bucket containing timestamp (created if
+        needed) or None if this bucket is already out of the window.
+        """
+        index = timestamp // self._bucket_width
+        if self._now is not None and (index + 1) * self._bucket_width <= \
+                self._now - self._duration + 1:
+            return None
+
+        bucket = self._buckets.get(index)
+        if bucket is None:
+            bucket = self._new_bucket()
+            self._buckets[index] = bucket
+        return bucket
+
+    def expire(self, now):
+        """
+        Moves the window to now (an epoch timestamp, the window never goes
+        back) and drops the buckets which are out of it.
+        """
+        if now is None or (self._now is not None and now <= self._now):
+            return
+        self._now = now
+
+        # The last second of an expired bucket is at most now - duration
+        limit = now - self._duration + 1
+        width = self._bucket_width
+        expired = [index for index in self._buckets
+                   if (index + 1) * width <= limit]
+        for index in sorted(expired):
+            self._expire_bucket(self._buckets.pop(index))
+
+    def _expire_bucket(self, bucket):
+        pass
+
+    def get_buckets(self):
+        """
+        Returns the aggregates of the buckets in the window, oldest first.
+        """
+        return [self._buckets[index] for index in sorted(self._buckets)]
+
+    def _get_duration(self):
+        return self._duration
+
+    duration = property(_get_duration, None)
+
+    def _get_bucket_width(self):
+        return self._bucket_width
+
+    bucket_width = property(_get_bucket_width, None)
+
+
+class RollingCounter(RollingWindow):
+    """
+    Counts hits per key (sections, clients...) over a sliding window. The
+    totals of the window are kept up to date as hits are added and buckets
+    expired, and the top n is cached until the next change.
+    """
+
+    def __init__(self, duration, bucket_width=1):
+        RollingWindow.__init__(self, duration, bucket_width, Counter)
+        self._totals = Counter()
+        # n -> top n
+        self._top = dict()
+
+    def add(self, timestamp, key, count=1):
+        """
+        Counts count hits of key at timestamp. Returns False if it is too
+        old for the window.
+        """
+        bucket = self.get_bucket(timestamp)
+        if bucket is None:
+            return False
+
+        bucket[key] += count
+        self._totals[key] += count
+        if self._top:
+            self._top = dict()
+        return True
+
+    def _expire_bucket(self, bucket):
+        totals = self._totals
+        for key, count in bucket.items():
+            remaining = totals[key] - count
+            if remaining > 0:
+                totals[key] = remaining
+            else:
+                del totals[key]
+        self._top = dict()
+
+    def most_common(self, n=None):
+        """
+        Returns the n (all if None) keys with the most hits in the window,
+        as a list of (key, hits).
+        """
+        top = self._top.get(n)
+        if top is None:
+            top = self._totals.most_common(n)
+            self._top[n] = top
+        return top
+
+    def __getitem__(self, key):
+        return self._totals.get(key, 0)
+
+    def __len__(self):
+        return len(self._totals)
+
+
+class RollingUniques(RollingWindow):
+    """
+    Estimates the number of distinct values (clients) per key (section)
+    over a sliding window, with a hyperloglog.HyperLogLog per key and per
+    bucket : the memory of a key is bounded by a few KB per bucket, however
+    many clients there are. The key None can be used for all the keys.
+
+    The sketch of a key for the window is the merge of the sketches of the
+    buckets. The merge of all the buckets but the most recent one (the one
+    which is being filled) is cached until a bucket expires.
+    """
+
+    def __init__(self, duration, bucket_width=1,
+                 precision=DEFAULT_PRECISION):
+        RollingWindow.__init__(self, duration, bucket_width, dict)
+        self._precision = precision
+        # key -> (generation, newest bucket index, merge of the others)
+        self._cache = dict()
+        # Changes whenever a bucket other than the newest one changes
+        self._generation = 0
+        self._newest = None
+
+    def add(self, timestamp, key, value_hash):
+        """
+        Adds a value, given by its hash (see hyperloglog.hash_value), to the
+        key at timestamp. Returns False if it is too old for the window.
+        """
+        sketch = self._get_sketch(timestamp, key)
+        if sketch is None:
+            return False
+
+        sketch.add_hash(value_hash)
+        return True
+
+    def add_registers(self, timestamp, key, registers):
+        """
+        Same as add for several values given by their registers (a dict
+        index -> rank, see hyperloglog.get_register).
+        """
+        sketch = self._get_sketch(timestamp, key)
+        if sketch is None:
+            return False
+
+        sketch.add_registers(registers)
+        return True
+
+    def _get_sketch(self, timestamp, key):
+        bucket = self.get_bucket(timestamp)
+        if bucket is None:
+            return None
+
+        index = timestamp // self._bucket_width
+        if self._newest is None or index > self._newest:
+            self._newest = index
+        elif index < self._newest:
+            self._generation += 1
+
+        sketch = bucket.get(key)
+        if sketch is None:
+            sketch = HyperLogLog(self._precision)
+            bucket[key] = sketch
+        return sketch
+
+    def _expire_bucket(self, bucket):
+        self._generation += 1
+        self._cache = dict()
+
+    def count(self, key=None):
+        """
+        Returns the estimated number of distinct values of key in the
+        window.
+        """
+        if not self._buckets:
+            return 0
+
+        newest = max(self._buckets)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == self._generation and \
+                cached[1] == newest:
+            older = cached[2]
+        else:
+            older = HyperLogLog(self._precision)
+            for index, bucket in self._buckets.items():
+                if index != newest and key in bucket:
+                    older.merge(bucket[key])
+            self._cache[key] = (self._generation, newest, older)
+
+        sketch = older
+        if key in self._buckets[newest]:
+            sketch = older.copy()
+            sketch.merge(self._buckets[newest][key])
+        return sketch.count()
+
+
+class RollingHeavyHitters(RollingWindow):
+    """
+    Most frequent keys (URLs...) of several groups (status codes...) over a
+    sliding window. Every bucket holds a heavy_hitters.SpaceSaving sketch
+    of capacity keys per group, so the memory is bounded whatever the
+    number of distinct keys : the window only keeps buckets x groups x
+    capacity counters.
+
+    The ranking of the window is the sum of the counts of the buckets, the
+    counts being overestimated by at most the sum of their errors.
+    """
+
+    def __init__(self, duration, bucket_width=1, capacity=100):
+        RollingWindow.__init__(self, duration, bucket_width, dict)
+        self._capacity = capacity
+
+    def add(self, timestamp, group, key, count=1):
+        """
+        Counts count hits of key in group at timestamp. Returns False if it
+        is too old for the window.
+        """
+        bucket = self.get_bucket(timestamp)
+        if bucket is None:
+            return False
+
+        sketch = bucket.get(group)
+        if sketch is None:
+            sketch = SpaceSaving(self._capacity)
+            bucket[group] = sketch
+        sketch.add(key, count)
+        return True
+
+    def get_counts(self, groups=None):
+        """
+        Returns a Counter key -> hits in the window for the given groups
+        (all the groups if None).
+        """
+        counts = Counter()
+        for bucket in self._buckets.values():
+            for group, sketch in bucket.items():
+                if groups is None or group in groups:
+                    for key, count in sketch.items():
+                        counts[key] += count
+        return counts
+
+    def most_common(self, n=None, groups=None):
+        """
+        Returns the n (all if None) keys with the most hits in the window
+        for the given groups, as a list of (key, hits).
+        """
+        return self.get_counts(groups).most_common(n)
@@ -0,0 +1,404 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import time
+from collections import Counter
+from threading import Thread, RLock, local
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# (resolution, retention) in seconds of the rollups : per second rows are
+# kept for a day, per minute rows for 30 days and per hour rows for a year
+DEFAULT_RESOLUTIONS = ((1, 86400), (60, 30 * 86400), (3600, 365 * 86400))
+
+# Number of sections persisted per flush by default, the other ones are
+# added up in the OTHER_SECTION row
+DEFAULT_MAX_SECTIONS = 100
+OTHER_SECTION = '(other)'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS traffic (
+    resolution INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    requests INTEGER NOT NULL,
+    bytes_sent INTEGER NOT NULL,
+    status_1xx INTEGER NOT NULL,
+    status_2xx INTEGER NOT NULL,
+    status_3xx INTEGER NOT NULL,
+    status_4xx INTEGER NOT NULL,
+    status_5xx INTEGER NOT NULL,
+    PRIMARY KEY (resolution, timestamp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS section_hits (
+    resolution INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    PRIMARY KEY (resolution, timestamp, section)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alerts (
+    timestamp INTEGER NOT NULL,
+    overloaded INTEGER NOT NULL,
+    request_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_timestamp ON alerts (timestamp);
+"""
+
+_UPSERT_TRAFFIC = """
+INSERT INTO traffic VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, timestamp) DO UPDATE SET
+    requests = requests + excluded.requests,
+    bytes_sent = bytes_sent + excluded.bytes_sent,
+    status_1xx = status_1xx + excluded.status_1xx,
+    status_2xx = status_2xx + excluded.status_2xx,
+    status_3xx = status_3xx + excluded.status_3xx,
+    status_4xx = status_4xx + excluded.status_4xx,
+    status_5xx = status_5xx + excluded.status_5xx
+"""
+
+_UPSERT_SECTION_HITS = """
+INSERT INTO section_hits VALUES (?, ?, ?, ?)
+ON CONFLICT (resolution, timestamp, section) DO UPDATE SET
+    hits = hits + excluded.hits
+"""
+
+# Index of the counters of a second in the pending rows : requests, bytes
+# sent and requests per status class (1xx to 5xx)
+_REQUESTS = 0
+_BYTES_SENT = 1
+_STATUS_CLASSES = 2
+
+
+class RollupStore(Thread):
+    """
+    Persists the traffic in a SQLite database (WAL mode), as rollups : the
+    number of requests, bytes sent and requests per status class, and the
+    hits per section, per second, minute and hour. The alerts of an
+    OverloadMonitor are stored too.
+
+    The store is a submonitor : adding requests only updates in-memory
+    counters per second. The writer thread flushes them every
+    flush_interval seconds, in a single transaction, and adds them to the
+    rows of every resolution at once (the per minute and per hour rows are
+    thus downsampled from the same counts as the per second ones). The rows
+    older than the retention of their resolution are pruned every
+    prune_interval seconds, relatively to the most recent timestamp stored
+    (so that a replay of old logs isn't pruned right away).
+
+    Only the max_sections sections with the most hits of a flush get their
+    own section_hits rows, the hits of the other ones are added up in an
+    OTHER_SECTION row : a crawler hitting thousands of distinct sections
+    doesn't make the table grow with them.
+
+    The history (get_traffic, get_section_hits, get_alerts) is only read
+    from these tables, with one connection per reading thread : WAL lets
+    them read while the writer writes. The path must be a real file, an
+    in-memory database can't be shared by several connections.
+    """
+
+    def __init__(self, path, flush_interval=1, prune_interval=60,
+                 resolutions=DEFAULT_RESOLUTIONS, overload_monitor=None,
+                 max_sections=DEFAULT_MAX_SECTIONS):
+        Thread.__init__(self)
+
+        self._path = path
+        self._flush_interval = flush_interval
+        self._prune_interval = prune_interval
+        self._resolutions = sorted(resolutions)
+        self._max_sections = max_sections
+
+        # second -> [requests, bytes sent, 1xx, 2xx, 3xx, 4xx, 5xx]
+        self._pending_traffic = dict()
+        # (second, section) -> hits
+        self._pending_sections = Counter()
+        # (timestamp, overloaded, request count)
+        self._pending_alerts = list()
+        self._lock = RLock()
+
+        self._connection = self._connect()
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+        self._write_lock = RLock()
+        self._readers = local()
+
+        # The most recent timestamp stored
+        self._newest = self._connection.execute(
+            'SELECT MAX(timestamp) FROM traffic').fetchone()[0]
+        self._last_prune = time.monotonic()
+
+        self._overload_monitor = overload_monitor
+        self._overloaded = False
+        if overload_monitor is not None:
+            overload_monitor.add_observer(self, 'alert')
+
+        self._keeponrunning = True
+
+    def _connect(self):
+        connection = sqlite3.connect(self._path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL, a crash can't corrupt the database, it can only lose the
+        # last transactions
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def add_request(self, request):
+        with self._lock:
+            self._add_second(request.timestamp, 1, request.bytes_sent,
+                             ((request.status, 1),))
+            self._pending_sections[(request.timestamp,
+                                    request.section)] += 1
+
+    def add_batch(self, batch):
+        """
+        Same as add_request for a whole request_batch.RequestBatch.
+        """
+        traffic = list()
+        for timestamp, (statuses, bytes_sent) in batch.timestamp_groups(
+                batch.statuses, batch.bytes_sent):
+            if numpy is not None:
+                statuses = statuses.tolist()
+                bytes_sent = bytes_sent.tolist()
+            traffic.append((timestamp, len(statuses), sum(bytes_sent),
+                            Counter(statuses).items()))
+
+        section_counts = batch.timestamp_section_counts()
+        with self._lock:
+            for timestamp, count, bytes_sent, status_counts in traffic:
+                self._add_second(timestamp, count, bytes_sent, status_counts)
+            pending_sections = self._pending_sections
+            for timestamp, section, count in section_counts:
+                pending_sections[(timestamp, section)] += count
+
+    def _add_second(self, timestamp, count, bytes_sent, status_counts):
+        row = self._pending_traffic.get(timestamp)
+        if row is None:
+            row = self._pending_traffic[timestamp] = [0] * 7
+        row[_REQUESTS] += count
+        row[_BYTES_SENT] += bytes_sent
+        for status, status_count in status_counts:
+            status_class = status // 100
+            if 1 <= status_class <= 5:
+                row[_STATUS_CLASSES + status_class - 1] += status_count
+
+    def on_alert(self):
+        overloaded = self._overload_monitor.overloaded
+        if overloaded != self._overloaded:
+            self._overloaded = overloaded
+            with self._lock:
+                self._pending_alerts.append(
+                    (self._overload_monitor.watermark, int(overloaded),
+                     self._overload_monitor.request_count))
+
+    def flush(self):
+        """
+        Writes the pending counters to the database, in one transaction.
+        """
+        with self._lock:
+            traffic = self._pending_traffic
+            sections = self._pending_sections
+            alerts = self._pending_alerts
+            self._pending_traffic = dict()
+            self._pending_sections = Counter()
+            self._pending_alerts = list()
+
+        if not traffic and not sections and not alerts:
+            return
+
+        sections = self._fold_sections(sections)
+
+        traffic_rows = list()
+        section_rows = list()
+        for resolution, retention in self._resolutions:
+            rollup = dict()
+            for timestamp, counts in traffic.items():
+                key = timestamp - timestamp % resolution
+                row = rollup.get(key)
+                if row is None:
+                    rollup[key] = list(counts)
+                else:
+                    for i, count in enumerate(counts):
+                        row[i] += count
+            traffic_rows.extend([resolution, key] + row
+                                for key, row in rollup.items())
+
+            section_rollup = Counter()
+            for (timestamp, section), hits in sections.items():
+                section_rollup[(timestamp - timestamp % resolution,
+                                section)] += hits
+            section_rows.extend((resolution, key, section, hits)
+                                for (key, section), hits in
+                                section_rollup.items())
+
+        with self._write_lock:
+            with self._connection:
+                self._connection.executemany(_UPSERT_TRAFFIC, traffic_rows)
+                self._connection.executemany(_UPSERT_SECTION_HITS,
+                                             section_rows)
+                self._connection.executemany(
+                    'INSERT INTO alerts VALUES (?, ?, ?)', alerts)
+
+        if traffic:
+            newest = max(traffic)
+            if self._newest is None or newest > self._newest:
+                self._newest = newest
+
+    def _fold_sections(self, sections):
+        """
+        Adds up the hits of the sections which aren't among the
+        max_sections most visited ones of the flush in OTHER_SECTION.
+        """
+        totals = Counter()
+        for (timestamp, section), hits in sections.items():
+            totals[section] += hits
+        if len(totals) <= self._max_sections:
+            return sections
+
+        kept = set(section for section, hits in
+                   totals.most_common(self._max_sections))
+        folded = Counter()
+        for (timestamp, section), hits in sections.items():
+            folded[(timestamp, section if section in kept
+                    else OTHER_SECTION)] += hits
+        return folded
+
+    def prune(self):
+        """
+        Deletes the rows older than the retention of their resolution.
+        """
+        if self._newest is None:
+            return
+
+        with self._write_lock:
+            with self._connection:
+                for resolution, retention in self._resolutions:
+                    limit = self._newest - retention
+                    for table in ('traffic', 'section_hits'):
+                        self._connection.execute(
+                            'DELETE FROM {0} WHERE resolution = ? AND '
+                            'timestamp <= ?'.format(table),
+                            (resolution, limit))
+                self._connection.execute(
+                    'DELETE FROM alerts WHERE timestamp <= ?',
+                    (self._newest - self._resolutions[-1][1],))
+
+    def _get_reader(self):
+        connection = getattr(self._readers, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path)
+            self._readers.connection = connection
+        return connection
+
+    def get_resolution(self, since):
+        """
+        Returns the finest resolution whose rows still cover the history
+        since the given timestamp (None for all the history).
+        """
+        if since is not None and self._newest is not None:
+            for resolution, retention in self._resolutions:
+                if since > self._newest - retention:
+                    return resolution
+        return self._resolutions[-1][0]
+
+    def get_traffic(self, since=None, until=None, resolution=None):
+        """
+        Returns the traffic between since and until (epoch timestamps, until
+        excluded, None for no limit) as a list of dicts, one per resolution
+        seconds (see get_resolution if it isn't given) : timestamp,
+        requests, bytes_sent and status_classes (a dict class (2, 4...) ->
+        requests).
+        """
+        if resolution is None:
+            resolution = self.get_resolution(since)
+
+        query = 'SELECT * FROM traffic WHERE resolution = ?'
+        parameters = [resolution]
+        query, parameters = RollupStore._add_range(query, parameters, since,
+                                                   until)
+        rows = self._get_reader().execute(query + ' ORDER BY timestamp',
+                                          parameters).fetchall()
+
+        return [{'timestamp': row[1], 'requests': row[2],
+                 'bytes_sent': row[3],
+                 'status_classes': dict((i + 1, count) for i, count in
+                                        enumerate(row[4:]))}
+                for row in rows]
+
+    def get_section_hits(self, since=None, until=None, n=10,
+                         resolution=None):
+        """
+        Returns the n sections with the most hits between since and until,
+        as a list of (section, hits).
+        """
+        if resolution is None:
+            resolution = self.get_resolution(since)
+
+        query = 'SELECT section, SUM(hits) AS total FROM section_hits ' \
+                'WHERE resolution = ?'
+        parameters = [resolution]
+        query, parameters = RollupStore._add_range(query, parameters, since,
+                                                   until)
+        query += ' GROUP BY section ORDER BY total DESC, section LIMIT ?'
+        parameters.append(n)
+        return self._get_reader().execute(query, parameters).fetchall()
+
+    def get_alerts(self, since=None, until=None):
+        """
+        Returns the alerts between since and until as a list of (timestamp,
+        overloaded, request count), like overload_monitor.AlertLog.
+        """
+        query = 'SELECT * FROM alerts WHERE 1'
+        query, parameters = RollupStore._add_range(query, list(), since,
+                                                   until)
+        return [(timestamp, bool(overloaded), request_count)
+                for timestamp, overloaded, request_count in
+                self._get_reader().execute(query + ' ORDER BY timestamp',
+                                           parameters)]
+
+    @staticmethod
+    def _add_range(query, parameters, since, until):
+        if since is not None:
+            query += ' AND timestamp >= ?'
+            parameters.append(since)
+        if until is not None:
+            query += ' AND timestamp < ?'
+            parameters.append(until)
+        return query, parameters
+
+    def tick(self):
+        """
+        Periodic work, done every flush_interval seconds by run.
+        """
+        self.flush()
+        if time.monotonic() - self._last_prune >= self._prune_interval:
+            self._last_prune = time.monotonic()
+            self.prune()
+
+    def stop_monitoring(self):
+        self._keeponrunning = False
+
+    def run(self):
+        while self._keeponrunning:
+            time.sleep(self._flush_interval)
+            self.tick()
+
+        # What came in since the last flush
+        self.flush()
+
+    def close(self):
+        self.flush()
+        with self._write_lock:
+            self._connection.close()
+
+    def _get_update_interval(self):
+        return self._flush_interval
+
+    update_interval = property(_get_update_interval, None)
+
+    def _get_path(self):
+        return self._path
+
+    path = property(_get_path, None)
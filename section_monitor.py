@@ -3,99 +3,288 @@
 
 import observer
 import time
+from collections import Counter
 from threading import Thread, RLock
 
+from event_clock import make_clock
+from heavy_hitters import SpaceSaving
+from hyperloglog import hash_value, get_register
 from request_monitor import Request
+from rolling_window import RollingCounter, RollingUniques, DEFAULT_WINDOWS
+
+# The client addresses of the formats which don't log them : such requests
+# aren't counted as visitors
+UNKNOWN_CLIENTS = (None, '-')
 
 
 class SectionMonitor(observer.Observable, Thread):
+    """
+    Counts the hits of every section and ranks them. The ranking is cleared
+    every update_interval seconds (the last one is kept, see
+    get_last_top_n) unless update_interval is 0.
+
+    By default the hits are counted exactly, in a dict. If max_sections is
+    given, they are counted in a heavy_hitters.SpaceSaving sketch instead :
+    the memory is bounded whatever the number of distinct sections and the
+    top of the ranking stays accurate.
+
+    The hits are also counted over sliding windows (10 s, 1 min, 5 min and
+    1 h by default, see get_window_top_n) which are never cleared : each
+    one is made of buckets (see rolling_window.RollingCounter) which expire
+    one after the other. Like in the OverloadMonitor, the current time is
+    the system time or, in event-time mode, a watermark.
+
+    The unique visitors (distinct remote addresses) of every section and of
+    the whole site are estimated over the same windows with HyperLogLog
+    sketches (see rolling_window.RollingUniques), unless unique_visitors is
+    False.
+    """
+
+    CLIENT_CACHE_SIZE = 65536
 
-    def __init__(self, update_interval=10):
+    def __init__(self, update_interval=10, max_sections=None,
+                 windows=DEFAULT_WINDOWS, event_time=False,
+                 allowed_lateness=10, unique_visitors=True):
         observer.Observable.__init__(self)
         Thread.__init__(self)
 
         self._update_interval = update_interval
+        self._max_sections = max_sections
 
-        # List containing a tuple. The first element represents a section and
-        # the second one represents the number of hits for this section
-        # Since we have to perform a sort on the section I decided not to use
-        # a dict, which is not supposed to be a sortable collection (even
-        # though it is possible to sort a dict :
-        # http://stackoverflow.com/questions/613183/sort-a-python-dictionary-\
-        # by-value
-        # The dict is sorted on insert/update, therefore, getting the 10 most
-        # visited sections for instance doesn't cost anything and at worst, an
-        # insertion/update has a cost of n but practically speaking, if we
-        # assume that the order tends to stabilize, the cost is just a couple
-        # of operations.
-        self._section_hits = list()
-        self._last_ranking = list()
+        # I used to keep a list of (section, hits) sorted on insert/update,
+        # which made a hit cost a linear scan of the sections. The hits are
+        # now counted in a hash table and the top n is extracted on demand
+        # (heapq.nlargest) and cached until the next hit.
+        self._section_hits = self._new_counter()
+        self._last_section_hits = self._new_counter()
+        # n -> top n, for the current and the last ranking
+        self._current_top = dict()
+        self._last_top = dict()
+
+        # duration -> RollingCounter
+        self._windows = dict((duration, RollingCounter(duration, width))
+                             for duration, width in windows)
+        # duration -> RollingUniques
+        self._unique_windows = dict((duration,
+                                     RollingUniques(duration, width))
+                                    for duration, width in windows) \
+            if unique_visitors else dict()
+        # client -> register, packed as index << 6 | rank (see
+        # hyperloglog.get_register) : the regular clients are only hashed
+        # once. The cache is cleared when it is full, like the date cache
+        # of the parser, so crawlers can't make it grow.
+        self._client_registers = dict()
+        self._clock = make_clock(event_time, allowed_lateness)
 
         self._keeponrunning = True
 
         self._lock = RLock()
 
+    def _new_counter(self):
+        if self._max_sections:
+            return SpaceSaving(self._max_sections)
+        return Counter()
+
     def add_request(self, request):
         assert isinstance(request, Request)
 
         # We update the stats about the section hits
-        self._new_section_hit(request.section)
+        section = request.section
+        self._new_section_hit(section)
+        with self._lock:
+            self._clock.observe(request.timestamp)
+            self._expire_windows()
+            for window in self._windows.values():
+                window.add(request.timestamp, section)
+            if self._unique_windows and \
+                    request.remote_addr not in UNKNOWN_CLIENTS:
+                client_hash = hash_value(request.remote_addr)
+                for window in self._unique_windows.values():
+                    window.add(request.timestamp, section, client_hash)
+                    window.add(request.timestamp, None, client_hash)
+        self.update()
 
-    def _new_section_hit(self, section):
-        index = None
-        hits = 0
+    def add_batch(self, batch):
+        """
+        Counts the hits of a whole request_batch.RequestBatch, section by
+        section.
+        """
+        for section, hits in batch.section_counts().items():
+            self._new_section_hit(section, hits)
 
+        if self._windows:
+            with self._lock:
+                self._clock.observe(max(batch.timestamps))
+                self._expire_windows()
+                windows = self._windows.values()
+                for timestamp, section, hits in \
+                        batch.timestamp_section_counts():
+                    for window in windows:
+                        window.add(timestamp, section, hits)
+                if self._unique_windows:
+                    self._add_visitors(batch)
+        self.update()
+
+    def _add_visitors(self, batch):
+        # The clients of a batch are turned into HyperLogLog registers for
+        # every (second, section) and every second first, the windows then
+        # only merge these registers.
+        cache = self._client_registers
+        packed = list()
+        for client in batch.clients.values:
+            if client in UNKNOWN_CLIENTS:
+                # The format doesn't log the client, it isn't a visitor
+                packed.append(None)
+                continue
+            register = cache.get(client)
+            if register is None:
+                index, rank = get_register(hash_value(client))
+                register = index << 6 | rank
+                if len(cache) >= SectionMonitor.CLIENT_CACHE_SIZE:
+                    cache.clear()
+                cache[client] = register
+            packed.append(register)
+
+        by_section = dict()
+        by_second = dict()
+        for timestamp, section_id, client_id in \
+                set(zip(batch.timestamps, batch.section_ids,
+                        batch.client_ids)):
+            register = packed[client_id]
+            if register is None:
+                continue
+            index = register >> 6
+            rank = register & 63
+
+            registers = by_section.get((timestamp, section_id))
+            if registers is None:
+                registers = by_section[(timestamp, section_id)] = dict()
+            if rank > registers.get(index, 0):
+                registers[index] = rank
+
+            registers = by_second.get(timestamp)
+            if registers is None:
+                registers = by_second[timestamp] = dict()
+            if rank > registers.get(index, 0):
+                registers[index] = rank
+
+        windows = self._unique_windows.values()
+        for (timestamp, section_id), registers in by_section.items():
+            section = batch.sections.get_value(section_id)
+            for window in windows:
+                window.add_registers(timestamp, section, registers)
+        for timestamp, registers in by_second.items():
+            for window in windows:
+                window.add_registers(timestamp, None, registers)
+
+    def _expire_windows(self):
+        now = self._clock.now()
+        for window in self._windows.values():
+            window.expire(now)
+        for window in self._unique_windows.values():
+            window.expire(now)
+
+    def _new_section_hit(self, section, new_hits=1):
         with self._lock:
-            for i, (s, v) in enumerate(self._section_hits):
-                if s == section:
-                    index = i
-                    hits = v + 1
-                    self._section_hits[i] = (section, hits)
-                    break
-
-            if index is not None:
-                # This is a kind of very fast bubble sort on update
-                i = index
-                while i > 0:
-                    (s, v) = self._section_hits[i - 1]
-                    if v < hits:
-                        # Classic swap
-                        self._section_hits[i - 1] = (section, hits)
-                        self._section_hits[i] = (s, v)
-                    i -= 1
+            if self._max_sections:
+                self._section_hits.add(section, new_hits)
             else:
-                self._section_hits.append((section, 1))
-
-                self.update()
+                self._section_hits[section] += new_hits
+            if self._current_top:
+                self._current_top = dict()
 
     def _drop_list(self):
         with self._lock:
-            self._last_ranking = self._section_hits
-            self._section_hits = list()
+            self._last_section_hits = self._section_hits
+            self._last_top = dict()
+            self._section_hits = self._new_counter()
+            self._current_top = dict()
 
         self.update()
 
     def stop_monitoring(self):
         self._keeponrunning = False
 
+    def tick(self):
+        """
+        Periodic work, done every update_interval seconds by run (or by the
+        owner of the monitor when it isn't started as a thread).
+        """
+        with self._lock:
+            self._expire_windows()
+        if self._update_interval > 0:
+            self._drop_list()
+
     def run(self):
         if self._update_interval > 0:
             while self._keeponrunning:
                 time.sleep(self._update_interval)
-                self._drop_list()
+                self.tick()
+
+    def _get_update_interval(self):
+        return self._update_interval
+
+    update_interval = property(_get_update_interval, None)
+
+    @staticmethod
+    def _get_top_n(section_hits, cache, n):
+        top = cache.get(n)
+        if top is None:
+            top = section_hits.most_common(n)
+            cache[n] = top
+        return top
 
     def get_last_top_n(self, n):
-        return self._last_ranking[0:min(n, len(self._last_ranking))]
+        with self._lock:
+            return list(self._get_top_n(self._last_section_hits,
+                                        self._last_top, n))
 
     def _get_ranking(self):
-        return self._last_ranking
+        with self._lock:
+            return self._last_section_hits.most_common()
 
     ranking = property(_get_ranking, None)
 
+    def get_window_top_n(self, duration, n, with_visitors=False):
+        """
+        Returns the n most visited sections of the last duration seconds
+        (one of the durations of the windows) as a list of (section, hits),
+        or of (section, hits, unique visitors) if with_visitors is True.
+        """
+        with self._lock:
+            self._expire_windows()
+            top = self._windows[duration].most_common(n)
+            if not with_visitors:
+                return list(top)
+
+            uniques = self._unique_windows.get(duration)
+            return [(section, hits,
+                     uniques.count(section) if uniques is not None else None)
+                    for section, hits in top]
+
+    def get_window_visitors(self, duration, section=None):
+        """
+        Returns the estimated number of unique visitors of the section (of
+        the whole site if None) in the last duration seconds, or None if
+        they are not counted.
+        """
+        with self._lock:
+            self._expire_windows()
+            uniques = self._unique_windows.get(duration)
+            return uniques.count(section) if uniques is not None else None
+
+    def _get_window_durations(self):
+        return sorted(self._windows)
+
+    window_durations = property(_get_window_durations, None)
+
     def get_current_top_n(self, n):
-        return self._section_hits[0:min(n, len(self._section_hits))]
+        with self._lock:
+            return list(self._get_top_n(self._section_hits,
+                                        self._current_top, n))
 
     def _get_section_hits(self):
-        return self._section_hits
+        with self._lock:
+            return self._section_hits.most_common()
 
     session_hits = property(_get_section_hits, None)
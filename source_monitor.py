@@ -0,0 +1,122 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Thread, RLock
+
+from request_monitor import RequestMonitor
+
+
+class SourceMonitor(Thread):
+    """
+    Keeps a separate set of monitors for every source (log file, i.e. vhost)
+    : the requests are grouped by their source attribute and dispatched to
+    the RequestMonitor of their source, created on the first request.
+
+    The monitors of the sources are not started as threads (there would be
+    three threads per vhost), this thread calls their tick method every
+    update_interval seconds instead.
+    """
+
+    def __init__(self, make_monitors, tick_interval=1):
+        """
+        make_monitors : a function returning a new dict of monitors (name ->
+        monitor, 'stats' -> StatsMonitor for instance) for a new source
+        tick_interval : the resolution, in seconds, of the periodic updates
+        """
+        Thread.__init__(self)
+
+        self._make_monitors = make_monitors
+        self._tick_interval = tick_interval
+
+        # source -> (dict of monitors, RequestMonitor)
+        self._sources = dict()
+        # (monitor, next tick) for every monitor with a periodic update
+        self._schedule = list()
+
+        self._keeponrunning = True
+        self._lock = RLock()
+
+    def _get_request_monitor(self, source):
+        entry = self._sources.get(source)
+        if entry is not None:
+            return entry[1]
+
+        with self._lock:
+            monitors = self._make_monitors()
+            request_monitor = RequestMonitor(submonitors=
+                                             list(monitors.values()))
+            self._sources[source] = (monitors, request_monitor)
+
+            now = time.monotonic()
+            for monitor in monitors.values():
+                if getattr(monitor, 'update_interval', 0) > 0:
+                    self._schedule.append(
+                        [monitor, now + monitor.update_interval])
+
+        return request_monitor
+
+    def add_request(self, request):
+        self._get_request_monitor(request.source).add_request(request)
+
+    def add_requests(self, batch):
+        """
+        Splits the batch by source. A batch read by a LogReader comes from a
+        single file, so there is usually only one group.
+        """
+        if not batch:
+            return
+
+        source = batch[0].source
+        if batch[-1].source == source and \
+                all(r.source == source for r in batch):
+            self._get_request_monitor(source).add_requests(batch)
+            return
+
+        groups = dict()
+        for request in batch:
+            groups.setdefault(request.source, list()).append(request)
+        for source, requests in groups.items():
+            self._get_request_monitor(source).add_requests(requests)
+
+    def tick(self):
+        """
+        Calls the tick method of the monitors whose update interval has
+        elapsed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            schedule = list(self._schedule)
+
+        for entry in schedule:
+            monitor, next_tick = entry
+            if now >= next_tick:
+                monitor.tick()
+                entry[1] = now + monitor.update_interval
+
+    def stop_monitoring(self):
+        self._keeponrunning = False
+
+    def run(self):
+        while self._keeponrunning:
+            time.sleep(self._tick_interval)
+            self.tick()
+
+    def _get_update_interval(self):
+        return self._tick_interval
+
+    update_interval = property(_get_update_interval, None)
+
+    def get_monitor(self, source, name):
+        """
+        Returns the monitor named name (see make_monitors) of the source, or
+        None if no request has been read from this source yet.
+        """
+        entry = self._sources.get(source)
+        return entry[0][name] if entry is not None else None
+
+    def _get_sources(self):
+        with self._lock:
+            return sorted(self._sources, key=str)
+
+    sources = property(_get_sources, None)
@@ -7,12 +7,36 @@ import time
 from threading import Thread, RLock
 
 import observer
-from request_monitor import Request
+from event_clock import make_clock
+from histogram import LogHistogram
+from rolling_window import RollingWindow, DEFAULT_WINDOWS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PERCENTS = (50, 95, 99)
 
 
 class StatsMonitor(observer.Observable, Thread):
+    """
+    Counts the requests and computes the average number of requests per
+    minute since the monitor has been started.
+
+    In event-time mode, the duration is measured with the timestamps of the
+    requests (from the first request to the most recent one) instead of the
+    system clock, and the statistics are recomputed as requests are added.
+
+    The traffic is also aggregated over sliding windows (10 s, 1 min, 5 min
+    and 1 h by default) : request rate, bandwidth and percentiles of the
+    response sizes and times, see get_window_stats. Each window is made of
+    buckets of TrafficStats (counts and histograms), nothing has to be
+    rescanned to answer a query.
+    """
 
-    def __init__(self, update_interval=1):
+    def __init__(self, update_interval=1, event_time=False,
+                 allowed_lateness=10, windows=DEFAULT_WINDOWS):
         observer.Observable.__init__(self)
         Thread.__init__(self)
 
@@ -25,22 +49,142 @@ class StatsMonitor(observer.Observable, Thread):
         self._starting_datetime = datetime.now()
         self._lock = RLock()
 
+        self._clock = make_clock(event_time, allowed_lateness)
+        self._first_timestamp = None
+
+        self._bytes_sent = 0
+        # duration -> RollingStats
+        self._windows = dict((duration, RollingStats(duration, width))
+                             for duration, width in windows)
+        self._window_start = None
+
     def add_request(self, request):
         """
         Increments the request count.
         """
-        assert isinstance(request, Request)
-
         self._request_count += 1
+        self._bytes_sent += request.bytes_sent
 
         if request.is_successful:
             self._successful_req_count += 1
 
-        self.update()
+        if self._windows:
+            traffic = TrafficStats()
+            traffic.add_request(request)
+            self._add_traffic({request.timestamp: traffic})
+
+        if self._clock.event_time:
+            self._observe(request.timestamp, request.timestamp)
+        else:
+            self.update()
+
+    def add_batch(self, batch):
+        """
+        Same as add_request for a whole request_batch.RequestBatch.
+        """
+        self._request_count += batch.count
+        self._bytes_sent += batch.total_bytes()
+        self._successful_req_count += batch.successful_count()
+
+        if self._windows:
+            # The columns are aggregated second by second first, every
+            # window then merges the aggregates into its buckets
+            columns = [batch.bytes_sent]
+            if batch.response_times is not None:
+                columns.append(batch.response_times)
+
+            traffic_by_second = dict()
+            for timestamp, values in batch.timestamp_groups(*columns):
+                traffic = TrafficStats()
+                traffic.add_values(*values)
+                traffic_by_second[timestamp] = traffic
+            self._add_traffic(traffic_by_second)
+
+        if self._clock.event_time:
+            timestamps = batch.timestamps
+            self._observe(min(timestamps), max(timestamps))
+        else:
+            self.update()
+
+    def _add_traffic(self, traffic_by_second):
+        with self._lock:
+            first = min(traffic_by_second)
+            if self._window_start is None or first < self._window_start:
+                self._window_start = first
+            self._clock.observe(max(traffic_by_second))
+            now = self._clock.now()
+
+            for window in self._windows.values():
+                window.expire(now)
+                for timestamp, traffic in traffic_by_second.items():
+                    window.add(timestamp, traffic)
+
+    def get_window_stats(self, duration):
+        """
+        Returns the statistics of the last duration seconds (one of the
+        durations of the windows) as a dict : request_count, request_rate
+        (per second), bytes_sent, bandwidth (bytes per second),
+        size_percentiles (bytes) and response_time_percentiles (seconds,
+        None if the log format doesn't have them), the percentiles being
+        dicts percent -> value.
+        """
+        with self._lock:
+            window = self._windows[duration]
+            window.expire(self._clock.now())
+            totals = window.totals
+
+            # The rates are computed over the time we have been watching if
+            # it is shorter than the window
+            span = duration
+            if self._window_start is not None:
+                end = self.current_time
+                span = max(1, min(duration, end + 1 - self._window_start))
+
+            return {'duration': duration,
+                    'request_count': totals.request_count,
+                    'request_rate': totals.request_count / span,
+                    'bytes_sent': totals.bytes_sent,
+                    'bandwidth': totals.bytes_sent / span,
+                    'size_percentiles': totals.sizes.percentiles(PERCENTS),
+                    'response_time_percentiles':
+                    totals.response_times.percentiles(PERCENTS)}
+
+    def _get_current_time(self):
+        """
+        The current time of the monitor (epoch timestamp) : the system time
+        or, in event-time mode, the most recent timestamp of the log (None
+        until a request has been seen).
+        """
+        if self._clock.event_time:
+            return self._clock.max_timestamp
+        return self._clock.now()
+
+    current_time = property(_get_current_time, None)
+
+    def _get_window_durations(self):
+        return sorted(self._windows)
+
+    window_durations = property(_get_window_durations, None)
+
+    def _observe(self, first, last):
+        if self._first_timestamp is None or first < self._first_timestamp:
+            self._first_timestamp = first
+            self._starting_datetime = datetime.fromtimestamp(first)
+        self._clock.observe(last)
+
+        self._update_stats()
 
     def _update_stats(self):
-        timedelta = (datetime.now() - self._starting_datetime)\
-            .total_seconds()
+        if self._clock.event_time:
+            now = self._clock.max_timestamp
+            if now is None:
+                return
+            # A request logged during second s covers [s, s + 1[
+            timedelta = max(0, now + 1 - self._first_timestamp)
+        else:
+            timedelta = (datetime.now() - self._starting_datetime)\
+                .total_seconds()
+
         if timedelta != 0:
             with self._lock:
                 self._av_reqs_per_minute = (self._request_count) / \
@@ -50,10 +194,23 @@ class StatsMonitor(observer.Observable, Thread):
     def stop_monitoring(self):
         self._keeponrunning = False
 
+    def tick(self):
+        """
+        Periodic work, done every update_interval seconds by run (or by the
+        owner of the monitor when it isn't started as a thread).
+        """
+        if not self._clock.event_time:
+            self._update_stats()
+
     def run(self):
         while self._keeponrunning:
             time.sleep(self._update_interval)
-            self._update_stats()
+            self.tick()
+
+    def _get_update_interval(self):
+        return self._update_interval
+
+    update_interval = property(_get_update_interval, None)
 
     def _get_request_count(self):
         return self._request_count
@@ -70,6 +227,11 @@ class StatsMonitor(observer.Observable, Thread):
 
     starting_datetime = property(_get_starting_datetime, None)
 
+    def _get_bytes_sent(self):
+        return self._bytes_sent
+
+    bytes_sent = property(_get_bytes_sent, None)
+
     def _get_successful_req_count(self):
         return self._successful_req_count
 
@@ -87,3 +249,91 @@ class StatsMonitor(observer.Observable, Thread):
         return self._successful_req_count / self._request_count
 
     success_ratio = property(_get_success_ratio, None)
+
+
+class TrafficStats:
+    """
+    Aggregate of a set of requests : number of requests, bytes sent and
+    histograms of the response sizes and times. Aggregates can be added to
+    and subtracted from each other.
+    """
+
+    def __init__(self):
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.sizes = LogHistogram()
+        # Recorded in microseconds, given in seconds
+        self.response_times = LogHistogram(1000000)
+
+    def add_request(self, request):
+        self.request_count += 1
+        self.bytes_sent += request.bytes_sent
+        self.sizes.record(request.bytes_sent)
+        if request.response_time is not None:
+            self.response_times.record(request.response_time)
+
+    def add_requests(self, requests):
+        self.add_values([request.bytes_sent for request in requests],
+                        [request.response_time for request in requests
+                         if request.response_time is not None])
+
+    def add_values(self, sizes, times=None):
+        """
+        Adds requests given by their sizes and response times (lists or
+        numpy arrays, the unknown times being left out or NaN).
+        """
+        is_array = numpy is not None and isinstance(sizes, numpy.ndarray)
+        self.request_count += len(sizes)
+        self.bytes_sent += int(sizes.sum()) if is_array else sum(sizes)
+        self.sizes.record_values(sizes)
+
+        if times is not None:
+            # NaN is the only value which isn't equal to itself
+            times = times[times == times] if is_array else \
+                [t for t in times if t == t]
+            if len(times):
+                self.response_times.record_values(times)
+
+    def add(self, other):
+        self.request_count += other.request_count
+        self.bytes_sent += other.bytes_sent
+        self.sizes.add(other.sizes)
+        self.response_times.add(other.response_times)
+
+    def subtract(self, other):
+        self.request_count -= other.request_count
+        self.bytes_sent -= other.bytes_sent
+        self.sizes.subtract(other.sizes)
+        self.response_times.subtract(other.response_times)
+
+
+class RollingStats(RollingWindow):
+    """
+    TrafficStats of a sliding window, the totals being updated as the
+    buckets are filled and expired.
+    """
+
+    def __init__(self, duration, bucket_width=1):
+        RollingWindow.__init__(self, duration, bucket_width, TrafficStats)
+        self._totals = TrafficStats()
+
+    def add(self, timestamp, traffic):
+        """
+        Adds the TrafficStats of the requests of the second timestamp.
+        Returns False if it is too old for the window.
+        """
+        bucket = self.get_bucket(timestamp)
+        if bucket is None:
+            return False
+
+        bucket.add(traffic)
+        self._totals.add(traffic)
+        return True
+
+    def _expire_bucket(self, bucket):
+        self._totals.subtract(bucket)
+
+    def _get_totals(self):
+        return self._totals
+
+    totals = property(_get_totals, None)
@@ -0,0 +1,114 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from async_runtime import AsyncRuntime
+from log_reader import LogReader
+
+
+class RequestCollector:
+    def __init__(self):
+        self.requests = list()
+
+    def add_requests(self, requests):
+        self.requests.extend(requests)
+
+
+class CrashingCollector:
+    def __init__(self):
+        self.calls = 0
+
+    def add_requests(self, requests):
+        self.calls += 1
+        if self.calls == 2:
+            raise RuntimeError('crash')
+
+
+class TickCounter:
+    update_interval = 0.05
+
+    def __init__(self):
+        self.ticks = 0
+
+    def tick(self):
+        self.ticks += 1
+
+
+class AsyncRuntimeTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self._filename = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self._filename)
+
+    def test_run_and_stop(self):
+        """
+        Tests that the lines written to the log go through the pipeline,
+        that the timers tick and that the runtime stops right away.
+        """
+        collector = RequestCollector()
+        counter = TickCounter()
+        reader = LogReader(self._filename, None, timeout=10)
+        runtime = AsyncRuntime(reader,
+                               lambda lines, source: [l.upper()
+                                                      for l in lines],
+                               collector, [counter], timeout=10)
+
+        async def scenario():
+            task = asyncio.ensure_future(runtime.run(handle_signals=False))
+            await asyncio.sleep(0.05)
+            with open(self._filename, 'a') as log_file:
+                log_file.write('line 1\nline 2\n')
+            await asyncio.sleep(0.2)
+
+            start = time.monotonic()
+            runtime.stop()
+            await task
+            return time.monotonic() - start
+
+        stop_duration = asyncio.run(scenario())
+
+        self.assertEqual(collector.requests, ['LINE 1', 'LINE 2'])
+        self.assertGreater(counter.ticks, 0)
+        self.assertLess(stop_duration, 1)
+
+    def test_checkpoint_after_crash(self):
+        """
+        Tests that the checkpoint is the end of the chunks aggregated, not
+        the position of the reader (which is ahead), even after a crash.
+        """
+        checkpoint_file = self._filename + '.state'
+        reader = LogReader(self._filename, None, timeout=10,
+                           chunk_size=1000, checkpoint_file=checkpoint_file,
+                           checkpoint_interval=0)
+        runtime = AsyncRuntime(reader, lambda lines, source: lines,
+                               CrashingCollector(), [], timeout=0.05)
+
+        async def scenario():
+            task = asyncio.ensure_future(runtime.run(handle_signals=False))
+            await asyncio.sleep(0.05)
+            with open(self._filename, 'a') as log_file:
+                log_file.write(''.join('line {0:04}\n'.format(i)
+                                       for i in range(2000)))
+            await task
+
+        try:
+            with self.assertRaises(RuntimeError):
+                asyncio.run(scenario())
+            with open(checkpoint_file) as state_file:
+                # Only the first chunk (100 lines) has been aggregated
+                self.assertEqual(json.load(state_file)['offset'], 1000)
+        finally:
+            os.remove(checkpoint_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
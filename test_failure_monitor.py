@@ -0,0 +1,86 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from failure_monitor import FailureMonitor
+from request_batch import RequestBatch
+from request_monitor import Request
+
+
+class UpdateCounter:
+    def __init__(self):
+        self.calls = 0
+
+    def on_failure_change(self):
+        self.calls += 1
+
+
+class FailureMonitorTest(unittest.TestCase):
+
+    def _request(self, url, timestamp, status):
+        return Request(url, timestamp, 'GET', '127.0.0.1', status,
+                       'HTTP/1.1', '-', '-', 100)
+
+    def test_top_failures(self):
+        """
+        Tests the rankings per code and per class, and that a scan of
+        distinct URLs doesn't grow the sketches beyond their capacity.
+        """
+        failure_monitor = FailureMonitor(10, capacity=5,
+                                         windows=((10, 1), (60, 5)),
+                                         spike_window=10, baseline_window=60,
+                                         event_time=True, allowed_lateness=0)
+        requests = [self._request('/scan/{0}'.format(i), 1000, 404)
+                    for i in range(100)]
+        requests += [self._request('/missing?id=3', 1001, 404)] * 50
+        requests += [self._request('/api', 1002, 500)] * 3
+        requests += [self._request('/api', 1002, 503)] * 2
+        requests += [self._request('/ok', 1002, 200)] * 10
+        failure_monitor.add_batch(RequestBatch(requests))
+        failure_monitor.add_request(self._request('/api', 1020, 500))
+
+        self.assertEqual(failure_monitor.failure_count, 156)
+        self.assertEqual(failure_monitor.get_top_failures(60, 1, 404)[0][0],
+                         '/missing')
+        self.assertEqual(failure_monitor.get_top_failures(60, 2, 5),
+                         [('/api', 6)])
+        self.assertEqual(failure_monitor.get_top_failures(10, 5),
+                         [('/api', 1)])
+        self.assertEqual(failure_monitor.get_failure_counts(60),
+                         [(404, 150), (500, 4), (503, 2)])
+        buckets = failure_monitor._route_windows[60].get_buckets()
+        self.assertTrue(all(len(sketch) <= 5 for bucket in buckets
+                            for sketch in bucket.values()))
+
+    def test_spikes(self):
+        """
+        Tests that a route failing much more than usual is reported, and
+        not a route failing as much as usual.
+        """
+        failure_monitor = FailureMonitor(10, windows=((10, 1), (60, 5)),
+                                         spike_window=10, baseline_window=60,
+                                         min_spike_failures=5,
+                                         event_time=True, allowed_lateness=0)
+        counter = UpdateCounter()
+        failure_monitor.add_observer(counter, 'failure_change')
+
+        for timestamp in range(1000, 1060):
+            failure_monitor.add_request(self._request('/steady', timestamp,
+                                                      404))
+            if timestamp >= 1050:
+                for i in range(5):
+                    failure_monitor.add_request(self._request('/broken',
+                                                              timestamp,
+                                                              502))
+        failure_monitor.tick()
+
+        self.assertEqual([spike[0] for spike in failure_monitor.spikes],
+                         ['/broken'])
+        self.assertEqual(counter.calls, 1)
+        failure_monitor.tick()
+        self.assertEqual(counter.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
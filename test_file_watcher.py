@@ -0,0 +1,92 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import file_watcher
+from file_watcher import InotifyWatcher
+
+
+@unittest.skipIf(file_watcher._libc is None, 'inotify is not available')
+class InotifyWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._filename = os.path.join(self._directory, 'access_log')
+        self._other = os.path.join(self._directory, 'other_log')
+        for filename in (self._filename, self._other):
+            open(filename, 'w').close()
+        self._watcher = InotifyWatcher(self._filename, timeout=5)
+
+    def tearDown(self):
+        self._watcher.close()
+        shutil.rmtree(self._directory)
+
+    def _wait(self):
+        """
+        Returns the result of wait() and the time it took.
+        """
+        start = time.monotonic()
+        changed = self._watcher.wait()
+        return changed, time.monotonic() - start
+
+    def test_write(self):
+        """
+        Tests that an append to the watched file wakes the watcher up right
+        away, and that the file is then reported as changed (only once).
+        """
+        with open(self._filename, 'a') as log_file:
+            log_file.write('new line\n')
+
+        changed, duration = self._wait()
+        self.assertTrue(changed)
+        self.assertLess(duration, 1)
+        self.assertEqual(self._watcher.pop_changed(), {self._filename})
+        self.assertEqual(self._watcher.pop_changed(), set())
+
+    def test_timeout(self):
+        """
+        Tests that wait() returns False after the timeout when nothing has
+        changed, and that the events of the other files of the directory
+        don't wake it up.
+        """
+        with open(self._other, 'a') as log_file:
+            log_file.write('not watched\n')
+
+        start = time.monotonic()
+        self.assertFalse(self._watcher.wait(0.2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(self._watcher.pop_changed(), set())
+
+        # A timeout of 0 only collects the pending events
+        self.assertFalse(self._watcher.wait(0))
+
+    def test_rotation(self):
+        """
+        Tests that the events of a log rotation (the file is moved away and
+        a new one is created with the same name) are reported.
+        """
+        os.rename(self._filename, self._filename + '.1')
+        changed, duration = self._wait()
+        self.assertTrue(changed)
+        self.assertLess(duration, 1)
+        self.assertEqual(self._watcher.pop_changed(), {self._filename})
+
+        open(self._filename, 'w').close()
+        changed, duration = self._wait()
+        self.assertTrue(changed)
+        self.assertLess(duration, 1)
+        self.assertEqual(self._watcher.pop_changed(), {self._filename})
+
+        # And when a new file is moved in its place
+        os.rename(self._other, self._filename)
+        self.assertTrue(self._wait()[0])
+        self.assertEqual(self._watcher.pop_changed(), {self._filename})
+
+
+if __name__ == '__main__':
+    unittest.main()
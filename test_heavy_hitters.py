@@ -0,0 +1,40 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+from heavy_hitters import SpaceSaving
+
+
+class SpaceSavingTest(unittest.TestCase):
+
+    def test_heavy_hitters(self):
+        """
+        Tests that the frequent keys are found (with counts within the error
+        bounds) among many rare keys, in bounded memory.
+        """
+        sketch = SpaceSaving(50)
+        generator = random.Random(42)
+        exact = dict()
+        for i in range(20000):
+            if generator.random() < 0.3:
+                key = 'hot{0}'.format(generator.randint(0, 4))
+            else:
+                key = 'cold{0}'.format(generator.randint(0, 5000))
+            exact[key] = exact.get(key, 0) + 1
+            sketch.add(key)
+
+        self.assertEqual(len(sketch), 50)
+        self.assertEqual(sketch.total, 20000)
+
+        top = sketch.most_common(5)
+        self.assertEqual(sorted(key for key, count in top),
+                         ['hot0', 'hot1', 'hot2', 'hot3', 'hot4'])
+        for key, count in top:
+            self.assertGreaterEqual(count, exact[key])
+            self.assertLessEqual(count - sketch.get_error(key), exact[key])
+
+
+if __name__ == '__main__':
+    unittest.main()
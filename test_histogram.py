@@ -0,0 +1,64 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+import histogram
+from histogram import LogHistogram, bucket_index, bucket_value
+
+
+class LogHistogramTest(unittest.TestCase):
+
+    def test_buckets(self):
+        """
+        Tests that the buckets are contiguous and that a value is never far
+        from the value of its bucket.
+        """
+        previous = -1
+        for value in range(0, 100000):
+            index = bucket_index(value)
+            self.assertIn(index, (previous, previous + 1))
+            previous = index
+            self.assertLessEqual(abs(bucket_value(index) - value),
+                                 value * 0.032)
+
+    @unittest.skipIf(histogram.numpy is None, 'numpy is not installed')
+    def test_bucket_indexes(self):
+        numpy = histogram.numpy
+        generator = random.Random(2)
+        values = list(range(200)) + [generator.randrange(2 ** 50)
+                                     for i in range(10000)]
+        self.assertEqual(histogram.bucket_indexes(
+            numpy.array(values, dtype=numpy.int64)).tolist(),
+            [bucket_index(value) for value in values])
+
+    def test_percentiles(self):
+        """
+        Tests the percentiles against the exact ones and that a histogram
+        subtracted from another one is forgotten.
+        """
+        generator = random.Random(1)
+        values = [generator.expovariate(10) for i in range(10000)]
+        histogram = LogHistogram(1000000)
+        for value in values:
+            histogram.record(value)
+
+        values.sort()
+        percentiles = histogram.percentiles([50, 95, 99])
+        for percent in (50, 95, 99):
+            exact = values[int(percent / 100 * len(values)) - 1]
+            self.assertAlmostEqual(percentiles[percent], exact,
+                                   delta=exact * 0.04)
+
+        other = LogHistogram(1000000)
+        other.record(100)
+        histogram.add(other)
+        self.assertAlmostEqual(histogram.percentile(100), 100, delta=4)
+        histogram.subtract(other)
+        self.assertEqual(histogram.count, 10000)
+        self.assertLess(histogram.percentile(100), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from main_monitor import MainMonitor
+
+
+class HttpApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self._main_monitor = MainMonitor(None, gui=False, http_port=0)
+        self._http_api = self._main_monitor.http_api
+        self._http_api.start()
+
+    def tearDown(self):
+        self._http_api.stop_monitoring()
+        self._http_api.join()
+
+    def _get(self, path):
+        host, port = self._http_api.server_address
+        with urlopen('http://{0}:{1}{2}'.format(host, port, path)) as reply:
+            return reply.headers['Content-Type'], reply.read().decode()
+
+    def test_snapshot(self):
+        """
+        Tests that the responses come from the snapshot : the new requests
+        only show up after a tick.
+        """
+        date = time.strftime('%d/%b/%Y:%H:%M:%S +0000', time.gmtime())
+        lines = ['127.0.0.1 - - [{0}] "GET {1} HTTP/1.1" {2} 100'.format(
+            date, url, status) for url, status in
+            [('/a/1', 200), ('/a/2', 200), ('/b', 404)]]
+        self._main_monitor.add_requests(lines)
+
+        self.assertEqual(json.loads(self._get('/stats')[1])['request_count'],
+                         0)
+        self._http_api.tick()
+
+        stats = json.loads(self._get('/stats')[1])
+        self.assertEqual(stats['request_count'], 3)
+        self.assertEqual(stats['failed_request_count'], 1)
+        sections = json.loads(self._get('/sections/')[1])
+        self.assertEqual(sections['windows'][0]['sections'][0],
+                         {'section': 'a', 'hits': 2, 'visitors': 1})
+        failures = json.loads(self._get('/failures')[1])
+        self.assertEqual(failures['windows'][0]['routes'],
+                         [{'route': '/b', 'failures': 1}])
+
+        content_type, metrics = self._get('/metrics')
+        self.assertTrue(content_type.startswith('text/plain'))
+        self.assertIn('log_monitor_requests_total{result="success"} 2',
+                      metrics.splitlines())
+        self.assertIn('log_monitor_window_section_hits{window="10",'
+                      'section="a"} 2', metrics.splitlines())
+
+        # No database, no history
+        with self.assertRaises(HTTPError) as context:
+            self._get('/history')
+        self.assertEqual(context.exception.code, 404)
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_event_time(self):
+        """
+        Tests that in event-time mode, /history covers the last hour of the
+        log, not the last hour of the system clock.
+        """
+        main_monitor = MainMonitor(None, gui=False, event_time=True,
+                                   db_file=os.path.join(self._directory,
+                                                        'rollups.db'),
+                                   http_port=0)
+        http_api = main_monitor.http_api
+        http_api.start()
+        try:
+            main_monitor.add_requests([
+                '127.0.0.1 - - [10/Oct/2000:{0}:{1:02d}:00 +0000] '
+                '"GET /a HTTP/1.1" 200 100'.format(13 + minute // 60,
+                                                   minute % 60)
+                for minute in range(0, 90, 10)])
+            main_monitor.rollup_store.flush()
+            http_api.tick()
+
+            history = json.loads(http_api.snapshot.get_response(
+                '/history')[1].decode())
+        finally:
+            http_api.stop_monitoring()
+            http_api.join()
+            main_monitor.rollup_store.close()
+
+        # 13:20 to 14:20
+        self.assertEqual([row['requests'] for row in history['traffic']],
+                         [1] * 7)
+        self.assertEqual(history['sections'], [{'section': 'a', 'hits': 7}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from hyperloglog import HyperLogLog, hash_value
+from rolling_window import RollingUniques
+
+
+class HyperLogLogTest(unittest.TestCase):
+
+    def test_count_and_merge(self):
+        """
+        Tests the estimates (sparse and dense registers) and that merging
+        two sketches counts the union of their values.
+        """
+        for count in (50, 20000):
+            first = HyperLogLog()
+            second = HyperLogLog()
+            for i in range(count):
+                first.add('10.0.0.{0}'.format(i))
+                # Half of the values are common to both sketches
+                second.add('10.0.0.{0}'.format(i + count // 2))
+
+            self.assertAlmostEqual(first.count(), count, delta=count * 0.1)
+            first.merge(second)
+            self.assertAlmostEqual(first.count(), count * 1.5,
+                                   delta=count * 0.15)
+
+    def test_rolling(self):
+        """
+        Tests that the visitors of the expired buckets are forgotten.
+        """
+        window = RollingUniques(10, 5)
+        for i in range(100):
+            window.add(100, 'a', hash_value('old {0}'.format(i)))
+        for i in range(10):
+            window.add(106, 'a', hash_value('new {0}'.format(i)))
+            window.add(107, 'a', hash_value('new {0}'.format(i)))
+        window.expire(108)
+        self.assertAlmostEqual(window.count('a'), 110, delta=6)
+        window.expire(115)
+        self.assertEqual(window.count('a'), 10)
+        self.assertEqual(window.count('b'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
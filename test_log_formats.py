@@ -0,0 +1,107 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from log_formats import make_parser
+
+
+class LogFormatsTest(unittest.TestCase):
+
+    def test_combined(self):
+        parser = make_parser('combined')
+        request = parser.parseline('127.0.0.1 - frank \
+[10/Oct/2000:13:55:36 -0700] "GET /apache_pb.gif HTTP/1.0" 200 2326 \
+"http://www.example.com/start.html" "Mozilla/4.08 [en] (Win98; I ;Nav)"')
+
+        self.assertEqual(request.section, 'apache_pb.gif')
+        self.assertEqual(request.status, 200)
+        self.assertEqual(request.bytes_sent, 2326)
+        self.assertEqual(request.referer, 'http://www.example.com/start.html')
+        self.assertEqual(request.user_agent,
+                         'Mozilla/4.08 [en] (Win98; I ;Nav)')
+        self.assertIsNone(request.response_time)
+
+    def test_escaped_quotes(self):
+        """
+        Tests that the escaped quotes of a quoted field don't end it, and
+        that a line with more fields than the format is invalid.
+        """
+        parser = make_parser('combined')
+        line = '127.0.0.1 - - [10/Oct/2000:13:55:36 -0700] "GET / HTTP/1.0" \
+200 12 "-" "Mozilla/5.0 \\"quoted\\" (X11)"'
+        request = parser.parseline(line)
+
+        self.assertEqual(request.user_agent,
+                         'Mozilla/5.0 \\"quoted\\" (X11)')
+        self.assertEqual(parser.parse_buffer(memoryview(line.encode()))[10],
+                         request.user_agent)
+        with self.assertRaises(ValueError):
+            parser.parseline(line + ' "extra"')
+
+    def test_missing_client(self):
+        """
+        Tests that a client address missing from the format is logged as
+        '-', like the other fields.
+        """
+        request = make_parser('%t "%r" %>s %b').parseline(
+            '[10/Oct/2000:13:55:36 +0000] "GET /a HTTP/1.1" 200 10')
+        self.assertEqual(request.remote_addr, '-')
+
+        request = make_parser('json').parseline(
+            '{"time_local": "10/Oct/2000:13:55:36 +0000"}')
+        self.assertEqual(request.remote_addr, '-')
+
+    def test_format_without_date(self):
+        with self.assertRaises(ValueError):
+            make_parser('%h "%r" %>s %b')
+
+    def test_custom_apache_format(self):
+        parser = make_parser('%h %l %u %t "%r" %>s %b %D')
+        request = parser.parseline('10.0.0.1 - - [10/Oct/2000:13:55:36 \
++0000] "POST /api/v1 HTTP/1.1" 500 - 250000')
+
+        self.assertEqual(request.method, 'POST')
+        self.assertEqual(request.status, 500)
+        self.assertEqual(request.bytes_sent, 0)
+        self.assertEqual(request.response_time, 0.25)
+
+    def test_nginx(self):
+        parser = make_parser('$remote_addr - $remote_user [$time_local] \
+"$request" $status $body_bytes_sent "$http_referer" "$http_user_agent" \
+$request_time')
+        request = parser.parseline('10.0.0.2 - bob [10/Oct/2000:13:55:36 \
++0000] "GET /blog/a HTTP/1.1" 404 12 "-" "curl/7.68.0" 0.004')
+
+        self.assertEqual(request.remote_username, 'bob')
+        self.assertEqual(request.section, 'blog')
+        self.assertEqual(request.user_agent, 'curl/7.68.0')
+        self.assertEqual(request.response_time, 0.004)
+
+    def test_json(self):
+        parser = make_parser('json:{"date": "time"}')
+        request = parser.parseline('{"remote_addr": "10.0.0.3", \
+"time": "2000-10-10T13:55:36+00:00", "request": "GET /shop/cart HTTP/2.0", \
+"status": 302, "body_bytes_sent": "0", "request_time": "0.010"}')
+
+        self.assertEqual(request.remote_addr, '10.0.0.3')
+        self.assertEqual(request.section, 'shop')
+        self.assertEqual(request.status, 302)
+        self.assertEqual(request.protocol, 'HTTP/2.0')
+        self.assertEqual(request.response_time, 0.01)
+
+    def test_json_invalid(self):
+        """
+        Tests that the valid JSON lines which aren't requests are invalid
+        lines (ValueError), so the batch parsers skip them.
+        """
+        parser = make_parser('json')
+        for line in ('[1, 2]', '12', '{"status": 200, "request": '
+                                      '"GET / HTTP/1.1"}'):
+            with self.assertRaises(ValueError):
+                parser.parseline(line)
+
+        batch = parser.parse_batch(['[1, 2]', '{"time_local": '
+                                    '"10/Oct/2000:13:55:36 +0000"}'])
+        self.assertEqual(batch.count, 1)
+        self.assertEqual(batch.invalid_count, 1)
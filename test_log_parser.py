@@ -0,0 +1,91 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime, timezone
+
+from log_parser import ApacheLogParser
+from parallel_parser import ParallelParser
+
+
+class ApacheLogParserTest(unittest.TestCase):
+
+    LINE = '127.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] \
+"GET /apache_pb.gif?a=b HTTP/1.0" 200 2326'
+
+    def test_parseline(self):
+        request = ApacheLogParser().parseline(ApacheLogParserTest.LINE)
+
+        self.assertEqual(request.remote_addr, '127.0.0.1')
+        self.assertEqual(request.client_identity, '-')
+        self.assertEqual(request.remote_username, 'frank')
+        self.assertEqual(request.method, 'GET')
+        self.assertEqual(request.url, '/apache_pb.gif?a=b')
+        self.assertEqual(request.protocol, 'HTTP/1.0')
+        self.assertEqual(request.status, 200)
+        self.assertEqual(request.bytes_sent, 2326)
+        self.assertEqual(request.section, 'apache_pb.gif')
+
+    def test_timezone(self):
+        """
+        Tests that the timezone offset of the log is taken into account :
+        the date is converted to the local time.
+        """
+        date = ApacheLogParser.parse_date('10/Oct/2000:13:55:36 -0700')
+        expected = datetime(2000, 10, 10, 20, 55, 36, tzinfo=timezone.utc)
+
+        self.assertEqual(date, expected.astimezone().replace(tzinfo=None))
+
+    def test_invalid_line(self):
+        with self.assertRaises(ValueError):
+            ApacheLogParser().parseline('this is not a log line')
+
+    def test_invalid_lines_skipped(self):
+        """
+        Tests that the lines which can't be parsed (like a 408 without
+        request line) are skipped and counted by parse_batch.
+        """
+        lines = [ApacheLogParserTest.LINE,
+                 '127.0.0.1 - - [10/Oct/2000:13:55:36 -0700] "-" 408 -',
+                 '', 'this is not a log line', ApacheLogParserTest.LINE]
+        batch = ApacheLogParser().parse_batch(lines)
+
+        self.assertEqual(batch.count, 2)
+        self.assertEqual(batch.invalid_count, 2)
+
+
+class ParallelParserTest(unittest.TestCase):
+
+    def test_order(self):
+        """
+        Tests that the requests parsed by the workers come back in the order
+        of the lines.
+        """
+        lines = ['10.0.0.{0} - - [10/Oct/2000:13:55:36 -0700] \
+"GET /section{0}/ HTTP/1.1" 200 {0}'.format(i) for i in range(100)]
+
+        parallel_parser = ParallelParser(ApacheLogParser(), workers=3,
+                                         shard_size=7)
+        try:
+            batch = parallel_parser.parse_batch(lines)
+        finally:
+            parallel_parser.close()
+
+        self.assertEqual([r.bytes_sent for r in batch.requests],
+                         list(range(100)))
+        self.assertEqual(list(batch.bytes_sent), list(range(100)))
+
+    def test_invalid_lines_skipped(self):
+        lines = ['10.0.0.1 - - [10/Oct/2000:13:55:36 -0700] \
+"GET /a/ HTTP/1.1" 200 {0}'.format(i) if i % 10 else 'garbage'
+                 for i in range(100)]
+
+        parallel_parser = ParallelParser(ApacheLogParser(), workers=2,
+                                         shard_size=7)
+        try:
+            batch = parallel_parser.parse_batch(lines)
+        finally:
+            parallel_parser.close()
+
+        self.assertEqual(batch.count, 90)
+        self.assertEqual(batch.invalid_count, 10)
@@ -0,0 +1,178 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from log_reader import LogReader, MultiLogReader, LineSplitter
+
+
+class BatchCollector:
+    def __init__(self):
+        self.lines = list()
+        self.sources = list()
+
+    def add_requests(self, lines, source=None):
+        self.lines.extend(lines)
+        self.sources.extend([source] * len(lines))
+
+
+class LineSplitterTest(unittest.TestCase):
+
+    def test_partial_lines(self):
+        """
+        Tests that a line split over several chunks is only returned once
+        it is complete.
+        """
+        splitter = LineSplitter()
+
+        self.assertEqual(splitter.feed(b'first\nsec'), ['first'])
+        self.assertEqual(splitter.pending_data, 3)
+        self.assertEqual(splitter.feed(b'ond'), [])
+        self.assertEqual(splitter.feed(b'\nthird\nfourth\n'),
+                         ['second', 'third', 'fourth'])
+        self.assertEqual(splitter.pending_data, 0)
+
+
+class LogReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self._filename = tempfile.mkstemp()
+        os.write(fd, b'old line, never read\n')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self._filename)
+
+    def _append(self, data):
+        with open(self._filename, 'ab') as log_file:
+            log_file.write(data)
+
+    def test_batched_read(self):
+        """
+        Tests that the reader starts at EOF and hands over complete lines
+        in batches.
+        """
+        collector = BatchCollector()
+        reader = LogReader(self._filename, collector, timeout=0.1,
+                           use_inotify=False, batched=True, chunk_size=16)
+        reader.open()
+        try:
+            self._append(b'line 1\nline 2\nline')
+            lines = reader.read_lines()
+            while lines:
+                reader.dispatch(lines)
+                lines = reader.read_lines()
+            self.assertEqual(collector.lines, ['line 1', 'line 2'])
+
+            self._append(b' 3\n')
+            reader.dispatch(reader.read_lines())
+            self.assertEqual(collector.lines, ['line 1', 'line 2', 'line 3'])
+        finally:
+            reader.close()
+
+    def test_checkpoint_resume(self):
+        """
+        Tests that a reader restarted with the same checkpoint file reads
+        the lines written while it was stopped.
+        """
+        checkpoint_file = self._filename + '.state'
+        collector = BatchCollector()
+        try:
+            reader = LogReader(self._filename, collector, use_inotify=False,
+                               batched=True, checkpoint_file=checkpoint_file)
+            reader.open()
+            self._append(b'line 1\n')
+            self._read_all(reader, collector)
+            reader.close()
+
+            self._append(b'line 2\nline 3\n')
+
+            reader.open()
+            self._read_all(reader, collector)
+            reader.close()
+
+            self.assertEqual(collector.lines, ['line 1', 'line 2', 'line 3'])
+        finally:
+            os.remove(checkpoint_file)
+
+    def _read_all(self, reader, collector):
+        lines = reader.read_lines()
+        while lines:
+            reader.dispatch(lines)
+            reader.checkpoint_if_due()
+            lines = reader.read_lines()
+
+    def test_rotation(self):
+        """
+        Tests that the end of a rotated file is read before switching to the
+        new file, and that a truncated file is read again from its start.
+        """
+        collector = BatchCollector()
+        reader = LogReader(self._filename, collector, timeout=0.1,
+                           use_inotify=False, batched=True)
+        reader.open()
+        try:
+            self._append(b'before rotation\n')
+            self._read_all(reader, collector)
+
+            self._append(b'last line of the old file\n')
+            os.rename(self._filename, self._filename + '.1')
+            self._append(b'first line of the new file\n')
+            self._read_all(reader, collector)
+
+            self.assertEqual(collector.lines,
+                             ['before rotation',
+                              'last line of the old file',
+                              'first line of the new file'])
+
+            # copytruncate
+            with open(self._filename, 'wb') as log_file:
+                log_file.write(b'after\n')
+            collector.lines = list()
+            self._read_all(reader, collector)
+            self.assertEqual(collector.lines, ['after'])
+        finally:
+            reader.close()
+            os.remove(self._filename + '.1')
+
+
+class MultiLogReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _append(self, name, data):
+        with open(os.path.join(self._directory, name), 'ab') as log_file:
+            log_file.write(data)
+
+    def test_glob(self):
+        """
+        Tests that the files matching a pattern (including the ones created
+        later) are read and that the lines are tagged with their file.
+        """
+        self._append('a.log', b'old\n')
+        collector = BatchCollector()
+        reader = MultiLogReader([os.path.join(self._directory, '*.log')],
+                                collector, timeout=0.1)
+        reader.open()
+        try:
+            self._append('a.log', b'a 1\n')
+            self._append('b.log', b'b 1\n')
+            reader.read_files()
+            self.assertEqual(collector.lines, ['a 1'])
+
+            reader._rescan()
+            self._append('b.log', b'b 2\n')
+            reader.read_files()
+            self.assertEqual(collector.lines, ['a 1', 'b 1', 'b 2'])
+            self.assertEqual(collector.sources,
+                             [os.path.join(self._directory, 'a.log')] +
+                             [os.path.join(self._directory, 'b.log')] * 2)
+        finally:
+            reader.close()
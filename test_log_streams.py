@@ -0,0 +1,71 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+
+import log_streams
+from log_reader import iter_line_batches
+from log_streams import open_log_stream, detect_compression
+
+
+class LogStreamsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._lines = ['line {0}'.format(i) for i in range(50000)]
+        self._content = ('\n'.join(self._lines) + '\n').encode()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _check(self, filename, compression):
+        self.assertEqual(detect_compression(filename), compression)
+
+        lines = list()
+        with open_log_stream(filename, buffer_size=4096) as stream:
+            for batch in iter_line_batches(stream, chunk_size=10000):
+                lines.extend(batch)
+
+        self.assertEqual(lines, self._lines)
+
+    def test_formats(self):
+        for compression, module in (('gzip', gzip), ('bz2', bz2),
+                                    ('xz', lzma)):
+            # The extension doesn't matter
+            filename = os.path.join(self._directory, 'access_log.1')
+            with module.open(filename, 'wb') as log_file:
+                log_file.write(self._content)
+            self._check(filename, compression)
+
+        filename = os.path.join(self._directory, 'access_log')
+        with open(filename, 'wb') as log_file:
+            log_file.write(self._content)
+        self._check(filename, None)
+
+    def test_concatenated_members(self):
+        filename = os.path.join(self._directory, 'access_log.gz')
+        middle = len(self._content) // 2
+        with open(filename, 'wb') as log_file:
+            log_file.write(gzip.compress(self._content[:middle]))
+            log_file.write(gzip.compress(self._content[middle:]))
+        self._check(filename, 'gzip')
+
+    @unittest.skipIf(log_streams.zstandard is None,
+                     'zstandard is not installed')
+    def test_zstd(self):
+        """
+        Tests a zstd file made of two frames (compressed in two passes).
+        """
+        compressor = log_streams.zstandard.ZstdCompressor()
+        filename = os.path.join(self._directory, 'access_log.1.zst')
+        middle = len(self._content) // 2
+        with open(filename, 'wb') as log_file:
+            log_file.write(compressor.compress(self._content[:middle]))
+            log_file.write(compressor.compress(self._content[middle:]))
+        self._check(filename, 'zstd')
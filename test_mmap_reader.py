@@ -0,0 +1,56 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from mmap_reader import MmapLogReader
+from log_parser import ApacheLogParser
+from log_formats import make_parser
+
+
+class MmapLogReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self._filename = tempfile.mkstemp()
+        self._lines = ['10.0.0.{0} - - [10/Oct/2000:13:55:{1:02d} +0000] \
+"GET /section{0}/index.html HTTP/1.1" 200 {2} "-" "agent {0}"'
+                       .format(i % 7, i % 60, i) for i in range(1000)]
+        # The last line has no newline
+        os.write(fd, '\n'.join(self._lines).encode())
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self._filename)
+
+    def test_ranges(self):
+        """
+        Tests that the ranges are aligned on lines and that reading them
+        one after the other gives the whole file.
+        """
+        with MmapLogReader(self._filename) as reader:
+            ranges = reader.split_ranges(range_size=1000)
+            self.assertGreater(len(ranges), 50)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], reader.size)
+
+            lines = list()
+            for start, end in ranges:
+                for batch in reader.iter_line_batches(start, end,
+                                                      batch_size=7):
+                    lines.extend(bytes(line).decode() for line in batch)
+            self.assertEqual(lines, self._lines)
+
+    def test_parse_buffer(self):
+        """
+        Tests that parsing a memoryview gives the same result as parsing
+        the decoded line.
+        """
+        for parser in (ApacheLogParser(), make_parser('combined')):
+            with MmapLogReader(self._filename) as reader:
+                for batch in reader.iter_line_batches():
+                    for line, buf in zip(self._lines, batch):
+                        self.assertEqual(parser.parse_buffer(buf),
+                                         parser.parse_record(line))
+                batch = buf = None
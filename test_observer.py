@@ -0,0 +1,43 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from observer import Observable, NotificationDispatcher
+
+
+class CallCounter:
+    def __init__(self):
+        self.calls = 0
+
+    def on_change(self):
+        self.calls += 1
+
+
+class NotificationDispatcherTest(unittest.TestCase):
+
+    def test_coalescing(self):
+        """
+        Tests that many updates lead to a single call per flush, while the
+        observers registered without dispatcher are still called at once.
+        """
+        observable = Observable()
+        dispatcher = NotificationDispatcher()
+        coalesced = CallCounter()
+        direct = CallCounter()
+        observable.add_observer(coalesced, 'change', dispatcher)
+        observable.add_observer(direct, 'change')
+
+        for i in range(1000):
+            observable.update()
+        self.assertEqual(direct.calls, 1000)
+        self.assertEqual(coalesced.calls, 0)
+
+        dispatcher.flush()
+        self.assertEqual(coalesced.calls, 1)
+        dispatcher.flush()
+        self.assertEqual(coalesced.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@
 import unittest
 import time
 from datetime import datetime
+from unittest import mock
 
 from overload_monitor import OverloadMonitor
 from request_monitor import Request
@@ -80,3 +81,160 @@ class OverloadMonitorTest(unittest.TestCase):
 
     def on_alert(self):
         self._callback_triggered = True
+
+    def test_event_time(self):
+        """
+        Tests that in event-time mode, the window is moved by the timestamps
+        of the requests, whatever the system time is.
+        """
+        self._callback_triggered = False
+        overload_monitor = OverloadMonitor(alert_threshold=10, timeframe=60,
+                                           event_time=True,
+                                           allowed_lateness=5)
+        overload_monitor.add_observer(self, 'alert')
+
+        # Ten requests in a minute, ten years ago
+        start = int(time.time()) - 10 * 365 * 86400
+        for i in range(10):
+            overload_monitor.add_request(Request('/test/index.html',
+                                                 start + i * 6, 'GET',
+                                                 '127.0.0.1', 200, 'HTTP/1.1',
+                                                 '-', '-', 12))
+
+        # The last requests are still after the watermark
+        self.assertFalse(overload_monitor.overloaded)
+
+        overload_monitor.add_request(Request('/test/index.html', start + 59,
+                                             'GET', '127.0.0.1', 200,
+                                             'HTTP/1.1', '-', '-', 12))
+        self.assertTrue(self._callback_triggered)
+        self.assertTrue(overload_monitor.overloaded)
+
+        # A request late by more than the timeframe is ignored
+        overload_monitor.add_request(Request('/test/index.html', start - 60,
+                                             'GET', '127.0.0.1', 200,
+                                             'HTTP/1.1', '-', '-', 12))
+        self.assertEqual(overload_monitor.request_count, 10)
+
+        # The window moves with the next requests and the alert ends
+        self._callback_triggered = False
+        overload_monitor.add_request(Request('/test/index.html', start + 200,
+                                             'GET', '127.0.0.1', 200,
+                                             'HTTP/1.1', '-', '-', 12))
+        self.assertTrue(self._callback_triggered)
+        self.assertFalse(overload_monitor.overloaded)
+
+
+class FixedClock:
+    """
+    A wall clock whose time is set by the test.
+    """
+
+    event_time = False
+
+    def __init__(self, now):
+        self.time = now
+
+    def observe(self, timestamp):
+        pass
+
+    def now(self):
+        return self.time
+
+
+class OverloadRingTest(unittest.TestCase):
+    """
+    Tests of the ring of buckets, with explicit timestamps : timeframe of 10
+    seconds and 5 seconds of allowed lateness, so a ring of 16 buckets.
+    """
+
+    START = 1000000
+
+    def setUp(self):
+        self._monitor = OverloadMonitor(alert_threshold=1000, timeframe=10,
+                                        event_time=True, allowed_lateness=5)
+
+    def _add(self, timestamp, count=1, monitor=None):
+        monitor = monitor or self._monitor
+        for i in range(count):
+            monitor.add_request(Request('/a', timestamp, 'GET', '127.0.0.1',
+                                        200, 'HTTP/1.1', '-', '-', 12))
+
+    def test_out_of_order(self):
+        start = OverloadRingTest.START
+        self._add(start + 10)
+        # After the watermark (start + 5) : kept, but not counted yet
+        self._add(start + 8)
+        self._add(start + 7)
+        self._add(start + 9)
+        self.assertEqual(self._monitor.request_count, 0)
+        # Before the watermark, in the timeframe : counted at once
+        self._add(start + 3)
+        self.assertEqual(self._monitor.request_count, 1)
+        # Older than the timeframe : ignored
+        self._add(start - 5)
+        self.assertEqual(self._monitor.request_count, 1)
+
+        # The watermark moves to start + 10
+        self._add(start + 15)
+        self.assertEqual(self._monitor.watermark, start + 10)
+        self.assertEqual(self._monitor.request_count, 5)
+
+    def test_jump(self):
+        """
+        Tests a jump longer than the ring, to a second using the same
+        bucket as a second already counted.
+        """
+        start = OverloadRingTest.START
+        for second in range(start, start + 12):
+            self._add(second, 2)
+        self.assertEqual(self._monitor.request_count, 14)
+
+        later = start + 10 + 16 * 100
+        self._add(later)
+        self.assertEqual(self._monitor.watermark, later - 5)
+        self.assertEqual(self._monitor.request_count, 0)
+
+        self._add(later - 7, 3)
+        self.assertEqual(self._monitor.request_count, 3)
+        self._add(later + 5)
+        self.assertEqual(self._monitor.request_count, 4)
+
+    def test_bucket_reuse(self):
+        """
+        Tests that the count stays exact while the seconds go round the ring
+        many times, late requests included.
+        """
+        start = OverloadRingTest.START
+        for second in range(start, start + 100):
+            self._add(second, 2)
+            # One request late by 3 seconds
+            self._add(second - 3)
+
+        # ]watermark - 10, watermark] with watermark = start + 94
+        self.assertEqual(self._monitor.watermark, start + 94)
+        self.assertEqual(self._monitor.request_count, 30)
+
+    def test_future(self):
+        """
+        Tests that with the system clock, a request from the future is
+        counted in the current second (and expires with it).
+        """
+        clock = FixedClock(OverloadRingTest.START)
+        with mock.patch('overload_monitor.make_clock', return_value=clock):
+            monitor = OverloadMonitor(alert_threshold=1000, timeframe=10)
+
+        self._add(OverloadRingTest.START + 3600, 2, monitor)
+        self.assertEqual(monitor.request_count, 2)
+
+        clock.time += 9
+        monitor.tick()
+        self.assertEqual(monitor.request_count, 2)
+        clock.time += 1
+        monitor.tick()
+        self.assertEqual(monitor.request_count, 0)
+
+        # The bucket isn't counted when its second (the future one) comes
+        clock.time = OverloadRingTest.START + 3600
+        monitor.tick()
+        self.assertEqual(monitor.request_count, 0)
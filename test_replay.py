@@ -0,0 +1,103 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+from main_monitor import MainMonitor
+from replay import order_log_files, group_log_files
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_order(self):
+        self.assertEqual(order_log_files(['access_log', 'access_log.1',
+                                          'access_log.10.gz',
+                                          'access_log.2.gz']),
+                         ['access_log.10.gz', 'access_log.2.gz',
+                          'access_log.1', 'access_log'])
+
+    def test_groups(self):
+        self.assertEqual(group_log_files(['b.log', 'a.log.1.gz', 'a.log',
+                                          'b.log.1']),
+                         [['a.log.1.gz', 'a.log'], ['b.log.1', 'b.log']])
+
+    def test_replay(self):
+        """
+        Tests that a replay over a plain and a compressed file drives the
+        alerts with the dates of the log : 20 requests per second during 10
+        seconds, then 1 request per second. The alert starts at the 5th
+        second (100 requests) and ends when the burst has left the 60 s
+        timeframe, at the 68th second (98 requests). The lines which can't
+        be parsed are only counted.
+        """
+        line = '10.0.0.1 - - [{0}/Oct/2000:13:{1:02d}:{2:02d} +0000] \
+"GET /{3}/index.html HTTP/1.1" 200 100\n'
+
+        old_file = os.path.join(self._directory, 'access_log.1.gz')
+        with gzip.open(old_file, 'wt') as log_file:
+            for second in range(10):
+                for i in range(20):
+                    log_file.write(line.format(10, 0, second, 'burst'))
+            log_file.write('10.0.0.1 - - [10/Oct/2000:13:00:09 +0000] "-" '
+                           '408 -\n')
+
+        new_file = os.path.join(self._directory, 'access_log')
+        with open(new_file, 'w') as log_file:
+            for second in range(10, 300):
+                log_file.write(line.format(10, second // 60, second % 60,
+                                           'calm'))
+            log_file.write('truncated line\n')
+
+        main_monitor = MainMonitor(None, alert_threshold=100,
+                                   overload_timeframe=60, event_time=True,
+                                   allowed_lateness=0, gui=False)
+        report = main_monitor.replay([new_file, old_file])
+
+        self.assertEqual(report.request_count, 490)
+        self.assertEqual(report.invalid_count, 2)
+        self.assertEqual(report.ranking, [('calm', 290), ('burst', 200)])
+        self.assertEqual([(overloaded, timestamp - report.alerts[0][0])
+                          for timestamp, overloaded, count in report.alerts],
+                         [(True, 0), (False, 63)])
+
+    def test_several_logs(self):
+        """
+        Tests that the logs of two vhosts covering the same period are
+        merged : each one has 1 request per second, which isn't enough for
+        an alert (60 requests in the timeframe), but both together are : the
+        alert starts at the 50th second (100 requests), not when the second
+        log catches up with the first one.
+        """
+        line = '10.0.0.1 - - [10/Oct/2000:13:{0:02d}:{1:02d} +0000] \
+"GET /{2}/index.html HTTP/1.1" 200 100\n'
+
+        filenames = list()
+        for vhost in ('a', 'b'):
+            filename = os.path.join(self._directory, vhost + '.log')
+            with open(filename, 'w') as log_file:
+                for second in range(300):
+                    log_file.write(line.format(second // 60, second % 60,
+                                               vhost))
+            filenames.append(filename)
+
+        main_monitor = MainMonitor(None, alert_threshold=100,
+                                   overload_timeframe=60, event_time=True,
+                                   allowed_lateness=0, gui=False)
+        report = main_monitor.replay(filenames)
+
+        self.assertEqual(report.request_count, 600)
+        self.assertEqual(report.ranking, [('a', 300), ('b', 300)])
+        start = int(datetime(2000, 10, 10, 13, tzinfo=timezone.utc)
+                    .timestamp())
+        self.assertEqual(report.alerts, [(start + 49, True, 100)])
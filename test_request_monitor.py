@@ -0,0 +1,150 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime
+
+import request_batch
+from log_formats import make_parser
+from request_monitor import Request, RequestMonitor
+from request_batch import RequestBatch
+from stats_monitor import StatsMonitor
+
+
+class RequestTest(unittest.TestCase):
+
+    def _request(self, url='/blog/article/12?page=2', status=200):
+        return Request(url, datetime(2000, 10, 10, 13, 55, 36), 'GET',
+                       '127.0.0.1', status, 'HTTP/1.1', '-', '-', 12)
+
+    def test_section(self):
+        self.assertEqual(self._request().section, 'blog')
+        self.assertEqual(self._request('/').section, '')
+        self.assertEqual(self._request('/index.html?a=/b/c').section,
+                         'index.html')
+        self.assertEqual(self._request('http://host/shop/cart').section,
+                         'shop')
+
+    def test_is_successful(self):
+        """
+        The 3xx are successful, the 4xx and 5xx are not.
+        """
+        self.assertFalse(self._request(status=404).is_successful)
+        self.assertFalse(self._request(status=500).is_successful)
+        self.assertTrue(self._request(status=304).is_successful)
+
+    def test_compact(self):
+        request = self._request()
+
+        self.assertFalse(hasattr(request, '__dict__'))
+        self.assertEqual(request.date, datetime(2000, 10, 10, 13, 55, 36))
+        self.assertIsInstance(request.timestamp, int)
+
+
+class RequestMonitorTest(unittest.TestCase):
+
+    def _requests(self, count, start=1000):
+        return [Request('/section{0}/page'.format(i % 3), start + i, 'GET',
+                        '127.0.0.1', 404 if i % 2 else 200, 'HTTP/1.1', '-',
+                        '-', 12)
+                for i in range(count)]
+
+    def test_no_retention(self):
+        request_monitor = RequestMonitor()
+        request_monitor.add_requests(self._requests(10))
+
+        self.assertEqual(request_monitor.retained_count, 0)
+        self.assertEqual(request_monitor.get_requests(), [])
+
+    def test_ring_buffer(self):
+        request_monitor = RequestMonitor(retention_count=5)
+        requests = self._requests(10)
+        request_monitor.add_requests(requests[:7])
+        for request in requests[7:]:
+            request_monitor.add_request(request)
+
+        self.assertEqual(request_monitor.get_requests(), requests[5:])
+
+    def test_time_window(self):
+        request_monitor = RequestMonitor(retention_window=4)
+        requests = self._requests(10)
+        request_monitor.add_requests(requests)
+
+        # The last request is at 1009, we keep ]1005, 1009]
+        self.assertEqual(request_monitor.get_requests(), requests[6:])
+        self.assertEqual(request_monitor.get_requests(status=4),
+                         [requests[7], requests[9]])
+        self.assertEqual(request_monitor.get_requests(section='section0'),
+                         [requests[6], requests[9]])
+        self.assertEqual(request_monitor.get_requests(since=1007, limit=1),
+                         [requests[9]])
+
+    def test_time_window_out_of_order(self):
+        """
+        Tests that the window ends at the most recent request of a batch,
+        not at its last one (1008, logged after 1009).
+        """
+        requests = self._requests(10)
+        requests = requests[:8] + [requests[9], requests[8]]
+        for make_batch in (list, RequestBatch):
+            request_monitor = RequestMonitor(retention_window=4)
+            request_monitor.add_requests(make_batch(requests))
+
+            self.assertEqual(request_monitor.get_requests(), requests[6:])
+
+
+class RequestBatchTest(unittest.TestCase):
+
+    def test_aggregates(self):
+        requests = [Request(url, 1000 + i // 2, 'GET', '10.0.0.1', status,
+                            'HTTP/1.1', '-', '-', 100)
+                    for i, (url, status) in enumerate([('/a/1', 200),
+                                                       ('/b/1', 404),
+                                                       ('/a/2', 301),
+                                                       ('/a/3', 500),
+                                                       ('/c', 200)])]
+        batch = RequestBatch(requests)
+
+        self.assertEqual(batch.count, 5)
+        self.assertEqual(batch.successful_count(), 3)
+        self.assertEqual(batch.total_bytes(), 500)
+        self.assertEqual(batch.section_counts(), {'a': 3, 'b': 1, 'c': 1})
+        self.assertEqual(batch.timestamp_counts(),
+                         [(1000, 2), (1001, 2), (1002, 1)])
+
+    @unittest.skipIf(request_batch.numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        """
+        Tests that the numpy and the pure Python paths give the same
+        aggregates on the same batch.
+        """
+        lines = ['10.0.0.{0} - - [10/Oct/2000:13:55:{1:02d} +0000] '
+                 '"GET /{2}/{3} HTTP/1.1" {4} {5} {6}'.format(
+                     i % 7, (i * 7) % 13, 'abc'[i % 3], i,
+                     (200, 304, 404, 500, 200)[i % 5], i * 10, i * 1000)
+                 for i in range(200)]
+        batch = make_parser('%h %l %u %t "%r" %>s %b %D').parse_batch(lines)
+
+        def aggregate():
+            stats_monitor = StatsMonitor(event_time=True, allowed_lateness=0)
+            stats_monitor.add_batch(batch)
+            return (batch.successful_count(), batch.failing_indexes(),
+                    batch.total_bytes(), batch.section_counts(),
+                    sorted(batch.timestamp_section_counts()),
+                    batch.timestamp_counts(),
+                    [(timestamp, [list(values) for values in columns])
+                     for timestamp, columns in batch.timestamp_groups(
+                         batch.statuses, batch.bytes_sent)],
+                    stats_monitor.get_window_stats(60))
+
+        with_numpy = aggregate()
+        numpy = request_batch.numpy
+        request_batch.numpy = None
+        try:
+            without_numpy = aggregate()
+        finally:
+            request_batch.numpy = numpy
+
+        self.assertEqual(with_numpy, without_numpy)
+        self.assertEqual(with_numpy[0], 120)
+        self.assertEqual(len(with_numpy[1]), 80)
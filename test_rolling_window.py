@@ -0,0 +1,35 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rolling_window import RollingCounter
+
+
+class RollingCounterTest(unittest.TestCase):
+
+    def test_expiry(self):
+        """
+        Tests that the buckets leave the window one after the other and
+        that the hits too old for the window are ignored.
+        """
+        window = RollingCounter(10, 5)
+        window.add(100, 'a', 2)
+        window.add(104, 'b')
+        window.add(106, 'a')
+        window.expire(112)
+        self.assertEqual(window.most_common(), [('a', 3), ('b', 1)])
+
+        # The bucket [100, 105[ is out of ]105, 115]
+        window.expire(115)
+        self.assertEqual(window.most_common(), [('a', 1)])
+        self.assertEqual(window['b'], 0)
+        self.assertFalse(window.add(103, 'b'))
+
+        window.expire(200)
+        self.assertEqual(len(window), 0)
+        self.assertEqual(window.get_buckets(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
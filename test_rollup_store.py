@@ -0,0 +1,101 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from overload_monitor import OverloadMonitor
+from request_batch import RequestBatch
+from request_monitor import Request
+from rollup_store import RollupStore, OTHER_SECTION
+
+
+class RollupStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path = os.path.join(self._directory, 'history.db')
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _request(self, url, timestamp, status=200):
+        return Request(url, timestamp, 'GET', '127.0.0.1', status,
+                       'HTTP/1.1', '-', '-', 100)
+
+    def test_rollups(self):
+        """
+        Tests the per second and per minute rollups, their persistence
+        from one store to the next one and the pruning.
+        """
+        store = RollupStore(self._path, resolutions=((1, 120),
+                                                     (60, 3600)))
+        requests = [self._request('/a/1', 1000), self._request('/b', 1000),
+                    self._request('/a/2', 1001, 404),
+                    self._request('/a', 1010, 500)]
+        store.add_batch(RequestBatch(requests[:3]))
+        store.add_request(requests[3])
+        store.close()
+
+        store = RollupStore(self._path, resolutions=((1, 120),
+                                                     (60, 3600)))
+        self.assertEqual([(t['timestamp'], t['requests'])
+                          for t in store.get_traffic(1000, 1011, 1)],
+                         [(1000, 2), (1001, 1), (1010, 1)])
+        self.assertEqual(store.get_traffic(resolution=60),
+                         [{'timestamp': 960, 'requests': 4,
+                           'bytes_sent': 400,
+                           'status_classes': {1: 0, 2: 2, 3: 0, 4: 1,
+                                              5: 1}}])
+        self.assertEqual(store.get_section_hits(1000, n=1), [('a', 3)])
+
+        # The per second rows of 1000 and 1001 are older than 2 minutes
+        store.add_request(self._request('/b', 1121))
+        store.flush()
+        store.prune()
+        self.assertEqual([t['timestamp'] for t in
+                          store.get_traffic(resolution=1)], [1010, 1121])
+        self.assertEqual(store.get_resolution(1000), 60)
+        self.assertEqual(store.get_resolution(1010), 1)
+        store.close()
+
+    def test_max_sections(self):
+        """
+        Tests that only the most visited sections of a flush get their own
+        rows, the other ones are added up.
+        """
+        store = RollupStore(self._path, max_sections=2)
+        requests = [self._request('/a', 1000), self._request('/a', 1001),
+                    self._request('/b', 1000), self._request('/b', 1001)]
+        requests += [self._request('/crawl{0}/'.format(i), 1000 + i % 2)
+                     for i in range(50)]
+        store.add_batch(RequestBatch(requests))
+        store.flush()
+
+        self.assertEqual(store.get_section_hits(n=5),
+                         [(OTHER_SECTION, 50), ('a', 2), ('b', 2)])
+        self.assertEqual(store.get_section_hits(1000, 1001, n=5,
+                                                resolution=1),
+                         [(OTHER_SECTION, 25), ('a', 1), ('b', 1)])
+        self.assertEqual(sum(t['requests'] for t in store.get_traffic()),
+                         54)
+        store.close()
+
+    def test_alerts(self):
+        overload_monitor = OverloadMonitor(2, event_time=True,
+                                           allowed_lateness=0)
+        store = RollupStore(self._path, overload_monitor=overload_monitor)
+        for timestamp in (1000, 1001, 1200):
+            overload_monitor.add_request(self._request('/', timestamp))
+        store.flush()
+
+        self.assertEqual(store.get_alerts(), [(1001, True, 2),
+                                              (1200, False, 1)])
+        self.assertEqual(store.get_alerts(since=1100), [(1200, False, 1)])
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
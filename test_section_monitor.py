@@ -0,0 +1,91 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from main_monitor import MainMonitor
+from request_monitor import Request
+from section_monitor import SectionMonitor
+
+
+class UpdateCounter:
+    def __init__(self):
+        self.calls = 0
+
+    def on_section_change(self):
+        self.calls += 1
+
+
+class SectionMonitorTest(unittest.TestCase):
+
+    def _request(self, url, timestamp=1500000000, client='127.0.0.1'):
+        return Request(url, timestamp, 'GET', client, 200, 'HTTP/1.1',
+                       '-', '-', 100)
+
+    def test_ranking(self):
+        """
+        Tests the ranking and that the observers are notified of the hits
+        on existing sections too.
+        """
+        for max_sections in (None, 10):
+            section_monitor = SectionMonitor(10, max_sections)
+            counter = UpdateCounter()
+            section_monitor.add_observer(counter, 'section_change')
+
+            for url in ['/a/1', '/b/1', '/b/2', '/c', '/b/3', '/a/2']:
+                section_monitor.add_request(self._request(url))
+
+            self.assertEqual(counter.calls, 6)
+            self.assertEqual(section_monitor.get_current_top_n(2),
+                             [('b', 3), ('a', 2)])
+
+            section_monitor.tick()
+            self.assertEqual(section_monitor.get_current_top_n(2), [])
+            self.assertEqual(section_monitor.get_last_top_n(5),
+                             [('b', 3), ('a', 2), ('c', 1)])
+
+    def test_windows(self):
+        """
+        Tests the rolling rankings in event-time mode : they are not
+        cleared by the drop, the old hits leave the short windows only.
+        """
+        section_monitor = SectionMonitor(10, windows=((10, 1), (60, 5)),
+                                         event_time=True, allowed_lateness=0)
+        for timestamp, url, client in [(1000, '/a', 'x'), (1001, '/a', 'y'),
+                                       (1030, '/b', 'x'), (1040, '/c', 'x'),
+                                       (1041, '/b', 'z')]:
+            section_monitor.add_request(self._request(url, timestamp,
+                                                      client))
+        section_monitor.tick()
+
+        self.assertEqual(section_monitor.window_durations, [10, 60])
+        self.assertEqual(section_monitor.get_window_top_n(10, 5),
+                         [('c', 1), ('b', 1)])
+        self.assertEqual(section_monitor.get_window_top_n(60, 2, True),
+                         [('a', 2, 2), ('b', 2, 2)])
+        self.assertEqual(section_monitor.get_window_visitors(10), 2)
+        self.assertEqual(section_monitor.get_window_visitors(60), 3)
+
+    def test_unknown_clients(self):
+        """
+        Tests that a format without the client address doesn't break the
+        unique visitors : the requests are counted, not the visitors.
+        """
+        main_monitor = MainMonitor(None, gui=False, event_time=True,
+                                   allowed_lateness=0,
+                                   log_format='%t "%r" %>s %b')
+        main_monitor.add_requests(['[10/Oct/2000:13:55:{0:02d} +0000] '
+                                   '"GET /a/{0} HTTP/1.1" 200 10'.format(i)
+                                   for i in range(10)])
+        section_monitor = main_monitor.section_monitor
+
+        self.assertEqual(section_monitor.get_window_top_n(60, 1, True),
+                         [('a', 10, 0)])
+        self.assertEqual(section_monitor.get_window_visitors(60), 0)
+
+        section_monitor.add_request(self._request('/a', client=None))
+        self.assertEqual(section_monitor.get_current_top_n(1), [('a', 11)])
+
+
+if __name__ == '__main__':
+    unittest.main()
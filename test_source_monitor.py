@@ -0,0 +1,44 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from request_monitor import Request
+from source_monitor import SourceMonitor
+from stats_monitor import StatsMonitor
+from section_monitor import SectionMonitor
+
+
+class SourceMonitorTest(unittest.TestCase):
+
+    def _request(self, url, status, source):
+        return Request(url, 1500000000, 'GET', '127.0.0.1', status,
+                       'HTTP/1.1', '-', '-', 100, source=source)
+
+    def test_per_source(self):
+        """
+        Tests that the requests are dispatched to the monitors of their
+        source, even when a batch mixes several sources.
+        """
+        source_monitor = SourceMonitor(
+            lambda: {'stats': StatsMonitor(),
+                     'section': SectionMonitor(0)})
+
+        source_monitor.add_requests([self._request('/a/1', 200, 'a.log'),
+                                     self._request('/b/1', 404, 'b.log'),
+                                     self._request('/a/2', 200, 'a.log')])
+        source_monitor.add_request(self._request('/b/2', 200, 'b.log'))
+
+        self.assertEqual(source_monitor.sources, ['a.log', 'b.log'])
+        self.assertEqual(
+            source_monitor.get_monitor('a.log', 'stats').request_count, 2)
+        self.assertEqual(
+            source_monitor.get_monitor('b.log', 'stats').failed_req_count, 1)
+        self.assertEqual(
+            source_monitor.get_monitor('a.log', 'section')
+            .get_current_top_n(1), [('a', 2)])
+        self.assertIsNone(source_monitor.get_monitor('c.log', 'stats'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/user/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from request_monitor import Request
+from stats_monitor import StatsMonitor
+
+
+class StatsMonitorTest(unittest.TestCase):
+
+    def test_windows(self):
+        """
+        Tests the rates and percentiles of the sliding windows in
+        event-time mode.
+        """
+        stats_monitor = StatsMonitor(event_time=True, allowed_lateness=0,
+                                     windows=((10, 1), (60, 5)))
+        for second in range(60):
+            for i in range(2):
+                stats_monitor.add_request(
+                    Request('/a', 1000 + second, 'GET', '127.0.0.1', 200,
+                            'HTTP/1.1', '-', '-', 1000 * (i + 1),
+                            response_time=0.1 * (i + 1)))
+
+        stats = stats_monitor.get_window_stats(10)
+        self.assertEqual(stats['request_count'], 20)
+        self.assertEqual(stats['request_rate'], 2)
+        self.assertEqual(stats['bandwidth'], 3000)
+        self.assertAlmostEqual(stats['size_percentiles'][50], 1000, delta=10)
+        self.assertAlmostEqual(stats['response_time_percentiles'][99], 0.2,
+                               delta=0.01)
+
+        stats = stats_monitor.get_window_stats(60)
+        self.assertEqual(stats['request_count'], 120)
+        self.assertEqual(stats_monitor.bytes_sent, 180000)
+
+
+if __name__ == '__main__':
+    unittest.main()